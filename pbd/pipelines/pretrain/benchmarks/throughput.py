@@ -0,0 +1,283 @@
+"""
+Throughput benchmark of PretrainTrainer on synthetic data.
+
+    python -m pbd.pipelines.pretrain.benchmarks.throughput --baseline baseline.json
+
+Exits with status 1 when a case is slower than its baseline by more than `--tolerance`.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+import yaml
+from torch.utils.data import DataLoader
+
+from pbd.pipelines.pretrain.steps.callbacks.base import Callback
+from pbd.pipelines.pretrain.steps.callbacks.memory import MB, _children_rss_bytes
+from pbd.pipelines.pretrain.steps.prepare_data.data_collator import (
+    DataCollatorForLanguageModeling,
+)
+from pbd.pipelines.pretrain.steps.prepare_data.sampler import StatefulRandomSampler
+from pbd.pipelines.pretrain.steps.prepare_data.synthetic import SyntheticTokenDataset
+from pbd.pipelines.pretrain.steps.trainer.trainer import PretrainTrainer
+
+VOCAB_SIZE = 32000
+
+# Small enough to run a step in milliseconds on a laptop CPU
+MODEL_PARAMS = {
+    "model_name": "LlamaForCausalLM",
+    "config_name": "LlamaConfig",
+    "hidden_size": 128,
+    "num_attention_heads": 4,
+    "num_key_value_heads": 4,
+    "num_hidden_layers": 2,
+    "intermediate_size": 256,
+    "tie_word_embeddings": True,
+}
+
+
+def trainer_config(case: dict) -> dict:
+    """TrainerState fields of a benchmark case."""
+    return {
+        "model_params": {**MODEL_PARAMS, "max_position_embeddings": case["seq_len"]},
+        "optimizer": {"name": "adamw", "lr": 1e-3, "weight_decay": 0.1},
+        "scheduler": {"name": "constant", "warmup_steps": 0},
+        "accelerate_config": {"mixed_precision": "no"},
+        "max_steps": case["warmup_steps"] + case["steps"],
+        "batch_size": case["batch_size"],
+        "seq_len": case["seq_len"],
+        "packed_sequences": case["collation"] == "padding_free",
+        # One log window covering the whole run; no eval, checkpoints or W&B
+        "log_every": case["warmup_steps"] + case["steps"],
+        "eval_every": 0,
+        "seed": case["seed"],
+    }
+
+
+class SyntheticDataTrainer(PretrainTrainer):
+    """PretrainTrainer fed by `SyntheticTokenDataset` through the repo's collator."""
+
+    def __init__(self, config_path: str, case: dict, callbacks=None):
+        self.case = case
+        self.measured_tokens = 0
+        super().__init__(config_path, callbacks=callbacks)
+
+    def _load_train_dataloader(self) -> DataLoader:
+        case = self.case
+        dataset = SyntheticTokenDataset(
+            num_samples=(case["warmup_steps"] + case["steps"]) * case["batch_size"],
+            max_length=case["seq_len"],
+            min_length=max(1, case["seq_len"] // 4),
+            vocab_size=VOCAB_SIZE,
+            seed=case["seed"],
+        )
+        return DataLoader(
+            dataset,
+            batch_size=case["batch_size"],
+            sampler=StatefulRandomSampler(dataset, seed=case["seed"]),
+            collate_fn=DataCollatorForLanguageModeling(
+                pad_token_id=0,
+                padding_free=case["collation"] == "padding_free",
+                return_flash_attn_kwargs=case["collation"] == "padding_free",
+            ),
+            num_workers=case["num_workers"],
+            persistent_workers=case["num_workers"] > 0,
+        )
+
+    def _load_eval_dataloader(self):
+        return None
+
+    def forward(self, batch):
+        loss, tokens = super().forward(batch)
+        if self.global_step >= self.case["warmup_steps"]:
+            # Kept on device until the end of the run
+            self.measured_tokens = self.measured_tokens + tokens
+        return loss, tokens
+
+
+class WallClockCallback(Callback):
+    """Times the steps that follow the warmup and drops the warmup's phase timings."""
+
+    def __init__(self, warmup_steps: int):
+        self.warmup_steps = warmup_steps
+        self.start = None
+        self.end = None
+
+    def on_step_start(self, trainer):
+        if trainer.global_step == self.warmup_steps:
+            trainer.timer.collect()
+            trainer.metrics.reset_windows(*trainer.metrics.windows)
+            self.start = time.perf_counter()
+
+    def on_train_end(self, trainer):
+        self.end = time.perf_counter()
+
+
+class WorkerMemoryCallback(Callback):
+    """Peak summed RSS of the live DataLoader workers, sampled after every step."""
+
+    def __init__(self):
+        self.peak_bytes = 0
+
+    def on_step_end(self, trainer):
+        self.peak_bytes = max(self.peak_bytes, _children_rss_bytes())
+
+
+def run_case(case: dict) -> dict:
+    """Train one case in this process and return its measurements."""
+    clock = WallClockCallback(case["warmup_steps"])
+    workers = WorkerMemoryCallback()
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "benchmark.yaml"
+        config_path.write_text(yaml.safe_dump(trainer_config(case)))
+        trainer = SyntheticDataTrainer(
+            str(config_path), case, callbacks=[clock, workers]
+        )
+        trainer.fit()
+
+    elapsed = clock.end - clock.start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "case": case,
+        "tokens_per_sec": int(trainer.measured_tokens) / elapsed,
+        "steps_per_sec": case["steps"] / elapsed,
+        "phases": {
+            name: {"p50": p50, "p95": p95}
+            for name, (p50, p95) in trainer.timer.summary((50, 95)).items()
+        },
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "peak_rss_workers_mb": workers.peak_bytes / MB,
+    }
+
+
+def case_key(case: dict) -> str:
+    return (
+        f"bs{case['batch_size']}-seq{case['seq_len']}-{case['collation']}"
+        f"-w{case['num_workers']}"
+    )
+
+
+def run_isolated(case: dict, device: str) -> dict:
+    """Run `case` in a fresh interpreter so memory state does not leak."""
+    env = dict(os.environ)
+    if device == "cpu":
+        env["ACCELERATE_USE_CPU"] = "true"
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "result.json"
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                __spec__.name if __spec__ else __name__,
+                "--case",
+                json.dumps(case),
+                "--output",
+                str(output),
+            ],
+            check=True,
+            env=env,
+        )
+        return json.loads(output.read_text())
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    """Cases whose tokens/sec dropped by more than `tolerance` from `baseline`."""
+    reference = {case_key(r["case"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = case_key(result["case"])
+        if key not in reference:
+            continue
+        before = reference[key]["tokens_per_sec"]
+        after = result["tokens_per_sec"]
+        change = after / before - 1
+        print(f"{key}: {before:.0f} -> {after:.0f} tok/s ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append(key)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[128, 512])
+    parser.add_argument(
+        "--collation",
+        nargs="+",
+        choices=["padded", "padding_free"],
+        default=["padded", "padding_free"],
+    )
+    parser.add_argument("--num-workers", type=int, nargs="+", default=[0, 2])
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--warmup-steps", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", choices=["cpu", "auto"], default="cpu")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    # Internal: run a single JSON-encoded case in this process
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.case is not None:
+        args.output.write_text(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    cases = [
+        {
+            "batch_size": batch_size,
+            "seq_len": seq_len,
+            "collation": collation,
+            "num_workers": num_workers,
+            "steps": args.steps,
+            "warmup_steps": args.warmup_steps,
+            "seed": args.seed,
+        }
+        for batch_size, seq_len, collation, num_workers in itertools.product(
+            args.batch_sizes, args.seq_lens, args.collation, args.num_workers
+        )
+    ]
+    results = []
+    for i, case in enumerate(cases, 1):
+        print(f"[{i}/{len(cases)}] {case_key(case)}", flush=True)
+        results.append(run_isolated(case, args.device))
+
+    report = {"environment": environment(), "results": results}
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        if regressions:
+            print(f"Throughput regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
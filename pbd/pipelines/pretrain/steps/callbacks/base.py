@@ -1,4 +1,9 @@
 class Callback:
+    # Async-safe callbacks run on a background worker and receive an immutable
+    # `TrainerSnapshot` instead of the trainer; keep False for callbacks that
+    # mutate the trainer, call collectives or must finish before the next step.
+    async_safe = False
+
     def on_train_start(self, trainer):
         pass
 
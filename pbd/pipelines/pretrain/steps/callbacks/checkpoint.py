@@ -1,5 +1,6 @@
+import shutil
 from pathlib import Path
-from typing import Optional
+
 from pbd.pipelines.pretrain.steps.callbacks.base import Callback
 
 
@@ -10,7 +11,7 @@ class CheckpointCallback(Callback):
         self,
         save_dir: str,
         save_every: int = 1000,
-        keep_last_n: Optional[int] = 3,
+        keep_last_n: int | None = 3,
         save_on_best: bool = False,
         metric_name: str = "loss_ema",
         mode: str = "min",
@@ -31,27 +32,35 @@ class CheckpointCallback(Callback):
             self.save_dir.mkdir(parents=True, exist_ok=True)
             trainer.logger.info(f"Checkpoints will be saved to {self.save_dir}")
 
-    def on_step_start(self, trainer):
-        pass
+    def _prune_checkpoints(self, trainer, ckpt_path: Path):
+        """Track a written checkpoint and remove the oldest (on the writer thread)."""
+        self.checkpoints.append(ckpt_path)
+        while self.keep_last_n and len(self.checkpoints) > self.keep_last_n:
+            old_ckpt = self.checkpoints.pop(0)
+            if old_ckpt.is_dir():
+                shutil.rmtree(old_ckpt)
+                trainer.logger.info(f"Removed old checkpoint: {old_ckpt.name}")
+            elif old_ckpt.exists():
+                old_ckpt.unlink()
+                trainer.logger.info(f"Removed old checkpoint: {old_ckpt.name}")
 
     def on_step_end(self, trainer):
         # Regular checkpoint saving
         if trainer.global_step % self.save_every == 0 and trainer.global_step > 0:
-            ckpt_path = self.save_dir / f"checkpoint_step_{trainer.global_step}.pt"
-            trainer.save_checkpoint(ckpt_path)
-
-            # Track for cleanup
-            self.checkpoints.append(ckpt_path)
-
-            # Remove old checkpoints if needed
-            if self.keep_last_n and len(self.checkpoints) > self.keep_last_n:
-                old_ckpt = self.checkpoints.pop(0)
-                if old_ckpt.exists():
-                    old_ckpt.unlink()
-                    trainer.logger.info(f"Removed old checkpoint: {old_ckpt.name}")
+            ckpt_path = trainer.checkpoint_path(
+                self.save_dir, f"checkpoint_step_{trainer.global_step}"
+            )
+            trainer.save_checkpoint(
+                ckpt_path,
+                on_saved=lambda path: self._prune_checkpoints(trainer, path),
+            )
 
-        # Save on best metric
-        if self.save_on_best and trainer.acc.is_main_process:
+        # Save on best metric, checked at log boundaries where metrics are read back anyway
+        if (
+            self.save_on_best
+            and trainer.acc.is_main_process
+            and trainer.global_step % trainer.log_every == 0
+        ):
             current_metric = getattr(trainer, self.metric_name, None)
             if current_metric is not None:
                 is_best = (
@@ -59,8 +68,10 @@ class CheckpointCallback(Callback):
                 ) or (self.mode == "max" and current_metric > self.best_metric)
                 if is_best:
                     self.best_metric = current_metric
-                    ckpt_path = self.save_dir / "checkpoint_best.pt"
-                    trainer.save_checkpoint(ckpt_path)
+                    ckpt_path = trainer.checkpoint_path(
+                        self.save_dir, "checkpoint_best"
+                    )
+                    trainer.save_checkpoint(ckpt_path, collective=False)
                     trainer.logger.info(
                         f"New best {self.metric_name}: {current_metric:.4f}"
                     )
@@ -69,13 +80,13 @@ class CheckpointCallback(Callback):
         """Save emergency checkpoint on exception."""
         if self.save_on_exception and trainer.acc.is_main_process:
             trainer.logger.info("Saving emergency checkpoint due to exception...")
-            ckpt_path = (
-                self.save_dir / f"checkpoint_exception_step_{trainer.global_step}.pt"
+            ckpt_path = trainer.checkpoint_path(
+                self.save_dir, f"checkpoint_exception_step_{trainer.global_step}"
             )
-            trainer.save_checkpoint(ckpt_path)
+            trainer.save_checkpoint(ckpt_path, collective=False)
             trainer.logger.info(f"Emergency checkpoint saved to {ckpt_path}")
 
     def on_train_end(self, trainer):
         # Save final checkpoint
-        ckpt_path = self.save_dir / "checkpoint_final.pt"
+        ckpt_path = trainer.checkpoint_path(self.save_dir, "checkpoint_final")
         trainer.save_checkpoint(ckpt_path)
@@ -0,0 +1,142 @@
+import logging
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from pbd.pipelines.pretrain.steps.callbacks.base import Callback
+from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+from pbd.pipelines.pretrain.steps.trainer.state import TrainerSteps
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TrainerSnapshot:
+    """Immutable view of the trainer handed to async-safe callbacks."""
+
+    acc: Any
+    logger: Any
+    trainer_state: Any
+    global_step: int
+    max_steps: int
+    epoch: int
+    metrics: MetricRunner | None
+
+    @property
+    def optimizer_step(self) -> int:
+        """Number of optimizer updates completed."""
+        return self.global_step // self.acc.gradient_accumulation_steps
+
+    @classmethod
+    def from_trainer(cls, trainer, with_metrics: bool = True) -> "TrainerSnapshot":
+        return cls(
+            acc=trainer.acc,
+            logger=trainer.logger,
+            trainer_state=trainer.trainer_state,
+            global_step=trainer.global_step,
+            max_steps=trainer.max_steps,
+            epoch=trainer.epoch,
+            metrics=trainer.metrics.snapshot() if with_metrics else None,
+        )
+
+
+def _needs_metrics(trainer, name: str) -> bool:
+    """Whether event `name` hands async callbacks a copy of the metric store."""
+    if name == TrainerSteps.on_step_start:
+        return False
+    if name == TrainerSteps.on_step_end:
+        return trainer.global_step % trainer.log_every == 0
+    return True
+
+
+def _overrides(callback: Any, name: str) -> bool:
+    """Whether `callback` overrides hook `name` of the `Callback` base."""
+    hook = getattr(type(callback), name, None)
+    if hook is None:
+        return callable(getattr(callback, name, None))
+    return hook is not getattr(Callback, name, None)
+
+
+class CallbackDispatcher:
+    """Runs each callback's implemented hooks, async-safe ones on a worker thread."""
+
+    def __init__(self, callbacks: list, max_pending: int = 64):
+        self.callbacks = callbacks
+        self.max_pending = max_pending
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: deque[Future] = deque()
+        self._compile()
+
+    def _compile(self):
+        """Resolve the hooks of the current callbacks into the dispatch tables."""
+        self._registered = list(self.callbacks)
+        self.inline: dict[str, list[Callable]] = {}
+        self.deferred: dict[str, list[Callable]] = {}
+        for name in TrainerSteps:
+            name = name.value
+            for cb in self._registered:
+                if not _overrides(cb, name):
+                    continue
+                async_safe = getattr(cb, "async_safe", False)
+                table = self.deferred if async_safe else self.inline
+                table.setdefault(name, []).append(getattr(cb, name))
+
+        if self.deferred and self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="callbacks"
+            )
+
+    def _run(self, hooks: list[Callable], snapshot: TrainerSnapshot, args, kwargs):
+        for hook in hooks:
+            hook(snapshot, *args, **kwargs)
+
+    def _reap(self, block: bool = False):
+        """Drop finished events, re-raising the first error."""
+        while self._pending and (block or self._pending[0].done()):
+            self._pending.popleft().result()
+
+    def dispatch(self, trainer, name: str, *args, **kwargs):
+        """Run hook `name` of every callback implementing it."""
+        if self.callbacks != self._registered:
+            self._compile()
+        deferred = self.deferred.get(name)
+        if deferred:
+            self._reap()
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft().result()
+            self._pending.append(
+                self._executor.submit(
+                    self._run,
+                    deferred,
+                    TrainerSnapshot.from_trainer(
+                        trainer, with_metrics=_needs_metrics(trainer, name)
+                    ),
+                    args,
+                    kwargs,
+                )
+            )
+
+        for hook in self.inline.get(name, ()):
+            hook(trainer, *args, **kwargs)
+
+    def flush(self):
+        """Block until every queued async event has been handled."""
+        self._reap(block=True)
+
+    def close(self, raise_errors: bool = True):
+        """Handle every queued event and stop the worker.
+
+        With `raise_errors=False` async callback errors are logged, not raised.
+        """
+        try:
+            self.flush()
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Async callback failed during shutdown")
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
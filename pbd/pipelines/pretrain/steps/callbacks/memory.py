@@ -0,0 +1,174 @@
+import itertools
+import os
+import resource
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.base import Callback
+
+MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_bytes(pid: str = "self") -> int | None:
+    """Resident set size of `pid` from `/proc` (Linux), or None."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _children_rss_bytes() -> int:
+    """Summed RSS of the direct children (e.g. DataLoader workers) of this process."""
+    total = 0
+    for children in Path("/proc/self/task").glob("*/children"):
+        try:
+            pids = children.read_text().split()
+        except OSError:
+            continue
+        for pid in pids:
+            total += _rss_bytes(pid) or 0
+    return total
+
+
+class MemoryCallback(Callback):
+    """Tracks host and device memory every step and warns about steady growth."""
+
+    def __init__(
+        self,
+        every: int = 1,
+        include_workers: bool = True,
+        growth_window: int = 10,
+        growth_threshold_mb: float = 256,
+        tracemalloc_every: int | None = None,
+        top_n: int = 10,
+        tracemalloc_frames: int = 1,
+    ):
+        self.every = every
+        self.include_workers = include_workers
+        self.growth_window = growth_window
+        self.growth_threshold_mb = growth_threshold_mb
+        self.tracemalloc_every = tracemalloc_every
+        self.top_n = top_n
+        self.tracemalloc_frames = tracemalloc_frames
+
+        self.latest: dict[str, float] = {}
+        self.history: dict[str, deque] = {}
+        self.growing: set[str] = set()
+        self._device: torch.device | None = None
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._started_tracemalloc = False
+
+    def on_train_start(self, trainer):
+        self._device = trainer.acc.device if trainer.acc.device.type == "cuda" else None
+        if self.tracemalloc_every is not None and not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+            self._started_tracemalloc = True
+
+    def sample(self) -> dict[str, float]:
+        """Current memory usage, in MB (fragmentation as a ratio)."""
+        sample = {}
+        rss = _rss_bytes()
+        if rss is not None:
+            sample["rss_mb"] = rss / MB
+            if self.include_workers:
+                sample["workers_rss_mb"] = _children_rss_bytes() / MB
+        # ru_maxrss is in KiB on Linux
+        sample["peak_rss_mb"] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / MB
+        )
+
+        if self._device is not None:
+            stats = torch.cuda.memory_stats(self._device)
+            allocated = stats.get("allocated_bytes.all.current", 0)
+            reserved = stats.get("reserved_bytes.all.current", 0)
+            sample["device_allocated_mb"] = allocated / MB
+            sample["device_reserved_mb"] = reserved / MB
+            sample["device_peak_allocated_mb"] = (
+                stats.get("allocated_bytes.all.peak", 0) / MB
+            )
+            sample["device_fragmentation"] = 1 - allocated / reserved if reserved else 0
+            sample["device_alloc_retries"] = stats.get("num_alloc_retries", 0)
+        return sample
+
+    def on_step_end(self, trainer):
+        step = trainer.global_step
+        if step % self.every == 0:
+            self.latest = self.sample()
+            for name, value in self.latest.items():
+                trainer.metrics.observe(f"memory/{name}", value)
+
+        if step % trainer.log_every == 0 and self.latest:
+            for name, value in self.latest.items():
+                trainer.metrics.reset(f"memory/{name}")
+                trainer.metrics.update(f"memory/{name}", value)
+            self._check_growth(trainer)
+
+        if (
+            self.tracemalloc_every is not None
+            and tracemalloc.is_tracing()
+            and step % self.tracemalloc_every == 0
+        ):
+            self._log_allocation_sites(trainer)
+
+    def _check_growth(self, trainer):
+        for name in ("rss_mb", "workers_rss_mb", "device_allocated_mb"):
+            if name not in self.latest:
+                continue
+            history = self.history.setdefault(
+                name, deque(maxlen=self.growth_window + 1)
+            )
+            history.append(self.latest[name])
+            values = list(history)
+            growth = values[-1] - values[0]
+            growing = (
+                len(values) > self.growth_window
+                and all(b >= a for a, b in itertools.pairwise(values))
+                and growth > self.growth_threshold_mb
+            )
+            if growing and name not in self.growing:
+                trainer.logger.warning(
+                    f"[rank {trainer.acc.process_index}] memory/{name} grew by "
+                    f"{growth:.0f} MB over the last {self.growth_window} log windows "
+                    f"without ever decreasing (now {values[-1]:.0f} MB); possible leak",
+                    main_process_only=False,
+                )
+                self.growing.add(name)
+            elif not growing:
+                self.growing.discard(name)
+            trainer.metrics.reset(f"memory/{name}_growing")
+            trainer.metrics.update(f"memory/{name}_growing", float(growing))
+
+    def _log_allocation_sites(self, trainer):
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            )
+        )
+        if self._snapshot is not None:
+            stats = snapshot.compare_to(self._snapshot, "lineno")[: self.top_n]
+            header = "growth since the last snapshot"
+        else:
+            stats = snapshot.statistics("lineno")[: self.top_n]
+            header = "largest"
+        self._snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        trainer.logger.info(
+            f"[rank {trainer.acc.process_index}] Python allocations at step "
+            f"{trainer.global_step} (traced {current / MB:.1f} MB, peak {peak / MB:.1f} MB), "
+            f"top {len(stats)} sites by {header}:\n"
+            + "\n".join(f"  {stat}" for stat in stats),
+            main_process_only=False,
+        )
+
+    def on_train_end(self, trainer):
+        self._snapshot = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
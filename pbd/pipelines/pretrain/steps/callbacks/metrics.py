@@ -1,37 +1,214 @@
-class Metric:
-    def __init__(self):
-        self.reset()
+from collections.abc import Iterable
 
-    def reset(self):
-        self.sum = 0
-        self.count = 0
+import numpy as np
+import torch
 
-    def update(self, val, n=1):
-        self.sum += val * n
-        self.count += n
+QUANTILES = (50, 95, 99)
 
-    @property
-    def avg(self):
-        if self.count == 0:
-            return 0
-        return self.sum / self.count
+
+def _grow(array: np.ndarray, size: int, fill: float = 0.0) -> np.ndarray:
+    """Return `array` with at least `size` rows, doubling its capacity when needed."""
+    if size <= len(array):
+        return array
+    grown = np.full((max(size, 2 * len(array)), *array.shape[1:]), fill, array.dtype)
+    grown[: len(array)] = array
+    return grown
 
 
 class MetricRunner:
-    def __init__(self):
-        self.metrics = {}
+    """Metric store backed by preallocated arrays, with EMAs and rolling windows."""
+
+    def __init__(
+        self,
+        ema_decay: float = 0.99,
+        window_size: int = 512,
+        ema_metrics: Iterable[str] = ("loss",),
+        capacity: int = 32,
+    ):
+        self.ema_decay = ema_decay
+        self.window_size = window_size
+        self.ema_metrics = tuple(ema_metrics)
+        # name -> slot
+        self.metrics: dict[str, int] = {}
+        self.windows: dict[str, int] = {}
+
+        self._sum = np.zeros(capacity)
+        self._count = np.zeros(capacity)
+        self._ema = np.zeros(capacity)
+        self._ema_weight = np.zeros(capacity)
+        # slot -> [sum, raw ema, count, number of updates] still on device
+        self._pending: dict[int, list] = {}
+        self._device: torch.device | None = None
+
+        self._window = np.full((capacity, window_size), np.nan)
+        self._window_pos = np.zeros(capacity, dtype=np.int64)
+        self._window_len = np.zeros(capacity, dtype=np.int64)
+
+    def _slot(self, name: str) -> int:
+        slot = self.metrics.get(name)
+        if slot is None:
+            slot = self.metrics[name] = len(self.metrics)
+            size = slot + 1
+            self._sum = _grow(self._sum, size)
+            self._count = _grow(self._count, size)
+            self._ema = _grow(self._ema, size)
+            self._ema_weight = _grow(self._ema_weight, size)
+        return slot
+
+    def _window_slot(self, name: str) -> int:
+        slot = self.windows.get(name)
+        if slot is None:
+            slot = self.windows[name] = len(self.windows)
+            size = slot + 1
+            self._window = _grow(self._window, size, fill=np.nan)
+            self._window_pos = _grow(self._window_pos, size)
+            self._window_len = _grow(self._window_len, size)
+        return slot
 
     def update(self, name, val, n=1):
-        if name not in self.metrics:
-            self.metrics[name] = Metric()
-        self.metrics[name].update(val, n)
+        slot = self._slot(name)
+        decay = self.ema_decay
+        if isinstance(val, torch.Tensor):
+            if self._device is None:
+                self._device = val.device
+            # float32: float64 is not supported on every device (e.g. MPS); the host
+            # arrays the pending values are folded into stay float64
+            val = val.detach().to(self._device, torch.float32)
+            pending = self._pending.get(slot)
+            # Out-of-place so a pending tensor never aliases a value handed out earlier
+            if pending is None:
+                self._pending[slot] = [val * n, val * (1 - decay), n, 1]
+            else:
+                pending[0] = pending[0] + val * n
+                pending[1] = pending[1] * decay + val * (1 - decay)
+                pending[2] += n
+                pending[3] += 1
+            return
+
+        self._sum[slot] += val * n
+        self._count[slot] += n
+        self._ema[slot] = decay * self._ema[slot] + (1 - decay) * val
+        self._ema_weight[slot] = decay * self._ema_weight[slot] + (1 - decay)
+
+    def observe(self, name, val):
+        """Add `val` to the rolling window of `name`."""
+        slot = self._window_slot(name)
+        pos = self._window_pos[slot]
+        self._window[slot, pos] = val
+        self._window_pos[slot] = (pos + 1) % self.window_size
+        if self._window_len[slot] < self.window_size:
+            self._window_len[slot] += 1
+
+    def _resolve(self):
+        """Fold pending device values into the arrays with a single host/device sync."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        values = torch.stack(
+            [torch.stack([p[0], p[1]]).reshape(2) for p in pending.values()]
+        )
+        values = values.cpu().numpy()
+        slots = np.fromiter(pending.keys(), dtype=np.int64, count=len(pending))
+        counts = np.array([p[2] for p in pending.values()], dtype=np.float64)
+        decays = self.ema_decay ** np.array([p[3] for p in pending.values()])
+
+        self._sum[slots] += values[:, 0]
+        self._count[slots] += counts
+        self._ema[slots] = decays * self._ema[slots] + values[:, 1]
+        self._ema_weight[slots] = decays * self._ema_weight[slots] + (1 - decays)
 
     def get_avg(self, name):
-        return self.metrics[name].avg
+        slot = self.metrics[name]
+        self._resolve()
+        count = self._count[slot]
+        return float(self._sum[slot] / count) if count else 0
 
-    def reset(self, name):
-        self.metrics[name].reset()
+    def get_count(self, name):
+        """Number of values in the current window of `name` (0 when unknown)."""
+        slot = self.metrics.get(name)
+        if slot is None:
+            return 0
+        pending = self._pending.get(slot)
+        return float(self._count[slot]) + (pending[2] if pending else 0)
+
+    def get_ema(self, name):
+        """Bias-corrected EMA of `name`, or None before its first update."""
+        slot = self.metrics.get(name)
+        if slot is None:
+            return None
+        self._resolve()
+        weight = self._ema_weight[slot]
+        return float(self._ema[slot] / weight) if weight else None
+
+    def get_percentile(self, name, q):
+        slot = self.windows[name]
+        if not self._window_len[slot]:
+            return 0
+        return float(np.nanpercentile(self._window[slot], q, method="nearest"))
+
+    def get_max(self, name):
+        slot = self.windows[name]
+        if not self._window_len[slot]:
+            return 0
+        return float(np.nanmax(self._window[slot]))
+
+    def reset(self, *names):
+        """Reset the running averages of `names`; EMAs are kept."""
+        slots = [self.metrics[name] for name in names if name in self.metrics]
+        if not slots:
+            return
+        self._resolve()
+        self._sum[slots] = 0
+        self._count[slots] = 0
+
+    def reset_windows(self, *names):
+        slots = [self.windows[name] for name in names if name in self.windows]
+        self._window[slots] = np.nan
+        self._window_pos[slots] = 0
+        self._window_len[slots] = 0
+
+    def snapshot(self):
+        """Copy of the current values; pending device tensors are not read back."""
+        runner = MetricRunner.__new__(MetricRunner)
+        runner.__dict__.update(self.__dict__)
+        runner.metrics = dict(self.metrics)
+        runner.windows = dict(self.windows)
+        runner._pending = {slot: list(p) for slot, p in self._pending.items()}
+        for attrs, used in (
+            (("_sum", "_count", "_ema", "_ema_weight"), len(self.metrics)),
+            (("_window", "_window_pos", "_window_len"), len(self.windows)),
+        ):
+            for attr in attrs:
+                setattr(runner, attr, getattr(self, attr)[:used].copy())
+        return runner
 
     @property
     def tracked_metrics(self):
-        return {name: metric.avg for name, metric in self.metrics.items()}
+        self._resolve()
+        names = list(self.metrics)
+        slots = np.fromiter(self.metrics.values(), dtype=np.int64, count=len(names))
+        counts = self._count[slots]
+        avgs = np.divide(
+            self._sum[slots], counts, out=np.zeros(len(slots)), where=counts > 0
+        )
+        tracked = dict(zip(names, avgs.tolist()))
+
+        for name in self.ema_metrics:
+            ema = self.get_ema(name)
+            if ema is not None:
+                tracked[f"{name}_ema"] = ema
+
+        filled = [
+            (name, slot)
+            for name, slot in self.windows.items()
+            if self._window_len[slot]
+        ]
+        if filled:
+            rows = self._window[[slot for _, slot in filled]]
+            quantiles = np.nanpercentile(rows, QUANTILES, axis=1, method="nearest")
+            maxima = np.nanmax(rows, axis=1)
+            for i, (name, _) in enumerate(filled):
+                for q, values in zip(QUANTILES, quantiles):
+                    tracked[f"{name}_p{q}"] = float(values[i])
+                tracked[f"{name}_max"] = float(maxima[i])
+        return tracked
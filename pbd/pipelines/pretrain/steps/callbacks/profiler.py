@@ -0,0 +1,197 @@
+import importlib.util
+import os
+import signal
+import threading
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.base import Callback
+
+
+class ProfilerCallback(Callback):
+    """Captures `torch.profiler` windows on a schedule or on demand.
+
+    Captures start at `at_steps`, on `trigger_signal` or when `trigger_file` changes.
+    """
+
+    def __init__(
+        self,
+        output_dir: str | Path = "./checkpoints/profiles",
+        wait: int = 1,
+        warmup: int = 1,
+        active: int = 3,
+        at_steps: Iterable[int] = (),
+        trigger_signal: int | None = signal.SIGUSR1,
+        trigger_file: str | Path | None = None,
+        poll_every: int = 10,
+        record_shapes: bool = False,
+        profile_memory: bool = False,
+        with_stack: bool = False,
+        row_limit: int = 40,
+        upload_uri: str | None = None,
+        storage_options: dict[str, Any] | None = None,
+    ):
+        self.output_dir = Path(output_dir)
+        self.wait = wait
+        self.warmup = warmup
+        self.active = active
+        self.at_steps = set(at_steps)
+        self.trigger_signal = trigger_signal
+        self.trigger_file = Path(trigger_file) if trigger_file is not None else None
+        self.poll_every = poll_every
+        self.record_shapes = record_shapes
+        self.profile_memory = profile_memory
+        self.with_stack = with_stack
+        self.row_limit = row_limit
+        self.upload_uri = upload_uri
+        self.storage_options = storage_options or {}
+
+        self.profiler: torch.profiler.profile | None = None
+        self._requested = threading.Event()
+        self._handler_installed = False
+        self._previous_handler = None
+        self._trigger_mtime: int | None = None
+        self._capture_start = 0
+        self._remaining = 0
+        self._rank = 0
+        self._use_cuda = False
+        self._uploader: ThreadPoolExecutor | None = None
+
+    def _file_mtime(self) -> int | None:
+        try:
+            return self.trigger_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def on_train_start(self, trainer):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._rank = trainer.acc.process_index
+        self._use_cuda = trainer.acc.device.type == "cuda"
+        if self.upload_uri is not None and importlib.util.find_spec("fsspec") is None:
+            trainer.logger.warning(
+                f"Profile uploads to {self.upload_uri} disabled: fsspec is not installed "
+                "(pip install fsspec); captures are only written locally"
+            )
+        elif self.upload_uri is not None:
+            self._uploader = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="profile-upload"
+            )
+        if self.trigger_file is not None:
+            self._trigger_mtime = self._file_mtime()
+        if (
+            self.trigger_signal is not None
+            and threading.current_thread() is threading.main_thread()
+        ):
+            self._previous_handler = signal.signal(
+                self.trigger_signal, lambda signum, frame: self._requested.set()
+            )
+            self._handler_installed = True
+            trainer.logger.info(
+                f"Profiler capture on signal {signal.Signals(self.trigger_signal).name} "
+                f"(kill -{signal.Signals(self.trigger_signal).name.removeprefix('SIG')} "
+                f"{os.getpid()})"
+            )
+
+    def _triggered(self, step: int) -> bool:
+        if step in self.at_steps:
+            return True
+        if self._requested.is_set():
+            self._requested.clear()
+            return True
+        if self.trigger_file is not None and step % self.poll_every == 0:
+            mtime = self._file_mtime()
+            if mtime is not None and mtime != self._trigger_mtime:
+                self._trigger_mtime = mtime
+                return True
+        return False
+
+    def on_step_start(self, trainer):
+        if self.profiler is not None or not self._triggered(trainer.global_step):
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self._use_cuda:
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.profiler = torch.profiler.profile(
+            activities=activities,
+            schedule=torch.profiler.schedule(
+                wait=self.wait, warmup=self.warmup, active=self.active, repeat=1
+            ),
+            on_trace_ready=lambda prof: self._export(trainer, prof),
+            record_shapes=self.record_shapes,
+            profile_memory=self.profile_memory,
+            with_stack=self.with_stack,
+        )
+        self._capture_start = trainer.global_step
+        self._remaining = self.wait + self.warmup + self.active
+        trainer.logger.info(
+            f"Profiling steps {trainer.global_step + self.wait + self.warmup}-"
+            f"{trainer.global_step + self._remaining - 1} on rank {self._rank}"
+        )
+        self.profiler.start()
+
+    def on_step_end(self, trainer):
+        if self.profiler is None:
+            return
+        # Exports through `on_trace_ready` when the active window closes
+        self.profiler.step()
+        self._remaining -= 1
+        if self._remaining <= 0:
+            self._stop()
+
+    def _stop(self):
+        profiler, self.profiler = self.profiler, None
+        profiler.stop()
+
+    def _export(self, trainer, prof: torch.profiler.profile):
+        stem = f"profile_step{self._capture_start}_rank{self._rank}"
+        trace_path = self.output_dir / f"{stem}.trace.json.gz"
+        table_path = self.output_dir / f"{stem}.ops.txt"
+        prof.export_chrome_trace(str(trace_path))
+
+        averages = prof.key_averages(group_by_input_shape=self.record_shapes)
+        sort_keys = ["self_cpu_time_total"]
+        if self._use_cuda:
+            sort_keys.insert(0, "self_device_time_total")
+        if self.profile_memory:
+            sort_keys.append("self_cpu_memory_usage")
+        with open(table_path, "w") as f:
+            for sort_by in sort_keys:
+                f.write(f"sorted by {sort_by}\n")
+                f.write(averages.table(sort_by=sort_by, row_limit=self.row_limit))
+                f.write("\n\n")
+        trainer.logger.info(f"Profile written to {trace_path} and {table_path}")
+
+        if self._uploader is not None:
+            self._uploader.submit(self._upload, trainer, [trace_path, table_path])
+
+    def _upload(self, trainer, paths: list[Path]):
+        try:
+            import fsspec
+
+            fs, root = fsspec.core.url_to_fs(self.upload_uri, **self.storage_options)
+            for path in paths:
+                fs.put_file(str(path), f"{root.rstrip('/')}/{path.name}")
+            trainer.logger.info(f"Profile uploaded to {self.upload_uri}")
+        except (ImportError, OSError, ValueError) as e:
+            # A failed upload must never interrupt training; the local copy remains
+            trainer.logger.warning(f"Profile upload to {self.upload_uri} failed: {e}")
+
+    def _shutdown(self):
+        if self.profiler is not None:
+            self._stop()
+        if self._handler_installed:
+            signal.signal(self.trigger_signal, self._previous_handler or signal.SIG_DFL)
+            self._handler_installed = False
+        if self._uploader is not None:
+            self._uploader.shutdown(wait=True)
+            self._uploader = None
+
+    def on_exception(self, trainer, exception):
+        self._shutdown()
+
+    def on_train_end(self, trainer):
+        self._shutdown()
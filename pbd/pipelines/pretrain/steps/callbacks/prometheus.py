@@ -0,0 +1,204 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.base import Callback
+
+PREFIX = "pbd_train"
+
+# metric name in MetricRunner -> (gauge name, help)
+GAUGES = {
+    "loss": ("loss", "Training loss averaged over the last update window."),
+    "loss_ema": ("loss_ema", "Exponential moving average of the training loss."),
+    "tokens_per_sec": ("tokens_per_second", "Tokens per second of this process."),
+    "tokens_per_sec_global": (
+        "tokens_per_second_global",
+        "Tokens per second summed over all processes.",
+    ),
+    "tflops_per_device": ("tflops_per_device", "Achieved TFLOP/s per device."),
+    "mfu": ("mfu_ratio", "Model FLOPs utilization."),
+    "data_wait_time": ("data_wait_seconds", "Time spent waiting for a batch."),
+    "grad_norm": ("grad_norm", "Global gradient norm before clipping."),
+}
+QUANTILES = (50, 95, 99)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe set of gauges rendered in the Prometheus text exposition format."""
+
+    def __init__(self, const_labels: dict[str, str] | None = None):
+        self.const_labels = const_labels or {}
+        self._lock = threading.Lock()
+        self._help: dict[str, str] = {}
+        self._values: dict[str, dict[tuple, float]] = {}
+
+    def set_many(self, samples: list[tuple[str, str, dict[str, str], float]]):
+        """Set `(name, help, labels, value)` gauges under a single lock acquisition."""
+        with self._lock:
+            for name, help_text, labels, value in samples:
+                self._help.setdefault(name, help_text)
+                self._values.setdefault(name, {})[tuple(labels.items())] = value
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in self._values.items():
+                metric = f"{PREFIX}_{name}"
+                lines.append(f"# HELP {metric} {self._help[name]}")
+                lines.append(f"# TYPE {metric} gauge")
+                for labels, value in series.items():
+                    label_str = _labels({**self.const_labels, **dict(labels)})
+                    lines.append(f"{metric}{label_str} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusCallback(Callback):
+    """Exposes training metrics as Prometheus gauges on an HTTP `/metrics` endpoint."""
+
+    async_safe = True
+
+    def __init__(
+        self,
+        port: int | None = None,
+        host: str | None = None,
+        update_every: int | None = None,
+        run_name: str | None = None,
+    ):
+        self.port = port
+        self.host = host
+        self.update_every = update_every
+        self.run_name = run_name
+        self.registry: MetricsRegistry | None = None
+        self.server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def on_train_start(self, trainer):
+        if not trainer.acc.is_main_process:
+            return
+        run_name = self.run_name
+        if run_name is None and trainer.trainer_state.wandb_config is not None:
+            run_name = trainer.trainer_state.wandb_config.name
+        self.registry = MetricsRegistry({"run": run_name} if run_name else None)
+        # Arguments take precedence over the trainer config
+        config = trainer.trainer_state.prometheus
+        if self.host is None:
+            self.host = config.host
+        if self.port is None:
+            self.port = config.port
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="prometheus-exporter", daemon=True
+        )
+        self._thread.start()
+        trainer.logger.info(
+            f"Prometheus metrics served on http://{self.host}:{self.port}/metrics"
+        )
+
+    def on_step_end(self, trainer):
+        # The metric snapshot is only taken at log boundaries
+        if self.registry is None or trainer.metrics is None:
+            return
+        update_every = self.update_every or trainer.trainer_state.log_every
+        if trainer.global_step % update_every:
+            return
+        self.registry.set_many(self._collect(trainer))
+
+    def _collect(self, trainer) -> list[tuple[str, str, dict[str, str], float]]:
+        metrics = trainer.metrics
+        samples = [
+            ("step", "Optimizer steps completed.", {}, float(trainer.optimizer_step))
+        ]
+
+        for key, (name, help_text) in GAUGES.items():
+            if key == "loss_ema":
+                value = metrics.get_ema("loss")
+            elif metrics.get_count(key):
+                value = metrics.get_avg(key)
+            else:
+                # Nothing recorded in this window; keep the previous value
+                continue
+            if value is not None:
+                samples.append((name, help_text, {}, float(value)))
+
+        for key in metrics.metrics:
+            if key.startswith("lr_") and metrics.get_count(key):
+                samples.append(
+                    (
+                        "learning_rate",
+                        "Learning rate per parameter group.",
+                        {"group": key.removeprefix("lr_")},
+                        metrics.get_avg(key),
+                    )
+                )
+
+        for key in metrics.windows:
+            if not key.startswith("time/"):
+                continue
+            phase = key.removeprefix("time/")
+            for q in QUANTILES:
+                samples.append(
+                    (
+                        "phase_seconds",
+                        "Per-step latency of each training phase.",
+                        {"phase": phase, "quantile": str(q / 100)},
+                        metrics.get_percentile(key, q),
+                    )
+                )
+
+        device = trainer.acc.device
+        if device.type == "cuda":
+            for name, help_text, value in (
+                (
+                    "memory_allocated_bytes",
+                    "CUDA memory allocated by tensors.",
+                    torch.cuda.memory_allocated(device),
+                ),
+                (
+                    "memory_peak_allocated_bytes",
+                    "Peak CUDA memory allocated by tensors.",
+                    torch.cuda.max_memory_allocated(device),
+                ),
+                (
+                    "memory_reserved_bytes",
+                    "CUDA memory reserved by the caching allocator.",
+                    torch.cuda.memory_reserved(device),
+                ),
+            ):
+                samples.append((name, help_text, {}, float(value)))
+        return samples
+
+    def on_train_end(self, trainer):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self._thread.join()
+            self.server = None
@@ -0,0 +1,107 @@
+import json
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class MetricSink(Protocol):
+    def write(self, rows: list[tuple[int, dict]]): ...
+
+    def close(self): ...
+
+
+class WandbSink:
+    """Writes rows to the active W&B run."""
+
+    def write(self, rows: list[tuple[int, dict]]):
+        import wandb
+
+        for step, metrics in rows:
+            wandb.log(metrics, step=step)
+
+    def close(self):
+        pass
+
+
+class JsonlFileSink:
+    """Appends rows as JSON lines to a local file, for offline runs and tests."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Stays open across flushes; closed by `close`
+        self._file = open(self.path, "a")  # noqa: SIM115
+
+    def write(self, rows: list[tuple[int, dict]]):
+        for step, metrics in rows:
+            self._file.write(json.dumps({"step": step, **metrics}, default=float))
+            self._file.write("\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BufferedMetricLogger:
+    """Ring buffer of metric rows flushed to a sink by a background thread."""
+
+    def __init__(
+        self, sink: MetricSink, flush_interval: float = 10.0, capacity: int = 10000
+    ):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.dropped = 0
+        self._buffer: deque[tuple[int, dict]] = deque(maxlen=capacity)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(
+            target=self._worker, name="metric-logger", daemon=True
+        )
+        self._thread.start()
+
+    def log(self, step: int, metrics: dict):
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+        self._buffer.append((step, metrics))
+        if len(self._buffer) >= self.capacity // 2:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every buffered row to the sink."""
+        with self._flush_lock:
+            rows = []
+            while self._buffer:
+                rows.append(self._buffer.popleft())
+            if rows:
+                self.sink.write(rows)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except (OSError, ValueError, TypeError) as e:
+                # Keep training alive; the error is re-raised by `close`
+                logger.error(f"Flushing metrics failed: {e}")
+                self._error = e
+
+    def close(self):
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        try:
+            self.flush()
+            if self.dropped:
+                logger.warning(f"Dropped {self.dropped} metric rows (buffer full)")
+        finally:
+            self.sink.close()
+        if self._error is not None:
+            raise self._error
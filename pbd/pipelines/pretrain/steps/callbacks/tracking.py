@@ -1,51 +1,84 @@
+import os
+
 import wandb
+
 from pbd.pipelines.pretrain.steps.callbacks.base import Callback
-import os
+from pbd.pipelines.pretrain.steps.callbacks.sinks import (
+    BufferedMetricLogger,
+    JsonlFileSink,
+    WandbSink,
+)
 
 
 class WandbCallback(Callback):
     """Logs metrics to Weights & Biases with proper accelerate integration."""
 
+    # Only reads the trainer, so it runs off the training thread on a snapshot
+    async_safe = True
+
     def __init__(
         self,
     ):
-        _key = os.getenv("WANDB_API")
-        wandb.login(key=_key)
         self.run = None
+        self.buffer = None
+
+    def _uses_wandb(self, trainer):
+        return trainer.trainer_state.wandb_config.sink == "wandb"
 
     def on_train_start(self, trainer):
         if trainer.acc.is_main_process:
-            self.run = wandb.init(
-                project=trainer.trainer_state.wandb_config.project,
-                name=trainer.trainer_state.wandb_config.name,
-                config=trainer.trainer_state.dict(),
-                resume="allow",
+            config = trainer.trainer_state.wandb_config
+            if self._uses_wandb(trainer):
+                _key = os.getenv("WANDB_API")
+                wandb.login(key=_key)
+                self.run = wandb.init(
+                    project=config.project,
+                    name=config.name,
+                    config=trainer.trainer_state.dict(),
+                    resume="allow",
+                )
+                trainer.logger.info(f"W&B run initialized: {self.run.name}")
+                sink = WandbSink()
+            else:
+                sink = JsonlFileSink(config.log_file)
+                trainer.logger.info(f"Logging metrics to {config.log_file}")
+            self.buffer = BufferedMetricLogger(
+                sink,
+                flush_interval=config.flush_interval,
+                capacity=config.buffer_size,
             )
-            trainer.logger.info(f"W&B run initialized: {self.run.name}")
-
-    def on_step_start(self, trainer):
-        pass
 
     def on_step_end(self, trainer):
-        if trainer.acc.is_main_process:
-            # Get all metrics
+        # The metric snapshot is only taken at log boundaries
+        if (
+            trainer.acc.is_main_process
+            and self.buffer is not None
+            and trainer.metrics is not None
+        ):
             metrics = trainer.metrics.tracked_metrics
             metrics["train/global_step"] = trainer.global_step
 
-            wandb.log(metrics, step=trainer.global_step)
+            self.buffer.log(trainer.global_step, metrics)
 
-    def on_exception(self, trainer, e):
+    def on_exception(self, trainer, exception):
         """Log exception to W&B and mark run as failed."""
+        if trainer.acc.is_main_process and self.buffer is not None:
+            self.buffer.flush()
         if trainer.acc.is_main_process and self.run:
             trainer.logger.info("Logging exception to W&B")
             wandb.alert(
                 title="Training Failed",
-                text=f"Training failed at step {trainer.global_step}: {str(e)}",
+                text=f"Training failed at step {trainer.global_step}: {exception!s}",
                 level=wandb.AlertLevel.ERROR,
             )
 
     def on_train_end(self, trainer):
         if trainer.acc.is_main_process:
+            if self.buffer is not None:
+                self.buffer.close()
+                self.buffer = None
+            if not self.run:
+                return
             if trainer.trainer_state.wandb_config.log_model:
                 trainer.logger.info("Saving final model to W&B")
                 wandb.save("model_final.pt")
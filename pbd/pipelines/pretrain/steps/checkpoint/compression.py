@@ -0,0 +1,146 @@
+import io
+from pathlib import Path
+from typing import Any
+
+import torch
+
+ENCODED_MARKER = "__encoded__"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Second moments span many orders of magnitude and Adam divides by their square root: an int8 or fp16
+# code flushes small entries to 0 and blows up the first update after a resume, so they are kept in bf16
+_SECOND_MOMENT_KEYS = ("exp_avg_sq", "max_exp_avg_sq")
+
+
+def _quantize_int8(x: torch.Tensor, block_size: int) -> dict[str, Any]:
+    """Symmetric absmax int8 quantization, one float32 scale per block."""
+    flat = x.reshape(-1).float()
+    padding = (-flat.numel()) % block_size
+    if padding:
+        flat = torch.nn.functional.pad(flat, (0, padding))
+    blocks = flat.view(-1, block_size)
+    scale = blocks.abs().amax(dim=1, keepdim=True).clamp_min(1e-12) / 127
+    data = torch.round(blocks / scale).to(torch.int8)
+    return {"data": data, "scale": scale.squeeze(1)}
+
+
+def _dequantize_int8(encoded: dict[str, Any], numel: int) -> torch.Tensor:
+    blocks = encoded["data"].float() * encoded["scale"].float().unsqueeze(1)
+    return blocks.reshape(-1)[:numel]
+
+
+def encode_tensor(
+    x: torch.Tensor, encoding: str, block_size: int = 256, keep_nonzero: bool = False
+) -> dict[str, Any]:
+    """Encode a floating-point tensor as `bf16`, `fp16` or block-quantized `int8`."""
+    encoded: dict[str, Any] = {
+        ENCODED_MARKER: encoding,
+        "shape": list(x.shape),
+        "dtype": str(x.dtype).removeprefix("torch."),
+    }
+    if encoding == "int8":
+        encoded.update(_quantize_int8(x, block_size))
+    else:
+        if keep_nonzero:
+            tiny = torch.finfo(torch.bfloat16).tiny
+            x = torch.where(x == 0, x, x.sign() * x.abs().clamp_min(tiny))
+        encoded["data"] = x.to(torch.bfloat16 if encoding == "bf16" else torch.float16)
+    return encoded
+
+
+def decode_tensor(encoded: dict[str, Any]) -> torch.Tensor:
+    numel = 1
+    for dim in encoded["shape"]:
+        numel *= dim
+    if encoded[ENCODED_MARKER] == "int8":
+        x = _dequantize_int8(encoded, numel)
+    else:
+        x = encoded["data"].float()
+    return x.reshape(encoded["shape"]).to(getattr(torch, encoded["dtype"]))
+
+
+def encode_optimizer_state(
+    state_dict: dict[str, Any], encoding: str, block_size: int = 256
+) -> tuple[dict[str, Any], int, int, dict[str, int]]:
+    """Encode optimizer moments.
+
+    Returns the state, raw/encoded byte counts and the number of tensors encoded per
+    `<state key>/<encoding>`, e.g. `exp_avg/int8` and `exp_avg_sq/bf16`.
+    """
+    if encoding == "none":
+        return state_dict, 0, 0, {}
+
+    raw_bytes = encoded_bytes = 0
+    tensor_counts: dict[str, int] = {}
+    states = {}
+    for param_id, param_state in state_dict["state"].items():
+        encoded_state = {}
+        for key, value in param_state.items():
+            if (
+                isinstance(value, torch.Tensor)
+                and value.is_floating_point()
+                and value.numel() > 1
+            ):
+                if key in _SECOND_MOMENT_KEYS:
+                    encoded = encode_tensor(value, "bf16", keep_nonzero=True)
+                else:
+                    encoded = encode_tensor(value, encoding, block_size)
+                name = f"{key}/{encoded[ENCODED_MARKER]}"
+                tensor_counts[name] = tensor_counts.get(name, 0) + 1
+                raw_bytes += value.numel() * value.element_size()
+                encoded_bytes += sum(
+                    t.numel() * t.element_size()
+                    for t in encoded.values()
+                    if isinstance(t, torch.Tensor)
+                )
+                value = encoded
+            encoded_state[key] = value
+        states[param_id] = encoded_state
+    return {**state_dict, "state": states}, raw_bytes, encoded_bytes, tensor_counts
+
+
+def decode_optimizer_state(state_dict: dict[str, Any]) -> dict[str, Any]:
+    """Inverse of `encode_optimizer_state`; other states are returned unchanged."""
+    states = {}
+    for param_id, param_state in state_dict["state"].items():
+        states[param_id] = {
+            key: decode_tensor(value)
+            if isinstance(value, dict) and ENCODED_MARKER in value
+            else value
+            for key, value in param_state.items()
+        }
+    return {**state_dict, "state": states}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "zstd checkpoint compression requires the `zstandard` package "
+            "(pip install zstandard)"
+        ) from e
+    return zstandard
+
+
+def serialize(obj: Any, zstd_level: int | None = None) -> bytes:
+    """`torch.save` `obj` to bytes, optionally compressed with zstd (lossless)."""
+    buffer = io.BytesIO()
+    torch.save(obj, buffer)
+    data = buffer.getvalue()
+    if zstd_level is not None:
+        data = _zstd().ZstdCompressor(level=zstd_level, threads=-1).compress(data)
+    return data
+
+
+def load_torch_checkpoint(
+    path: str | Path, map_location: Any = None, mmap: bool = False
+) -> Any:
+    """`torch.load` a checkpoint file, decompressing zstd frames first."""
+    with open(path, "rb") as f:
+        compressed = f.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC
+    if not compressed:
+        return torch.load(path, map_location=map_location, mmap=mmap)
+    with open(path, "rb") as f:
+        data = _zstd().ZstdDecompressor().stream_reader(f).read()
+    return torch.load(io.BytesIO(data), map_location=map_location)
@@ -0,0 +1,155 @@
+import io
+import logging
+import os
+import re
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+import torch
+import torch.distributed as dist
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_PATTERN = re.compile(r"^(own|peer)_rank(\d+)_of(\d+)_step(\d+)\.snap$")
+
+
+def _write_bytes(data: bytes, path: Path):
+    """Atomically write `data` to `path` (temporary file + rename)."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PeerSnapshotStore:
+    """In-memory snapshots of every rank's training state, replicated to a peer."""
+
+    def __init__(
+        self,
+        directory: str | Path = "/dev/shm/pbd_snapshots",
+        run_id: str = "default",
+        group: Any | None = None,
+        peer_offset: int | None = None,
+        timeout: timedelta = timedelta(minutes=5),
+    ):
+        # Runs sharing a node never see each other's snapshots
+        self.directory = Path(directory) / run_id
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.distributed = dist.is_available() and dist.is_initialized()
+        if self.distributed:
+            self.rank = dist.get_rank()
+            self.world_size = dist.get_world_size()
+            self.group = group or dist.new_group(backend="gloo", timeout=timeout)
+        else:
+            self.rank, self.world_size, self.group = 0, 1, None
+        if peer_offset is None:
+            local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", "1"))
+            peer_offset = local_world_size if local_world_size < self.world_size else 1
+        self.peer_offset = peer_offset
+        self.send_to = (self.rank + peer_offset) % self.world_size
+        self.recv_from = (self.rank - peer_offset) % self.world_size
+
+    def _path(self, kind: str, rank: int, step: int) -> Path:
+        return self.directory / f"{kind}_rank{rank}_of{self.world_size}_step{step}.snap"
+
+    def _find(self, kind: str, rank: int, min_step: int = 0) -> dict[int, Path]:
+        """Snapshot files of `kind` ("own" or "peer") written for `rank`."""
+        found = {}
+        for path in self.directory.iterdir():
+            match = _SNAPSHOT_PATTERN.match(path.name)
+            if (
+                match
+                and match.group(1) == kind
+                and int(match.group(2)) == rank
+                and int(match.group(3)) == self.world_size
+                and int(match.group(4)) >= min_step
+            ):
+                found[int(match.group(4))] = path
+        return found
+
+    def _keep_only(self, kind: str, rank: int, step: int):
+        for old_step, path in self._find(kind, rank).items():
+            if old_step != step:
+                path.unlink(missing_ok=True)
+
+    def clear(self):
+        """Delete the snapshots this rank wrote, e.g. before training from scratch."""
+        for kind, rank in (("own", self.rank), ("peer", self.recv_from)):
+            for path in self._find(kind, rank).values():
+                path.unlink(missing_ok=True)
+
+    def _exchange(
+        self, data: bytes | None, dst: int | None, src: int | None
+    ) -> bytes | None:
+        """Send `data` to rank `dst` and/or receive a payload from rank `src`."""
+        requests, received = [], None
+        if dst is not None:
+            payload = torch.frombuffer(bytearray(data), dtype=torch.uint8)
+            size = torch.tensor([payload.numel()], dtype=torch.int64)
+            requests.append(dist.isend(size, dst, group=self.group))
+        if src is not None:
+            peer_size = torch.zeros(1, dtype=torch.int64)
+            dist.irecv(peer_size, src, group=self.group).wait()
+            received = torch.empty(int(peer_size.item()), dtype=torch.uint8)
+            requests.append(dist.irecv(received, src, group=self.group))
+        if dst is not None:
+            requests.append(dist.isend(payload, dst, group=self.group))
+        for request in requests:
+            request.wait()
+        return received.numpy().tobytes() if received is not None else None
+
+    def save(self, host_state: Any, step: int | str | Path):
+        """Store `host_state` as this rank's snapshot of `step` and replicate it."""
+        step = int(Path(str(step)).name)
+        buffer = io.BytesIO()
+        torch.save(host_state, buffer)
+        data = buffer.getvalue()
+
+        _write_bytes(data, self._path("own", self.rank, step))
+        self._keep_only("own", self.rank, step)
+        if self.world_size > 1:
+            peer_data = self._exchange(data, dst=self.send_to, src=self.recv_from)
+            _write_bytes(peer_data, self._path("peer", self.recv_from, step))
+            self._keep_only("peer", self.recv_from, step)
+
+    def restore(
+        self, map_location: Any = None, min_step: int = 0
+    ) -> tuple[int, Any] | None:
+        """Load the newest step >= `min_step` surviving on every rank or its peer."""
+        own = self._find("own", self.rank, min_step)
+        held = self._find("peer", self.recv_from, min_step)
+        availability = [(sorted(own), sorted(held))]
+        if self.distributed:
+            availability = [None] * self.world_size
+            dist.all_gather_object(
+                availability, (sorted(own), sorted(held)), group=self.group
+            )
+
+        def candidates(rank: int) -> set[int]:
+            # Rank r's state lives on r itself and on its peer, which holds it as "peer"
+            holder = (rank + self.peer_offset) % self.world_size
+            return set(availability[rank][0]) | set(availability[holder][1])
+
+        complete = set.intersection(*(candidates(r) for r in range(self.world_size)))
+        if not complete:
+            return None
+        step = max(complete)
+
+        # Ranks that lost their own copy get it back from the peer holding it
+        needs = [step not in availability[r][0] for r in range(self.world_size)]
+        if needs[self.rank]:
+            data = self._exchange(
+                held[step].read_bytes() if needs[self.recv_from] else None,
+                dst=self.recv_from if needs[self.recv_from] else None,
+                src=self.send_to,
+            )
+            _write_bytes(data, self._path("own", self.rank, step))
+        else:
+            if self.distributed and needs[self.recv_from]:
+                self._exchange(held[step].read_bytes(), dst=self.recv_from, src=None)
+            data = own[step].read_bytes()
+
+        state = torch.load(io.BytesIO(data), map_location=map_location)
+        logger.info(f"Restored in-memory snapshot of step {step} on rank {self.rank}")
+        return step, state
@@ -0,0 +1,218 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+INDEX_FILE = "index.json"
+FORMAT_NAME = "sharded-safetensors"
+FORMAT_VERSION = 1
+
+
+def _join(key: str, part: Any) -> str:
+    return f"{key}/{part}" if key else str(part)
+
+
+def flatten_state_dict(state: Any) -> tuple[dict[str, torch.Tensor], Any]:
+    """Split a nested state into flat tensors and a JSON-serializable skeleton."""
+    tensors = {}
+
+    def _flatten(obj: Any, key: str) -> Any:
+        if isinstance(obj, torch.Tensor):
+            tensors[key] = obj
+            return {"__tensor__": key}
+        if isinstance(obj, dict):
+            items = [[k, _flatten(v, _join(key, k))] for k, v in obj.items()]
+            return {"__dict__": items}
+        if isinstance(obj, tuple):
+            items = [_flatten(v, _join(key, i)) for i, v in enumerate(obj)]
+            return {"__tuple__": items}
+        if isinstance(obj, list):
+            return [_flatten(v, _join(key, i)) for i, v in enumerate(obj)]
+        if obj is None or isinstance(obj, (bool, int, float, str)):
+            return obj
+        raise TypeError(
+            f"Cannot store {type(obj).__name__} at '{key}' in a sharded checkpoint"
+        )
+
+    skeleton = _flatten(state, "")
+    return tensors, skeleton
+
+
+def unflatten_state_dict(skeleton: Any, load_tensor) -> Any:
+    """Rebuild the nested state from its skeleton with `load_tensor(key)`."""
+    if isinstance(skeleton, dict):
+        if "__tensor__" in skeleton:
+            return load_tensor(skeleton["__tensor__"])
+        if "__tuple__" in skeleton:
+            return tuple(
+                unflatten_state_dict(v, load_tensor) for v in skeleton["__tuple__"]
+            )
+        return {
+            k: unflatten_state_dict(v, load_tensor) for k, v in skeleton["__dict__"]
+        }
+    if isinstance(skeleton, list):
+        return [unflatten_state_dict(v, load_tensor) for v in skeleton]
+    return skeleton
+
+
+def assign_shards(tensors: dict[str, torch.Tensor], world_size: int) -> dict[str, int]:
+    """Deterministically assign every tensor to a rank, balancing bytes per rank."""
+    loads = [0] * world_size
+    assignment = {}
+    sizes = {key: t.numel() * t.element_size() for key, t in tensors.items()}
+    for key in sorted(sizes, key=lambda k: (-sizes[k], k)):
+        rank = min(range(world_size), key=lambda r: (loads[r], r))
+        assignment[key] = rank
+        loads[rank] += sizes[key]
+    return assignment
+
+
+def shard_name(rank: int, world_size: int) -> str:
+    return f"shard-{rank:05d}-of-{world_size:05d}.safetensors"
+
+
+def build_shard(state: Any, rank: int = 0, world_size: int = 1) -> dict[str, Any]:
+    """Select the part of `state` that `rank` writes (plus the index on rank 0)."""
+    tensors, skeleton = flatten_state_dict(state)
+    assignment = assign_shards(tensors, world_size)
+    index = None
+    if rank == 0:
+        index = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "world_size": world_size,
+            "shards": [shard_name(r, world_size) for r in range(world_size)],
+            "weight_map": {
+                key: shard_name(r, world_size) for key, r in assignment.items()
+            },
+            "metadata": skeleton,
+        }
+    return {
+        "name": shard_name(rank, world_size),
+        "tensors": {k: t for k, t in tensors.items() if assignment[k] == rank},
+        "index": index,
+    }
+
+
+def clear_checkpoint(path: str | Path):
+    """Remove the index, then the shards, of a checkpoint in directory `path`."""
+    path = Path(path)
+    if not path.is_dir():
+        return
+    (path / INDEX_FILE).unlink(missing_ok=True)
+    for stale in (*path.glob("*.safetensors"), *path.glob(".*.tmp")):
+        stale.unlink(missing_ok=True)
+
+
+def _wait_for_shards(
+    path: Path, shards: list[str], timeout: float, poll_interval: float
+):
+    deadline = time.monotonic() + timeout
+    while True:
+        missing = [s for s in shards if not (path / s).is_file()]
+        if not missing:
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                f"Shards {missing} of {path} were not written within {timeout:.0f}s; "
+                "the index was not published"
+            )
+        time.sleep(poll_interval)
+
+
+def write_shard(
+    shard: dict[str, Any],
+    path: str | Path,
+    timeout: float = 3600.0,
+    poll_interval: float = 1.0,
+):
+    """Atomically write one shard (and the index, on rank 0) into `path`."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    shard_path = path / shard["name"]
+    tmp_path = path / f".{shard['name']}.tmp"
+    save_file(
+        {key: t.contiguous() for key, t in shard["tensors"].items()},
+        str(tmp_path),
+        metadata={"format": FORMAT_NAME},
+    )
+    os.replace(tmp_path, shard_path)
+
+    if shard["index"] is not None:
+        _wait_for_shards(path, shard["index"]["shards"], timeout, poll_interval)
+        tmp_index = path / f".{INDEX_FILE}.tmp"
+        with open(tmp_index, "w") as f:
+            json.dump(shard["index"], f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index, path / INDEX_FILE)
+
+
+def is_sharded_checkpoint(path: str | Path) -> bool:
+    return (Path(path) / INDEX_FILE).is_file()
+
+
+class ShardedCheckpointReader:
+    """Lazily reads a sharded checkpoint from memory-mapped shards."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / INDEX_FILE) as f:
+            self.index = json.load(f)
+        if self.index.get("format") != FORMAT_NAME:
+            raise ValueError(f"{self.path} is not a {FORMAT_NAME} checkpoint")
+        missing = [s for s in self.index["shards"] if not (self.path / s).is_file()]
+        if missing:
+            raise FileNotFoundError(
+                f"Incomplete checkpoint {self.path}: missing shards {missing}"
+            )
+        self.weight_map: dict[str, str] = self.index["weight_map"]
+        self._handles = {}
+
+    def _handle(self, shard: str, device: str):
+        if (shard, device) not in self._handles:
+            self._handles[(shard, device)] = safe_open(
+                str(self.path / shard), framework="pt", device=device
+            )
+        return self._handles[(shard, device)]
+
+    def get_tensor(
+        self, key: str, device: str | torch.device | None = None
+    ) -> torch.Tensor:
+        device = str(device) if device is not None else "cpu"
+        return self._handle(self.weight_map[key], device).get_tensor(key)
+
+    def _subtree(self, key: str) -> Any:
+        node = self.index["metadata"]
+        for part in key.split("/") if key else []:
+            node = next((v for k, v in node["__dict__"] if str(k) == part), None)
+            if node is None:
+                raise KeyError(f"'{key}' not found in checkpoint {self.path}")
+        return node
+
+    def load(self, key: str = "", device: str | torch.device | None = None) -> Any:
+        """Materialize the sub-state stored under `key` on `device`."""
+        return unflatten_state_dict(
+            self._subtree(key), lambda k: self.get_tensor(k, device)
+        )
+
+    @torch.no_grad()
+    def load_into_module(self, module: torch.nn.Module, key: str):
+        """Copy the module state under `key` into `module`, one tensor at a time."""
+        own_state = module.state_dict()
+        stored = {k for k, _ in self._subtree(key)["__dict__"]}
+        missing = sorted(set(own_state) - stored)
+        unexpected = sorted(stored - set(own_state))
+        if missing or unexpected:
+            raise RuntimeError(
+                f"Error loading '{key}': missing keys {missing}, "
+                f"unexpected keys {unexpected}"
+            )
+        for name, tensor in own_state.items():
+            tensor.copy_(self.get_tensor(_join(key, name), tensor.device))
@@ -0,0 +1,146 @@
+import logging
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import torch
+
+from pbd.pipelines.pretrain.steps.checkpoint.compression import serialize
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_torch_save(obj: Any, path: str | Path, zstd_level: int | None = None):
+    """Write `obj` to a temporary file next to `path` and rename it into place."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        if zstd_level is None:
+            torch.save(obj, f)
+        else:
+            f.write(serialize(obj, zstd_level))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _size_on_disk(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+class AsyncCheckpointWriter:
+    """Writes checkpoints on a background thread from host copies of the state."""
+
+    def __init__(
+        self,
+        async_save: bool = True,
+        write_fn: Callable[[Any, Path], None] | None = None,
+    ):
+        self.async_save = async_save
+        self.write_fn = write_fn or atomic_torch_save
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint-writer")
+            if async_save
+            else None
+        )
+        self._pending: Future | None = None
+        self._host_buffers: dict[str, torch.Tensor] = {}
+        # Stats of the last save: time the caller was blocked, and the background write
+        self.last_snapshot_seconds: float | None = None
+        self.last_write_seconds: float | None = None
+        self.last_bytes_written: int | None = None
+
+    def _to_host(self, obj: Any, key: str = "") -> Any:
+        """Recursively copy tensors to host memory with async device copies."""
+        if isinstance(obj, torch.Tensor):
+            tensor = obj.detach()
+            if tensor.device.type == "cpu":
+                return tensor.clone()
+            if tensor.device.type != "cuda":
+                # Pinned buffers and non-blocking copies are CUDA-only (e.g. MPS, XLA)
+                return tensor.to("cpu")
+            buffer = self._host_buffers.get(key)
+            if (
+                buffer is None
+                or buffer.shape != tensor.shape
+                or buffer.dtype != tensor.dtype
+            ):
+                buffer = torch.empty(
+                    tensor.shape, dtype=tensor.dtype, device="cpu", pin_memory=True
+                )
+                self._host_buffers[key] = buffer
+            buffer.copy_(tensor, non_blocking=True)
+            return buffer
+        if isinstance(obj, dict):
+            return {k: self._to_host(v, f"{key}/{k}") for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._to_host(v, f"{key}/{i}") for i, v in enumerate(obj))
+        return obj
+
+    def snapshot(self, state: Any) -> Any:
+        """Copy `state` to host memory, the only part of a save that stalls."""
+        host_state = self._to_host(state)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return host_state
+
+    def _write(
+        self,
+        host_state: Any,
+        path: Path,
+        on_saved: Callable[[Path], None] | None,
+        write_fn: Callable[[Any, Path], None],
+    ):
+        start = time.perf_counter()
+        write_fn(host_state, path)
+        self.last_write_seconds = time.perf_counter() - start
+        self.last_bytes_written = _size_on_disk(path)
+        logger.info(
+            f"Checkpoint written to {path} in {self.last_write_seconds:.1f}s"
+            + (
+                f" ({self.last_bytes_written / 1e9:.2f} GB)"
+                if self.last_bytes_written
+                else ""
+            )
+        )
+        if on_saved is not None:
+            on_saved(path)
+
+    def save(
+        self,
+        state: Any,
+        path: str | Path,
+        on_saved: Callable[[Path], None] | None = None,
+        write_fn: Callable[[Any, Path], None] | None = None,
+    ):
+        """Snapshot `state` and write it to `path`, then call `on_saved(path)`."""
+        start = time.perf_counter()
+        self.wait()
+        host_state = self.snapshot(state)
+        self.last_snapshot_seconds = time.perf_counter() - start
+        args = (host_state, Path(path), on_saved, write_fn or self.write_fn)
+        if self._executor is None:
+            self._write(*args)
+        else:
+            self._pending = self._executor.submit(self._write, *args)
+
+    @property
+    def in_flight(self) -> bool:
+        return self._pending is not None and not self._pending.done()
+
+    def wait(self):
+        """Block until the in-flight save (if any) is on disk."""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
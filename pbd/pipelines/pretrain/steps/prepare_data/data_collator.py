@@ -1,8 +1,9 @@
 from dataclasses import dataclass
 from typing import Any
-from transformers.data.data_collator import DataCollatorMixin
-import torch
+
 import numpy as np
+import torch
+from transformers.data.data_collator import DataCollatorMixin
 
 
 def pad(
@@ -91,8 +92,13 @@ class DataCollatorForLanguageModeling(DataCollatorMixin):
     not in the assistant part of the sequence are set to -100. If `padding_free` is set to `False`, the following key
     is also returned:
     - `"attention_mask"`: Tensor of attention masks, padded to the maximum length of the batch.
-    If `padding_free` is set to `True`, the following key is also returned:
+    If `padding_free` is set to `True`, the following keys are also returned:
     - `"position_ids"`: Tensor of position IDs, padded to the maximum length of the batch.
+    - `"num_tokens"`: Number of input tokens before padding (`pad_to_multiple_of`), as a scalar tensor. It is
+    batch metadata, not a model input.
+    If `return_flash_attn_kwargs` is also set to `True`, the following keys are returned as well:
+    - `"cu_seq_lens_q"` / `"cu_seq_lens_k"`: Cumulative sequence lengths of the packed sequences (int32).
+    - `"max_length_q"` / `"max_length_k"`: Length of the longest packed sequence, as a Python int.
 
     Args:
         pad_token_id (`int`):
@@ -105,6 +111,10 @@ class DataCollatorForLanguageModeling(DataCollatorMixin):
             generated accordingly and returned instead of the attention mask.
         pad_to_multiple_of (`int`, *optional*):
             If set, the sequences will be padded to a multiple of this value.
+        return_flash_attn_kwargs (`bool`, *optional*, defaults to `False`):
+            With `padding_free`, also return the sequence boundaries consumed by variable-length (flash) attention
+            kernels. They are computed here, on the host, so the model does not derive them from `position_ids`
+            on device.
         return_tensors (`str`, *optional*, defaults to `"pt"`):
             Type of Tensor to return. Only `"pt"` is currently supported.
 
@@ -139,8 +149,9 @@ class DataCollatorForLanguageModeling(DataCollatorMixin):
     >>> collator = DataCollatorForLanguageModeling(pad_token_id=0, padding_free=True)
     >>> collator(examples)
     {'input_ids': tensor([[ 1, 2, 3, 4, 5]]),
-     'position_ids': tensor([[0, 1, 2, 0, 1]]),
-     'labels': tensor([[1, 2, 3, 4, 5]])}
+     'labels': tensor([[-100, 2, 3, -100, 5]]),
+     'num_tokens': tensor(5),
+     'position_ids': tensor([[0, 1, 2, 0, 1]])}
     ```
     """
 
@@ -148,6 +159,7 @@ class DataCollatorForLanguageModeling(DataCollatorMixin):
     completion_only_loss: bool = True
     padding_free: bool = False
     pad_to_multiple_of: int | None = None
+    return_flash_attn_kwargs: bool = False
     return_tensors: str = "pt"
 
     def torch_call(self, examples: list[dict[str, Any]]) -> dict[str, Any]:
@@ -203,6 +215,7 @@ class DataCollatorForLanguageModeling(DataCollatorMixin):
             pad_to_multiple_of=self.pad_to_multiple_of,
         )
         if self.padding_free:
+            output["num_tokens"] = torch.tensor(input_ids[0].numel())
             output["position_ids"] = pad(
                 position_ids,
                 padding_value=0,
@@ -210,6 +223,10 @@ class DataCollatorForLanguageModeling(DataCollatorMixin):
                 pad_to_multiple_of=self.pad_to_multiple_of,
             )
             output["labels"][output["position_ids"] == 0] = -100
+            if self.return_flash_attn_kwargs:
+                output.update(
+                    self.get_flash_attn_kwargs_from_position_ids(output["position_ids"])
+                )
         else:
             output["attention_mask"] = pad(
                 attention_mask,
@@ -237,6 +254,38 @@ class DataCollatorForLanguageModeling(DataCollatorMixin):
             output["labels"][assistant_masks == 0] = -100
         return output
 
+    @staticmethod
+    def get_flash_attn_kwargs_from_position_ids(
+        position_ids: torch.Tensor,
+    ) -> dict[str, Any]:
+        """
+        Get the variable-length attention metadata of a packed row.
+
+        Every position equal to 0 starts a new sequence (padding added by `pad_to_multiple_of` therefore forms
+        sequences of length 1, which attend only to themselves).
+
+        Args:
+            position_ids (`torch.Tensor`):
+                Position IDs of shape `(1, total_length)`.
+
+        Return:
+            `dict[str, Any]`:
+                `cu_seq_lens_q`, `cu_seq_lens_k`, `max_length_q` and `max_length_k`, as expected by the flash
+                attention integration of transformers.
+        """
+        flat = position_ids.reshape(-1)
+        starts = (flat == 0).nonzero().reshape(-1)
+        cu_seq_lens = torch.cat(
+            [starts, torch.tensor([flat.numel()], dtype=starts.dtype)]
+        ).to(torch.int32)
+        max_length = int(cu_seq_lens.diff().max())
+        return {
+            "cu_seq_lens_q": cu_seq_lens,
+            "cu_seq_lens_k": cu_seq_lens,
+            "max_length_q": max_length,
+            "max_length_k": max_length,
+        }
+
     @staticmethod
     def get_position_ids_from_packed_seq_lengths(
         batch_seq_lengths: list[list[int]],
@@ -0,0 +1,138 @@
+import queue
+import threading
+from collections.abc import Iterable
+from typing import Any
+
+import torch
+
+
+def _map_tensors(obj: Any, fn) -> Any:
+    if isinstance(obj, torch.Tensor):
+        return fn(obj)
+    if isinstance(obj, dict):
+        return type(obj)({k: _map_tensors(v, fn) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_map_tensors(v, fn) for v in obj)
+    return obj
+
+
+def to_device(batch: Any, device: torch.device | str, pin_memory: bool = False) -> Any:
+    """Move the tensors of `batch` to `device`, pinning host tensors first."""
+    device = torch.device(device)
+
+    def _move(tensor: torch.Tensor) -> torch.Tensor:
+        if tensor.device == device:
+            return tensor
+        if pin_memory and tensor.device.type == "cpu" and not tensor.is_pinned():
+            tensor = tensor.pin_memory()
+        return tensor.to(device, non_blocking=True)
+
+    return _map_tensors(batch, _move)
+
+
+def to_host(batch: Any, pin_memory: bool = False) -> Any:
+    """Copy the tensors of `batch` to (optionally pinned) host memory."""
+
+    def _copy(tensor: torch.Tensor) -> torch.Tensor:
+        tensor = tensor.detach().cpu()
+        return tensor.pin_memory() if pin_memory else tensor
+
+    return _map_tensors(batch, _copy)
+
+
+class BatchPrefetcher:
+    """Keeps a bounded queue of ready batches filled from a background thread."""
+
+    def __init__(
+        self,
+        dataloader: Iterable,
+        device: torch.device | str,
+        num_batches: int = 2,
+        pin_memory: bool = True,
+        first_iterable: Iterable | None = None,
+    ):
+        self.dataloader = dataloader
+        self.device = torch.device(device)
+        self.pin_memory = pin_memory and self.device.type == "cuda"
+        self.stream = None
+        if self.device.type == "cuda":
+            self.stream = torch.cuda.Stream(device=self.device)
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, num_batches))
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._worker,
+            args=(first_iterable if first_iterable is not None else dataloader,),
+            name="batch-prefetcher",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _put(self, item: tuple) -> bool:
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, iterable: Iterable):
+        try:
+            if self.stream is not None:
+                # Copies issued by the dataloader itself (e.g. accelerate's device
+                # placement) also go to the side stream
+                torch.cuda.set_stream(self.stream)
+            iterator = iter(iterable)
+            while not self._stop.is_set():
+                new_epoch = False
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    iterator = iter(self.dataloader)
+                    batch = next(iterator)
+                    new_epoch = True
+
+                batch = to_device(batch, self.device, pin_memory=self.pin_memory)
+                event = None
+                if self.stream is not None:
+                    event = torch.cuda.Event()
+                    event.record(self.stream)
+
+                if not self._put((batch, new_epoch, event, None)):
+                    return
+        except Exception as e:  # noqa: BLE001
+            # Whatever the dataloader raises is re-raised by `get` on the training thread
+            self._put((None, False, None, e))
+
+    def _record_stream(self, obj: Any, stream):
+        if isinstance(obj, torch.Tensor) and obj.device.type == "cuda":
+            obj.record_stream(stream)
+        elif isinstance(obj, dict):
+            for v in obj.values():
+                self._record_stream(v, stream)
+        elif isinstance(obj, (list, tuple)):
+            for v in obj:
+                self._record_stream(v, stream)
+
+    def get(self) -> tuple[Any, bool]:
+        """Return the next batch and whether it starts a new epoch."""
+        batch, new_epoch, event, error = self.queue.get()
+        if error is not None:
+            raise error
+        if event is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(event)
+            # Tensors were allocated on the side stream; keep them alive for this one
+            self._record_stream(batch, current_stream)
+        return batch, new_epoch
+
+    def close(self):
+        """Stop the background thread and drop the queued batches."""
+        self._stop.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join()
@@ -0,0 +1,66 @@
+from collections.abc import Iterator, Sized
+from typing import Any
+
+import torch
+from torch.utils.data import Sampler
+
+
+class StatefulRandomSampler(Sampler[int]):
+    """Random sampler whose position can be restored in O(1).
+
+    Every epoch is a permutation seeded with `seed + epoch`, over global indices.
+    """
+
+    def __init__(self, data_source: Sized, seed: int = 0, shuffle: bool = True):
+        self.num_samples = len(data_source)
+        self.seed = seed
+        self.shuffle = shuffle
+        self.epoch = 0
+        self.start_index = 0
+
+    def _permutation(self, epoch: int) -> torch.Tensor:
+        if not self.shuffle:
+            return torch.arange(self.num_samples)
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + epoch)
+        return torch.randperm(self.num_samples, generator=generator)
+
+    def __iter__(self) -> Iterator[int]:
+        indices = self._permutation(self.epoch)[self.start_index :].tolist()
+        # The next iteration starts a fresh epoch from the beginning
+        self.epoch += 1
+        self.start_index = 0
+        yield from indices
+
+    def __len__(self) -> int:
+        return self.num_samples - self.start_index
+
+    def state_dict(self) -> dict[str, Any]:
+        return {
+            "seed": self.seed,
+            "epoch": self.epoch,
+            "start_index": self.start_index,
+        }
+
+    def load_state_dict(self, state_dict: dict[str, Any]):
+        """Start the next iteration at `start_index` of `epoch`."""
+        self.seed = state_dict.get("seed", self.seed)
+        self.epoch = state_dict["epoch"]
+        self.start_index = state_dict["start_index"]
+        if self.start_index >= self.num_samples:
+            self.epoch += 1
+            self.start_index = 0
+
+
+def find_stateful_sampler(
+    dataloader: torch.utils.data.DataLoader,
+) -> StatefulRandomSampler | None:
+    """Return the `StatefulRandomSampler` driving `dataloader`, if any."""
+    batch_sampler = getattr(dataloader, "batch_sampler", None)
+    for sampler in (
+        getattr(dataloader, "sampler", None),
+        getattr(batch_sampler, "sampler", None),
+    ):
+        if isinstance(sampler, StatefulRandomSampler):
+            return sampler
+    return None
@@ -0,0 +1,31 @@
+import torch
+from torch.utils.data import Dataset
+
+
+class SyntheticTokenDataset(Dataset):
+    """Deterministic in-memory random token sequences, for benchmarks and tests."""
+
+    def __init__(
+        self,
+        num_samples: int,
+        max_length: int,
+        min_length: int | None = None,
+        vocab_size: int = 32000,
+        seed: int = 0,
+    ):
+        self.num_samples = num_samples
+        self.max_length = max_length
+        self.min_length = max_length if min_length is None else min_length
+        self.vocab_size = vocab_size
+        self.seed = seed
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def __getitem__(self, index: int) -> dict[str, list[int]]:
+        generator = torch.Generator().manual_seed(self.seed * 1_000_003 + index)
+        length = int(
+            torch.randint(self.min_length, self.max_length + 1, (), generator=generator)
+        )
+        input_ids = torch.randint(1, self.vocab_size, (length,), generator=generator)
+        return {"input_ids": input_ids.tolist()}
@@ -0,0 +1,124 @@
+import math
+from dataclasses import dataclass
+from functools import partial
+
+import torch
+from torch.utils.checkpoint import checkpoint
+
+from pbd.pipelines.pretrain.steps.trainer.state import ModelConfig
+
+GB = 1024**3
+
+
+def estimate_layer_activation_bytes(
+    model_params: ModelConfig,
+    batch_size: int,
+    seq_len: int,
+    bytes_per_element: int = 2,
+    fused_attention: bool = True,
+) -> int:
+    """Activation bytes one decoder layer keeps for the backward pass."""
+    tokens = batch_size * seq_len
+    hidden = model_params.hidden_size
+    kv_dim = (
+        model_params.num_key_value_heads * hidden // model_params.num_attention_heads
+    )
+    intermediate = model_params.intermediate_size
+
+    attention = 4 * hidden + 2 * kv_dim  # norm in/out, Q, attention output, K, V
+    mlp = 2 * hidden + 4 * intermediate  # norm in/out, gate, up, act, product
+    elements = tokens * (attention + mlp)
+    if not fused_attention:
+        elements += 2 * batch_size * model_params.num_attention_heads * seq_len**2
+    return elements * bytes_per_element
+
+
+@dataclass
+class ActivationCheckpointPlan:
+    """Decoder layers to checkpoint and the activation memory expected with them."""
+
+    layers: list[int]
+    full_layer_bytes: int
+    checkpointed_layer_bytes: int
+    estimated_bytes: int
+    budget_bytes: int | None
+
+    @property
+    def fits(self) -> bool:
+        return self.budget_bytes is None or self.estimated_bytes <= self.budget_bytes
+
+
+def plan_activation_checkpointing(
+    num_layers: int,
+    full_layer_bytes: int,
+    checkpointed_layer_bytes: int,
+    budget_bytes: int | None = None,
+) -> ActivationCheckpointPlan:
+    """Choose the fewest (earliest) layers to checkpoint to fit `budget_bytes`."""
+
+    def estimate(k: int) -> int:
+        recompute = full_layer_bytes if k else 0
+        return (
+            (num_layers - k) * full_layer_bytes
+            + k * checkpointed_layer_bytes
+            + recompute
+        )
+
+    num_checkpointed = num_layers
+    if budget_bytes is not None:
+        saved_per_layer = full_layer_bytes - checkpointed_layer_bytes
+        if estimate(0) <= budget_bytes:
+            num_checkpointed = 0
+        elif saved_per_layer > 0:
+            # (L - k) * full + k * ckpt + full <= budget
+            needed = math.ceil(
+                (num_layers * full_layer_bytes + full_layer_bytes - budget_bytes)
+                / saved_per_layer
+            )
+            num_checkpointed = min(num_layers, max(1, needed))
+
+    return ActivationCheckpointPlan(
+        layers=list(range(num_checkpointed)),
+        full_layer_bytes=full_layer_bytes,
+        checkpointed_layer_bytes=checkpointed_layer_bytes,
+        estimated_bytes=estimate(num_checkpointed),
+        budget_bytes=budget_bytes,
+    )
+
+
+def find_decoder_layers(
+    model: torch.nn.Module, num_layers: int
+) -> torch.nn.ModuleList | None:
+    """Return the `ModuleList` holding the `num_layers` decoder layers of `model`."""
+    for module in model.modules():
+        if isinstance(module, torch.nn.ModuleList) and len(module) == num_layers:
+            return module
+    return None
+
+
+def apply_activation_checkpointing(
+    model: torch.nn.Module, plan: ActivationCheckpointPlan, num_layers: int
+):
+    """Enable non-reentrant activation checkpointing on the planned decoder layers."""
+    layers = find_decoder_layers(model, num_layers)
+    if layers is None:
+        raise ValueError(f"Could not find the {num_layers} decoder layers of the model")
+
+    for index in plan.layers:
+        layer = layers[index]
+        if hasattr(layer, "gradient_checkpointing"):
+            # transformers' GradientCheckpointingLayer: keeps module names and kwargs handling
+            layer.gradient_checkpointing = True
+            layer._gradient_checkpointing_func = partial(
+                checkpoint, use_reentrant=False
+            )
+        else:
+            from torch.distributed.algorithms._checkpoint.checkpoint_wrapper import (
+                checkpoint_wrapper,
+            )
+
+            layers[index] = checkpoint_wrapper(layer)
+
+    # A KV cache is useless in training and would be rebuilt by every recomputation
+    if plan.layers and hasattr(model, "config"):
+        model.config.use_cache = False
@@ -0,0 +1,145 @@
+from collections import deque
+
+import torch
+
+# Slots of the per-update flag tensor
+LOSS_NONFINITE, LOSS_SPIKE, GRAD_NONFINITE, GRAD_SPIKE = range(4)
+FLAG_NAMES = ("loss_nonfinite", "loss_spike", "grad_nonfinite", "grad_spike")
+
+
+class RunningStatistics:
+    """Exponential moving mean and variance of a scalar stream, kept on device."""
+
+    def __init__(self, decay: float, device: torch.device):
+        self.decay = decay
+        self.mean = torch.zeros((), dtype=torch.float32, device=device)
+        self.var = torch.zeros((), dtype=torch.float32, device=device)
+        self.count = torch.zeros((), dtype=torch.int64, device=device)
+        self.streak = torch.zeros((), dtype=torch.int64, device=device)
+
+    def zscore(self, x: torch.Tensor) -> torch.Tensor:
+        return (x - self.mean) / (self.var.sqrt() + 1e-6)
+
+    def update(self, x: torch.Tensor, accept: torch.Tensor):
+        decay = self.decay
+        delta = x - self.mean
+        first = self.count == 0
+        self.mean = torch.where(
+            accept, torch.where(first, x, self.mean + (1 - decay) * delta), self.mean
+        )
+        self.var = torch.where(
+            accept & ~first, decay * (self.var + (1 - decay) * delta.square()), self.var
+        )
+        self.count = self.count + accept.long()
+
+
+class AnomalyGuard:
+    """Flags non-finite or spiking losses and gradient norms without host syncs."""
+
+    def __init__(
+        self,
+        device: torch.device,
+        loss_zscore: float = 6.0,
+        grad_norm_zscore: float | None = 6.0,
+        ema_decay: float = 0.99,
+        warmup_steps: int = 100,
+        rollback_after: int = 3,
+        rollback_window: int = 100,
+        max_consecutive_spikes: int = 10,
+        expect_overflow: bool = False,
+    ):
+        self.loss_zscore = loss_zscore
+        self.grad_norm_zscore = grad_norm_zscore
+        self.warmup_steps = warmup_steps
+        self.rollback_after = rollback_after
+        self.rollback_window = rollback_window
+        self.max_consecutive_spikes = max_consecutive_spikes
+        self.expect_overflow = expect_overflow
+        self.loss_stats = RunningStatistics(ema_decay, device)
+        self.grad_norm_stats = RunningStatistics(ema_decay, device)
+        self.flags = torch.zeros(len(FLAG_NAMES), dtype=torch.int32, device=device)
+        # Steps of recent anomalous updates
+        self.recent: deque[int] = deque()
+        self.skipped_updates = 0
+        self.overflow_updates = 0
+        self.rollbacks = 0
+
+    def _check(
+        self,
+        x: torch.Tensor,
+        stats: RunningStatistics,
+        zscore: float | None,
+        nonfinite_slot: int,
+        spike_slot: int,
+    ):
+        x = x.detach().float().reshape(())
+        finite = torch.isfinite(x)
+        spike = torch.zeros_like(finite)
+        if zscore is not None:
+            above = (
+                finite & (stats.count >= self.warmup_steps) & (stats.zscore(x) > zscore)
+            )
+            stats.streak = torch.where(
+                above, stats.streak + 1, torch.zeros_like(stats.streak)
+            )
+            spike = above & (stats.streak <= self.max_consecutive_spikes)
+        self.flags[nonfinite_slot] += (~finite).int()
+        self.flags[spike_slot] += spike.int()
+        stats.update(x, finite & ~spike)
+
+    def check_loss(self, loss: torch.Tensor):
+        """Record whether a micro-batch loss is anomalous."""
+        self._check(loss, self.loss_stats, self.loss_zscore, LOSS_NONFINITE, LOSS_SPIKE)
+
+    def check_grad_norm(self, grad_norm: torch.Tensor):
+        """Record whether the pre-clip gradient norm of an update is anomalous."""
+        self._check(
+            grad_norm,
+            self.grad_norm_stats,
+            self.grad_norm_zscore,
+            GRAD_NONFINITE,
+            GRAD_SPIKE,
+        )
+
+    def sanitize(self, loss: torch.Tensor) -> torch.Tensor:
+        """`loss`, or the running mean when it is not finite."""
+        loss = loss.detach()
+        return torch.where(
+            torch.isfinite(loss), loss, self.loss_stats.mean.to(loss.dtype)
+        )
+
+    def record(self, flags: list[int], step: int) -> str:
+        """Decide what to do with the update whose reduced `flags` were read back."""
+        self.flags.zero_()
+        if not any(flags):
+            return "apply"
+        self.skipped_updates += 1
+        if (
+            self.expect_overflow
+            and flags[GRAD_NONFINITE]
+            and not any(c for i, c in enumerate(flags) if i != GRAD_NONFINITE)
+        ):
+            self.overflow_updates += 1
+            return "skip"
+        self.recent.append(step)
+        self._prune(step)
+        if len(self.recent) >= self.rollback_after:
+            self.recent.clear()
+            self.rollbacks += 1
+            return "rollback"
+        return "skip"
+
+    def _prune(self, step: int):
+        while self.recent and self.recent[0] <= step - self.rollback_window:
+            self.recent.popleft()
+
+    def is_healthy(self, step: int) -> bool:
+        """No anomaly within the rollback window before `step`."""
+        self._prune(step)
+        return not self.recent
+
+    @staticmethod
+    def describe(flags: list[int]) -> str:
+        return ", ".join(
+            f"{count} {name}" for name, count in zip(FLAG_NAMES, flags) if count
+        )
@@ -0,0 +1,49 @@
+import os
+from pathlib import Path
+
+import torch
+
+CACHE_ARTIFACTS_FILE = "compile_artifacts.bin"
+
+
+def setup_compile_cache(cache_dir: str | Path) -> bool:
+    """Persist compile caches in `cache_dir`; returns whether artifacts loaded."""
+    import torch._inductor.config as inductor_config
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(cache_dir / "inductor")
+    os.environ["TRITON_CACHE_DIR"] = str(cache_dir / "triton")
+    inductor_config.fx_graph_cache = True
+
+    artifacts = cache_dir / CACHE_ARTIFACTS_FILE
+    if artifacts.is_file() and hasattr(torch.compiler, "load_cache_artifacts"):
+        torch.compiler.load_cache_artifacts(artifacts.read_bytes())
+        return True
+    return False
+
+
+def save_compile_cache(cache_dir: str | Path) -> int | None:
+    """Write the artifacts compiled so far to `cache_dir`; returns bytes written."""
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return None
+    artifacts = torch.compiler.save_cache_artifacts()
+    if artifacts is None:
+        return None
+
+    data, _ = artifacts
+    path = Path(cache_dir) / CACHE_ARTIFACTS_FILE
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def compile_counters() -> dict[str, int]:
+    """Graphs compiled and graph breaks hit by dynamo in this process so far."""
+    from torch._dynamo.utils import counters
+
+    return {
+        "graphs": counters["stats"]["unique_graphs"],
+        "graph_breaks": sum(counters["graph_break"].values()),
+    }
@@ -0,0 +1,66 @@
+import torch
+
+from pbd.pipelines.pretrain.steps.trainer.state import ModelConfig
+
+# Dense (non-sparse) bf16/fp16 tensor-core peak FLOP/s per device, matched against
+# `torch.cuda.get_device_name()`. Order matters: more specific names first.
+PEAK_FLOPS_BY_DEVICE = [
+    ("H200", 989e12),
+    ("H100 PCIe", 756e12),
+    ("H100", 989e12),
+    ("A100", 312e12),
+    ("L40S", 362e12),
+    ("L40", 181e12),
+    ("L4", 121e12),
+    ("A10", 125e12),
+    ("V100", 125e12),
+]
+
+
+def mlp_matrix_params(model: torch.nn.Module) -> int | None:
+    """Weight-matrix parameters of the first decoder layer's MLP, or None if not found.
+
+    Counts gate/up/down projections of gated MLPs and the two matrices of GPT-2 alike.
+    """
+    for name, module in model.named_modules():
+        if name.rsplit(".", 1)[-1] == "mlp":
+            return sum(p.numel() for p in module.parameters() if p.dim() == 2)
+    return None
+
+
+def estimate_flops_per_token(
+    model_params: ModelConfig,
+    seq_len: int,
+    vocab_size: int | None = None,
+    mlp_params: int | None = None,
+) -> float:
+    """Training FLOPs per token of a decoder-only transformer (PaLM accounting).
+
+    `mlp_params` are the MLP matrix parameters of one layer, as counted by
+    `mlp_matrix_params`; a gated gate/up/down MLP is assumed when unset.
+    """
+    hidden = model_params.hidden_size
+    head_dim = hidden // model_params.num_attention_heads
+    kv_dim = model_params.num_key_value_heads * head_dim
+
+    # q/o projections and k/v projections
+    attention_params = 2 * hidden * hidden + 2 * hidden * kv_dim
+    if mlp_params is None:
+        mlp_params = 3 * hidden * model_params.intermediate_size
+    matmul_params = model_params.num_hidden_layers * (attention_params + mlp_params)
+    if vocab_size:
+        matmul_params += hidden * vocab_size
+
+    attention_flops = 12 * model_params.num_hidden_layers * hidden * seq_len
+    return 6 * matmul_params + attention_flops
+
+
+def device_peak_flops(device: torch.device) -> float | None:
+    """Best-effort peak FLOP/s of `device`, or None when unknown (e.g. CPU)."""
+    if device.type != "cuda":
+        return None
+    name = torch.cuda.get_device_name(device)
+    for pattern, flops in PEAK_FLOPS_BY_DEVICE:
+        if pattern in name:
+            return flops
+    return None
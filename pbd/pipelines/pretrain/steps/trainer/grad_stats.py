@@ -0,0 +1,140 @@
+import re
+
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+
+_LAYER_PATTERN = re.compile(r"(?:^|\.)layers\.(\d+)\.")
+
+
+def layer_group_name(param_name: str) -> str:
+    """Decoder layer (`layer_3`) or top-level module of a parameter name."""
+    match = _LAYER_PATTERN.search(param_name)
+    if match:
+        return f"layer_{match.group(1)}"
+    parts = param_name.removeprefix("module.").removeprefix("_orig_mod.").split(".")
+    if parts[0] == "model" and len(parts) > 2:
+        return parts[1]
+    return parts[0]
+
+
+class GradientStatistics:
+    """Global and grouped gradient norms computed with foreach kernels."""
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        optimizer: torch.optim.Optimizer | None = None,
+        every: int = 100,
+        per_layer: bool = True,
+    ):
+        self.every = every
+        named = [(n, p) for n, p in model.named_parameters() if p.requires_grad]
+        self.params = [p for _, p in named]
+
+        group_names: list[str] = []
+        group_ids: list[list[int]] = [[] for _ in self.params]
+        if per_layer:
+            index = {}
+            for i, (name, _) in enumerate(named):
+                key = layer_group_name(name)
+                if key not in index:
+                    index[key] = len(group_names)
+                    group_names.append(key)
+                group_ids[i].append(index[key])
+        if optimizer is not None:
+            position = {id(p): i for i, p in enumerate(self.params)}
+            for group in optimizer.param_groups:
+                if "name" not in group:
+                    continue
+                group_index = len(group_names)
+                group_names.append(f"group_{group['name']}")
+                for p in group["params"]:
+                    if id(p) in position:
+                        group_ids[position[id(p)]].append(group_index)
+
+        self.group_names = group_names
+        # (param index, group index) pairs for a single index_add_ over all groups
+        self._param_index = [i for i, ids in enumerate(group_ids) for _ in ids]
+        self._group_index = [g for ids in group_ids for g in ids]
+        self._index_tensors: tuple[torch.Tensor, torch.Tensor] | None = None
+        self._pending: list[tuple[tuple[str, ...], torch.Tensor]] = []
+
+    def should_compute(self, step: int) -> bool:
+        return self.every > 0 and step % self.every == 0
+
+    def _grads(self) -> tuple[list[int], list[torch.Tensor]]:
+        indices, grads = [], []
+        for i, p in enumerate(self.params):
+            if p.grad is not None:
+                indices.append(i)
+                grads.append(p.grad)
+        return indices, grads
+
+    def _param_norms(
+        self, indices: list[int], grads: list[torch.Tensor]
+    ) -> torch.Tensor:
+        """Norm of every parameter gradient (0 when missing) as one tensor."""
+        device = grads[0].device
+        norms = torch.stack(
+            [n.to(device, torch.float32) for n in torch._foreach_norm(grads, 2.0)]
+        )
+        if len(indices) == len(self.params):
+            return norms
+        full = torch.zeros(len(self.params), device=device)
+        full[torch.tensor(indices, device=device)] = norms
+        return full
+
+    def _group_norms(self, param_norms: torch.Tensor) -> torch.Tensor:
+        device = param_norms.device
+        if self._index_tensors is None or self._index_tensors[0].device != device:
+            self._index_tensors = (
+                torch.tensor(self._param_index, dtype=torch.long, device=device),
+                torch.tensor(self._group_index, dtype=torch.long, device=device),
+            )
+        param_index, group_index = self._index_tensors
+        squares = torch.zeros(len(self.group_names), device=device)
+        squares.index_add_(0, group_index, param_norms[param_index].square())
+        return squares.sqrt()
+
+    def compute(
+        self, grouped: bool = True, max_norm: float | None = None
+    ) -> torch.Tensor | None:
+        """Global gradient norm (and grouped norms), optionally clipped."""
+        indices, grads = self._grads()
+        if not grads:
+            return None
+
+        param_norms = self._param_norms(indices, grads)
+        total = param_norms.square().sum().sqrt()
+
+        if max_norm is not None:
+            # Same formula as torch.nn.utils.clip_grad_norm_, without re-reading the gradients
+            clip_coef = torch.clamp(max_norm / (total + 1e-6), max=1.0)
+            torch._foreach_mul_(grads, clip_coef)
+
+        names: tuple[str, ...] = ("grad_norm",)
+        values = [total.unsqueeze(0)]
+        if grouped and self.group_names:
+            names += tuple(f"grad_norm/{name}" for name in self.group_names)
+            values.append(self._group_norms(param_norms))
+        self._pending.append((names, torch.cat(values)))
+        return total
+
+    def collect(self, metrics: MetricRunner):
+        """Read back pending norms in one transfer and push them into `metrics`."""
+        if not self._pending:
+            return
+        flat = torch.cat([values for _, values in self._pending]).tolist()
+        offset = 0
+        for names, values in self._pending:
+            for name, value in zip(names, flat[offset : offset + len(values)]):
+                metrics.update(name, value)
+                if name == "grad_norm":
+                    metrics.observe(name, value)
+            offset += len(values)
+        self._pending.clear()
+
+    def reset_metrics(self, metrics: MetricRunner):
+        """Reset the averaged grouped norms at the end of a log window."""
+        metrics.reset(*(f"grad_norm/{name}" for name in self.group_names))
@@ -0,0 +1,118 @@
+import inspect
+
+import torch
+
+from pbd.pipelines.pretrain.steps.trainer.state import OptimizerConfig
+
+OPTIMIZERS: dict[str, type[torch.optim.Optimizer]] = {
+    "adamw": torch.optim.AdamW,
+    "adam": torch.optim.Adam,
+    "sgd": torch.optim.SGD,
+}
+
+# Constructor flags of each implementation, fastest first
+IMPLEMENTATIONS = {
+    "fused": {"fused": True},
+    "foreach": {"foreach": True},
+    "single_tensor": {"foreach": False},
+}
+
+
+def build_param_groups(
+    model: torch.nn.Module,
+    weight_decay: float,
+    embedding_weight_decay: float = 0.0,
+) -> list[dict]:
+    """Split trainable parameters into `decay`, `no_decay` and `embeddings`."""
+    embedding_ids = {
+        id(module.weight)
+        for module in model.modules()
+        if isinstance(module, torch.nn.Embedding)
+    }
+    groups = {
+        "decay": {"name": "decay", "params": [], "weight_decay": weight_decay},
+        "no_decay": {"name": "no_decay", "params": [], "weight_decay": 0.0},
+        "embeddings": {
+            "name": "embeddings",
+            "params": [],
+            "weight_decay": embedding_weight_decay,
+        },
+    }
+    # named_parameters() yields tied parameters once
+    for _, param in model.named_parameters():
+        if not param.requires_grad:
+            continue
+        if id(param) in embedding_ids:
+            groups["embeddings"]["params"].append(param)
+        elif param.ndim < 2:
+            groups["no_decay"]["params"].append(param)
+        else:
+            groups["decay"]["params"].append(param)
+    return [group for group in groups.values() if group["params"]]
+
+
+def _optimizer_kwargs(config: OptimizerConfig) -> dict:
+    if config.name.lower() == "sgd":
+        return {"lr": config.lr, "momentum": config.momentum}
+    return {"lr": config.lr, "betas": tuple(config.betas), "eps": config.eps}
+
+
+def _probe(
+    optimizer_class: type[torch.optim.Optimizer],
+    kwargs: dict,
+    device: torch.device,
+    dtypes: set[torch.dtype],
+):
+    """Construct and step a throwaway optimizer over 1-element tensors on `device`."""
+    params = [
+        torch.zeros(1, dtype=dtype, device=device, requires_grad=True)
+        for dtype in dtypes
+    ]
+    for param in params:
+        param.grad = torch.zeros_like(param)
+    optimizer_class(params, **kwargs).step()
+
+
+def build_optimizer(
+    model: torch.nn.Module,
+    config: OptimizerConfig,
+    device: torch.device | None = None,
+) -> tuple[torch.optim.Optimizer, str]:
+    """Create the optimizer named by `config.name` over named parameter groups.
+
+    The implementation is probed on `device` when given, i.e. where the parameters
+    will live once prepared, rather than where they are now.
+    """
+    name = config.name.lower()
+    if name not in OPTIMIZERS:
+        raise ValueError(
+            f"Unknown optimizer '{config.name}'. Available: {', '.join(OPTIMIZERS)}"
+        )
+    optimizer_class = OPTIMIZERS[name]
+    supported = inspect.signature(optimizer_class).parameters
+    param_groups = build_param_groups(
+        model, config.weight_decay, config.embedding_weight_decay
+    )
+    kwargs = _optimizer_kwargs(config)
+    dtypes = {param.dtype for group in param_groups for param in group["params"]}
+
+    candidates = (
+        IMPLEMENTATIONS if config.implementation == "auto" else (config.implementation,)
+    )
+    error: Exception | None = None
+    for implementation in candidates:
+        flags = IMPLEMENTATIONS[implementation]
+        if not all(flag in supported for flag in flags):
+            continue
+        try:
+            if device is not None:
+                # Missing kernels may only surface on the first step
+                _probe(optimizer_class, {**kwargs, **flags}, device, dtypes)
+            # The constructors reject unsupported devices / dtypes up front
+            return optimizer_class(param_groups, **kwargs, **flags), implementation
+        except (RuntimeError, ValueError) as e:
+            error = e
+    raise RuntimeError(
+        f"No {config.implementation} implementation of '{config.name}' "
+        "supports these parameters"
+    ) from error
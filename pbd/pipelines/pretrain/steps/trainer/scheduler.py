@@ -1,7 +1,12 @@
 import math
+from collections.abc import Callable
 from functools import partial
+
+import numpy as np
 from torch.optim import Optimizer
-from torch.optim.lr_scheduler import LambdaLR
+from torch.optim.lr_scheduler import LambdaLR, LRScheduler
+
+from pbd.pipelines.pretrain.steps.trainer.state import SchedulerConfig
 
 
 def _get_cosine_schedule_with_warmup_lr_lambda(
@@ -63,3 +68,146 @@ def get_cosine_schedule_with_warmup(
         num_cycles=num_cycles,
     )
     return LambdaLR(optimizer, lr_lambda, last_epoch)
+
+
+def _warmup_and_progress(
+    num_training_steps: int, warmup_steps: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Step indices, linear warmup factors and post-warmup progress in [0, 1]."""
+    steps = np.arange(num_training_steps + 1, dtype=np.float64)
+    warmup = steps / max(1, warmup_steps)
+    progress = np.clip(
+        (steps - warmup_steps) / max(1, num_training_steps - warmup_steps), 0.0, 1.0
+    )
+    return steps, warmup, progress
+
+
+def _cosine(num_training_steps: int, config: SchedulerConfig) -> np.ndarray:
+    steps, warmup, progress = _warmup_and_progress(
+        num_training_steps, config.warmup_steps
+    )
+    decay = config.min_ratio + 0.5 * (1 - config.min_ratio) * (
+        np.cos(np.pi * progress**config.theta / config.num_cycles) + 1
+    )
+    return np.where(steps < config.warmup_steps, warmup, decay)
+
+
+def _cosine_with_restarts(
+    num_training_steps: int, config: SchedulerConfig
+) -> np.ndarray:
+    steps, warmup, progress = _warmup_and_progress(
+        num_training_steps, config.warmup_steps
+    )
+    cycle_progress = (config.num_cycles * progress) % 1.0
+    decay = config.min_ratio + 0.5 * (1 - config.min_ratio) * (
+        np.cos(np.pi * cycle_progress) + 1
+    )
+    decay = np.where(progress >= 1.0, config.min_ratio, decay)
+    return np.where(steps < config.warmup_steps, warmup, decay)
+
+
+def _linear(num_training_steps: int, config: SchedulerConfig) -> np.ndarray:
+    steps, warmup, progress = _warmup_and_progress(
+        num_training_steps, config.warmup_steps
+    )
+    decay = config.min_ratio + (1 - config.min_ratio) * (1 - progress)
+    return np.where(steps < config.warmup_steps, warmup, decay)
+
+
+def _inverse_sqrt(num_training_steps: int, config: SchedulerConfig) -> np.ndarray:
+    steps, warmup, _ = _warmup_and_progress(num_training_steps, config.warmup_steps)
+    decay = np.sqrt(max(1, config.warmup_steps) / np.maximum(steps, 1.0))
+    decay = np.maximum(decay, config.min_ratio)
+    return np.where(steps < config.warmup_steps, warmup, decay)
+
+
+def _warmup_stable_decay(
+    num_training_steps: int, config: SchedulerConfig
+) -> np.ndarray:
+    steps, warmup, _ = _warmup_and_progress(num_training_steps, config.warmup_steps)
+    decay_steps = max(1, round(config.decay_ratio * num_training_steps))
+    decay_start = max(config.warmup_steps, num_training_steps - decay_steps)
+    progress = np.clip((steps - decay_start) / decay_steps, 0.0, 1.0)
+    if config.decay_shape == "cosine":
+        shape = 0.5 * (np.cos(np.pi * progress) + 1)
+    elif config.decay_shape == "sqrt":
+        shape = 1 - np.sqrt(progress)
+    else:
+        shape = 1 - progress
+    decay = config.min_ratio + (1 - config.min_ratio) * shape
+    return np.where(steps < config.warmup_steps, warmup, decay)
+
+
+def _constant(num_training_steps: int, config: SchedulerConfig) -> np.ndarray:
+    steps, warmup, _ = _warmup_and_progress(num_training_steps, config.warmup_steps)
+    return np.where(steps < config.warmup_steps, warmup, 1.0)
+
+
+SCHEDULES: dict[str, Callable[[int, SchedulerConfig], np.ndarray]] = {
+    "cosine": _cosine,
+    "cosine_with_restarts": _cosine_with_restarts,
+    "wsd": _warmup_stable_decay,
+    "linear": _linear,
+    "inverse_sqrt": _inverse_sqrt,
+    "constant": _constant,
+}
+
+
+def build_schedule_table(
+    config: SchedulerConfig, num_training_steps: int
+) -> np.ndarray:
+    """LR multipliers of `config` for every update in `[0, num_training_steps]`."""
+    if config.name not in SCHEDULES:
+        raise ValueError(
+            f"Unknown scheduler '{config.name}'. Available: {', '.join(SCHEDULES)}"
+        )
+    return SCHEDULES[config.name](num_training_steps, config)
+
+
+class TableLR(LRScheduler):
+    """Learning-rate scheduler reading precomputed multipliers from a table."""
+
+    def __init__(
+        self,
+        optimizer: Optimizer,
+        table: np.ndarray,
+        steps_per_update: int = 1,
+        last_epoch: int = -1,
+    ):
+        self.table = np.asarray(table, dtype=np.float64)
+        self.steps_per_update = steps_per_update
+        super().__init__(optimizer, last_epoch)
+
+    def get_lr(self) -> list[float]:
+        index = min(
+            max(self.last_epoch, 0) // self.steps_per_update, len(self.table) - 1
+        )
+        factor = float(self.table[index])
+        return [base_lr * factor for base_lr in self.base_lrs]
+
+    def state_dict(self) -> dict:
+        return {
+            key: value
+            for key, value in self.__dict__.items()
+            if key not in ("optimizer", "table")
+        }
+
+    def load_state_dict(self, state_dict: dict):
+        state_dict = dict(state_dict)
+        # Resume at the same optimizer update even if the number of processes changed
+        saved_steps_per_update = state_dict.pop("steps_per_update", 1)
+        updates = max(state_dict.get("last_epoch", 0), 0) // saved_steps_per_update
+        state_dict["last_epoch"] = updates * self.steps_per_update
+        self.__dict__.update(state_dict)
+
+
+def get_scheduler(
+    optimizer: Optimizer,
+    config: SchedulerConfig,
+    num_training_steps: int,
+    steps_per_update: int = 1,
+    last_epoch: int = -1,
+) -> TableLR:
+    """Learning-rate schedule named by `config.name`, precomputed as a table."""
+    table = build_schedule_table(config, num_training_steps)
+    return TableLR(optimizer, table, steps_per_update, last_epoch)
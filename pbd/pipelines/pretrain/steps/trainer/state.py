@@ -1,9 +1,9 @@
-import pydantic
-import yaml
-from typing import Optional
 from enum import StrEnum
-from typing_extensions import Self
+from typing import Literal, Self
+
+import pydantic
 import transformers
+import yaml
 
 
 class TrainerSteps(StrEnum):
@@ -15,16 +15,33 @@ class TrainerSteps(StrEnum):
 
 
 class OptimizerConfig(pydantic.BaseModel):
+    # adamw, adam or sgd
     name: str
     lr: float
     weight_decay: float = 0.0
+    # Weight decay of embedding tables (and an LM head tied to them)
+    embedding_weight_decay: float = 0.0
     betas: tuple = (0.9, 0.999)
     eps: float = 1e-8
+    # SGD only
+    momentum: float = 0.9
+    # "auto" picks fused, then foreach, then single_tensor
+    implementation: Literal["auto", "fused", "foreach", "single_tensor"] = "auto"
 
 
 class SchedulerConfig(pydantic.BaseModel):
+    # cosine, cosine_with_restarts, wsd, linear, inverse_sqrt or constant
     name: str
+    # Step counts are in optimizer updates
     warmup_steps: int
+    # Final learning rate as a fraction of the peak
+    min_ratio: float = 0.0
+    # Cosine progress exponent (progress**theta) and number of cycles / restarts
+    theta: float = 1.0
+    num_cycles: float = 1.0
+    # Warmup-stable-decay: fraction of training spent decaying, and the decay shape
+    decay_ratio: float = 0.1
+    decay_shape: Literal["linear", "cosine", "sqrt"] = "linear"
 
 
 class AcceleratorConfig(pydantic.BaseModel):
@@ -32,10 +49,103 @@ class AcceleratorConfig(pydantic.BaseModel):
     mixed_precision: str = "fp16"
 
 
+class CheckpointConfig(pydantic.BaseModel):
+    # Write checkpoints on a background thread; training only waits for the host copy
+    async_save: bool = True
+    # "torch": single pickle written by the main process.
+    # "sharded": safetensors shards written by every process plus a JSON index.
+    format: Literal["torch", "sharded"] = "torch"
+    # Storage of optimizer moments: reduced precision or block-quantized int8
+    # (second moments always stay in bf16); "none" keeps them exact
+    optimizer_encoding: Literal["none", "bf16", "fp16", "int8"] = "none"
+    quant_block_size: int = 256
+    # Lossless zstd compression of "torch" checkpoints (requires `zstandard`)
+    zstd_level: int | None = None
+
+
+class FaultToleranceConfig(pydantic.BaseModel):
+    # Frequent in-memory snapshots replicated to a peer rank's host memory
+    enabled: bool = False
+    # Optimizer updates between two snapshots
+    snapshot_every: int = 50
+    # Node-local tmpfs holding this rank's snapshot and the one of its peer
+    directory: str = "/dev/shm/pbd_snapshots"
+    # Snapshots are kept per run; defaults to a hash of the model, optimizer,
+    # scheduler and seed settings
+    run_id: str | None = None
+
+
+class AnomalyConfig(pydantic.BaseModel):
+    # Skip updates with a non-finite or spiking loss / gradient norm, and roll back to
+    # an in-memory snapshot of the last healthy state when anomalies repeat
+    enabled: bool = False
+    # Spike thresholds in standard deviations above the running mean; a None gradient
+    # norm threshold only checks that the norm is finite
+    loss_zscore: float = 6.0
+    grad_norm_zscore: float | None = 6.0
+    ema_decay: float = 0.99
+    # Healthy values seen before spikes are flagged
+    warmup_steps: int = 100
+    # Roll back after `rollback_after` anomalous updates within `rollback_window` steps;
+    # the data consumed since the snapshot is skipped
+    rollback_after: int = 3
+    rollback_window: int = 100
+    # Spikes in a row after which the new level is adopted instead of rejected
+    max_consecutive_spikes: int = 10
+    # Steps between host snapshots of the training state (taken while healthy)
+    snapshot_every: int = 100
+    # Stop training after this many rollbacks
+    max_rollbacks: int = 5
+
+
+class CompileConfig(pydantic.BaseModel):
+    enabled: bool = False
+    backend: str = "inductor"
+    mode: str | None = None
+    fullgraph: bool = False
+    dynamic: bool | None = False
+    # Also compile the next-token loss (computed from logits instead of inside the model)
+    compile_loss: bool = False
+    # Run one forward/backward on a batch of the training shape before training
+    warmup: bool = True
+    # Compile the warm-up for any sequence length, so padded or packed batches of other
+    # lengths reuse its graph instead of recompiling; disable for fixed-length inputs to
+    # keep static kernels
+    dynamic_seq_len: bool = True
+    # Persistent volume for inductor/triton caches and saved compile artifacts
+    cache_dir: str | None = None
+
+
+class ActivationCheckpointingConfig(pydantic.BaseModel):
+    enabled: bool = False
+    # Activation memory budget per process; None checkpoints every decoder layer
+    memory_budget_gb: float | None = None
+
+
+class GradientStatsConfig(pydantic.BaseModel):
+    enabled: bool = True
+    # Per-layer and per-parameter-group norms are computed every `every` optimizer steps
+    every: int = 100
+    per_layer: bool = True
+
+
 class WandbConfig(pydantic.BaseModel):
     project: str
-    name: Optional[str] = None
+    name: str | None = None
     log_model: bool = False
+    # Metrics are buffered in memory and flushed by a background thread
+    flush_interval: float = 10.0
+    buffer_size: int = 10000
+    # "file" writes JSON lines to `log_file` instead of W&B (offline runs, tests)
+    sink: Literal["wandb", "file"] = "wandb"
+    log_file: str = "metrics.jsonl"
+
+
+class PrometheusConfig(pydantic.BaseModel):
+    # Address of the `/metrics` endpoint served by PrometheusCallback (the image
+    # exposes the default port)
+    host: str = "0.0.0.0"
+    port: int = 9400
 
 
 class ModelConfig(pydantic.BaseModel):
@@ -50,6 +160,9 @@ class ModelConfig(pydantic.BaseModel):
     intermediate_size: int
     max_position_embeddings: int
     tie_word_embeddings: bool
+    # transformers attention backend, e.g. "sdpa" or "flash_attention_2" (needed for
+    # packed sequences); None lets transformers choose
+    attn_implementation: str | None = None
 
     @pydantic.model_validator(mode="after")
     def validate_model_and_config_name(self) -> Self:
@@ -102,14 +215,58 @@ class TrainerState(pydantic.BaseModel):
     model_params: ModelConfig
     optimizer: OptimizerConfig
     scheduler: SchedulerConfig
-    wandb_config: Optional[WandbConfig] = None
+    wandb_config: WandbConfig | None = None
+    prometheus: PrometheusConfig = PrometheusConfig()
     max_steps: int
     batch_size: int
     accelerate_config: AcceleratorConfig
+    checkpoint: CheckpointConfig = CheckpointConfig()
+    fault_tolerance: FaultToleranceConfig = FaultToleranceConfig()
+    anomaly: AnomalyConfig = AnomalyConfig()
+    compile_config: CompileConfig = CompileConfig()
+    activation_checkpointing: ActivationCheckpointingConfig = (
+        ActivationCheckpointingConfig()
+    )
     log_every: int
     gradient_clip_value: float = 1.0
+    # Clip by global gradient norm instead of by value when set
+    gradient_clip_norm: float | None = None
+    gradient_stats: GradientStatsConfig = GradientStatsConfig()
     eval_every: int = 1000
+    # Maximum number of validation batches per process (None evaluates the full shard)
+    eval_max_batches: int | None = None
+    # Keep collated validation batches in (pinned) host memory between evaluations
+    eval_cache: bool = False
     seed: int = 42
+    # Keep loss/token accumulators and the finite-check flag on device, reading
+    # them back only at log_every boundaries. Updates with a non-finite loss are
+    # skipped on device by fused optimizers, and applied with zero gradients otherwise.
+    sync_free_metrics: bool = False
+    # Number of batches prepared ahead by a background thread (0 disables prefetching);
+    # not supported with gradient accumulation
+    prefetch_batches: int = 0
+    # Per-phase step timers (CUDA events on GPU), reported as p50/p95/max windows
+    step_timing: bool = True
+    # Batches are packed (padding-free) rows with position_ids and collator labels; the
+    # model must use a variable-length attention kernel such as flash_attention_2
+    packed_sequences: bool = False
+    # Sequence length used for FLOPs accounting (defaults to max_position_embeddings)
+    seq_len: int | None = None
+    # Peak FLOP/s of one device for MFU; inferred from the GPU name when unset
+    peak_flops_per_device: float | None = None
+
+    @pydantic.model_validator(mode="after")
+    def validate_prefetching(self) -> Self:
+        # accelerate flags the end of the dataloader when the prefetch thread reaches it,
+        # batches ahead of training, and would sync gradients on the wrong micro-batch
+        if (
+            self.prefetch_batches > 0
+            and self.accelerate_config.gradient_accumulation_steps > 1
+        ):
+            raise ValueError(
+                "prefetch_batches > 0 is not supported with gradient_accumulation_steps > 1"
+            )
+        return self
 
     @classmethod
     def from_yaml(cls, path: str) -> "TrainerState":
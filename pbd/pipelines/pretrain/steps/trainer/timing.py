@@ -0,0 +1,91 @@
+import time
+from contextlib import contextmanager
+
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+
+
+class StepTimer:
+    """Per-phase timers for the training loop, read back at log boundaries."""
+
+    def __init__(
+        self,
+        metrics: MetricRunner,
+        device: torch.device | str,
+        enabled: bool = True,
+        max_pending: int = 8192,
+    ):
+        self.metrics = metrics
+        self.enabled = enabled
+        self.use_events = enabled and torch.device(device).type == "cuda"
+        self.max_pending = max_pending
+        self._step = 0
+        self._pending: list[tuple] = []
+        self._event_pool: list[torch.cuda.Event] = []
+
+    def _event(self) -> "torch.cuda.Event":
+        event = (
+            self._event_pool.pop()
+            if self._event_pool
+            else torch.cuda.Event(enable_timing=True)
+        )
+        event.record()
+        return event
+
+    @contextmanager
+    def phase(self, name: str, device: bool = True):
+        """Time the enclosed block as phase `name`; `device=False` times on host."""
+        if not self.enabled:
+            yield
+            return
+
+        start_event: torch.cuda.Event | None = None
+        if device and self.use_events:
+            start_event = self._event()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            end_event = self._event() if start_event is not None else None
+            self._pending.append((self._step, name, elapsed, start_event, end_event))
+
+    def step(self):
+        """Mark the end of a training step."""
+        self._step += 1
+        if len(self._pending) >= self.max_pending:
+            self.collect()
+
+    def collect(self):
+        """Resolve pending timings into the `time/<phase>` metric windows."""
+        if not self._pending:
+            return
+
+        last_event = next(
+            (entry[4] for entry in reversed(self._pending) if entry[4] is not None),
+            None,
+        )
+        if last_event is not None:
+            last_event.synchronize()
+
+        totals: dict[tuple[int, str], float] = {}
+        for step, name, elapsed, start_event, end_event in self._pending:
+            if start_event is not None:
+                elapsed = start_event.elapsed_time(end_event) / 1000
+                self._event_pool.extend((start_event, end_event))
+            totals[(step, name)] = totals.get((step, name), 0.0) + elapsed
+        self._pending.clear()
+
+        for (_, name), elapsed in totals.items():
+            self.metrics.observe(f"time/{name}", elapsed)
+
+    def summary(self, quantiles: tuple[int, ...] = (50, 95)) -> dict[str, list[float]]:
+        """Return the requested percentiles (in seconds) of every phase window."""
+        return {
+            name.removeprefix("time/"): [
+                self.metrics.get_percentile(name, q) for q in quantiles
+            ]
+            for name in self.metrics.windows
+            if name.startswith("time/")
+        }
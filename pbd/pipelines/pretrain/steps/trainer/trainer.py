@@ -1,14 +1,69 @@
-from accelerate import Accelerator
-from accelerate.utils import set_seed
-from accelerate.logging import get_logger
-import typing as T
+import hashlib
+import logging
+import math
 import time
+import typing as T
+from functools import partial
+from pathlib import Path
+
 import torch
-from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+from accelerate import Accelerator
+from accelerate.logging import get_logger
+from accelerate.utils import DistributedType, set_seed
+
 from pbd.pipelines.pretrain.steps.callbacks.base import Callback
-import pbd.pipelines.pretrain.steps.trainer.state as state
-from pathlib import Path
-import logging
+from pbd.pipelines.pretrain.steps.callbacks.dispatch import CallbackDispatcher
+from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+from pbd.pipelines.pretrain.steps.checkpoint.compression import (
+    decode_optimizer_state,
+    encode_optimizer_state,
+    load_torch_checkpoint,
+)
+from pbd.pipelines.pretrain.steps.checkpoint.replicated import PeerSnapshotStore
+from pbd.pipelines.pretrain.steps.checkpoint.sharded import (
+    ShardedCheckpointReader,
+    build_shard,
+    clear_checkpoint,
+    is_sharded_checkpoint,
+    write_shard,
+)
+from pbd.pipelines.pretrain.steps.checkpoint.writer import (
+    AsyncCheckpointWriter,
+    atomic_torch_save,
+)
+from pbd.pipelines.pretrain.steps.prepare_data.data_collator import (
+    DataCollatorForLanguageModeling,
+)
+from pbd.pipelines.pretrain.steps.prepare_data.prefetcher import (
+    BatchPrefetcher,
+    to_device,
+    to_host,
+)
+from pbd.pipelines.pretrain.steps.prepare_data.sampler import find_stateful_sampler
+from pbd.pipelines.pretrain.steps.trainer import state
+from pbd.pipelines.pretrain.steps.trainer.activation_checkpointing import (
+    GB,
+    ActivationCheckpointPlan,
+    apply_activation_checkpointing,
+    estimate_layer_activation_bytes,
+    plan_activation_checkpointing,
+)
+from pbd.pipelines.pretrain.steps.trainer.anomaly import AnomalyGuard
+from pbd.pipelines.pretrain.steps.trainer.compile import (
+    compile_counters,
+    save_compile_cache,
+    setup_compile_cache,
+)
+from pbd.pipelines.pretrain.steps.trainer.flops import (
+    device_peak_flops,
+    estimate_flops_per_token,
+    mlp_matrix_params,
+)
+from pbd.pipelines.pretrain.steps.trainer.grad_stats import GradientStatistics
+from pbd.pipelines.pretrain.steps.trainer.loss import causal_lm_loss
+from pbd.pipelines.pretrain.steps.trainer.optimizer import build_optimizer
+from pbd.pipelines.pretrain.steps.trainer.scheduler import TableLR, get_scheduler
+from pbd.pipelines.pretrain.steps.trainer.timing import StepTimer
 
 logging.basicConfig(level=logging.INFO)
 
@@ -23,7 +78,7 @@ class PretrainTrainer:
     def __init__(
         self,
         config_path: str,
-        callbacks: T.Optional[list[Callback]] = None,
+        callbacks: list[Callback] | None = None,
     ):
         self.trainer_state: state.TrainerState = state.TrainerState.from_yaml(
             config_path
@@ -50,26 +105,86 @@ class PretrainTrainer:
         self.logger.info(f"Max steps: {self.trainer_state.max_steps}")
 
         self.iter_loader = None
+        self.prefetcher: BatchPrefetcher | None = None
+        # First iterable of the next prefetcher, e.g. a loader skipping resumed batches
+        self._prefetch_iterable = None
+        self._eval_cache: list | None = None
         self.dataloader_state = 0
+        # Samples of the epoch consumed before the batches counted by `dataloader_state`,
+        # when a resume lands between two batches of the current global batch size
+        self._sample_offset = 0
+        self.epoch = 0
 
         self.max_steps = self.trainer_state.max_steps
         self.global_step = 0
         self.log_every = self.trainer_state.log_every
         self.callbacks = callbacks or []
+        self.callback_dispatcher = CallbackDispatcher(self.callbacks)
         self.seed = self.trainer_state.seed
 
         # Use MetricManager instead of MetricsTracker to work with callbacks
 
         self.metrics = MetricRunner()
+        self.timer = StepTimer(
+            self.metrics, self.acc.device, enabled=self.trainer_state.step_timing
+        )
         self.train_start_time = None
+        self.checkpointer = AsyncCheckpointWriter(
+            async_save=self.trainer_state.checkpoint.async_save,
+            write_fn=partial(
+                atomic_torch_save, zstd_level=self.trainer_state.checkpoint.zstd_level
+            ),
+        )
+        if (
+            self.trainer_state.checkpoint.zstd_level is not None
+            and self.trainer_state.checkpoint.format == "sharded"
+        ):
+            self.logger.warning(
+                "checkpoint.zstd_level only applies to the 'torch' format; "
+                "sharded checkpoints are written uncompressed"
+            )
 
         # Training stability tracking
         self.num_nan_losses = 0
         self.max_nan_losses = 3
+        self.sync_free_metrics = self.trainer_state.sync_free_metrics
+        # Sync-free mode: non-finite losses since the last read, current and longest run of
+        # consecutive ones, and non-finite losses of the running update, kept on device
+        self._nan_counters: torch.Tensor | None = None
 
         self.model = self._load_model()
+        if self.trainer_state.packed_sequences:
+            self._check_packed_attention()
+        self.flops_per_token = estimate_flops_per_token(
+            self.trainer_state.model_params,
+            seq_len=self.trainer_state.seq_len
+            or self.trainer_state.model_params.max_position_embeddings,
+            vocab_size=getattr(getattr(self.model, "config", None), "vocab_size", None),
+            mlp_params=mlp_matrix_params(self.model),
+        )
+        self.peak_flops = self.trainer_state.peak_flops_per_device or device_peak_flops(
+            self.acc.device
+        )
+        self._window_tokens: int | torch.Tensor = 0
+        self._window_start: float | None = None
+
+        self.activation_plan: ActivationCheckpointPlan | None = None
+        self.activation_measured = False
+        self._activation_baseline: int | None = None
+        if self.trainer_state.activation_checkpointing.enabled:
+            self._apply_activation_checkpointing()
+
+        # Loss computed from logits; None uses the model's own loss
+        self.loss_fn: T.Callable | None = None
+        self._compiled_graphs = 0
+        self._reported_recompiles = 0
+        if self.trainer_state.compile_config.enabled:
+            self._compile_model()
+
         self.train_loader = self._load_train_dataloader()
         self.val_loader = self._load_eval_dataloader()
+        # Must be looked up before `acc.prepare` wraps the dataloader
+        self.train_sampler = find_stateful_sampler(self.train_loader)
         self.optimizer, self.scheduler = self._load_optimizer_and_scheduler()
         (
             self.model,
@@ -86,6 +201,41 @@ class PretrainTrainer:
         )
         self._stage: str = None
         self._reset_dataloader()
+        self.grad_stats = self._build_gradient_statistics()
+
+        self.anomaly_guard: AnomalyGuard | None = None
+        self._gradients_unscaled = False
+        # Host copy of the last healthy training state, the rollback target
+        self._rollback_state: dict | None = None
+        self._rollback_step = 0
+        if self.trainer_state.anomaly.enabled:
+            config = self.trainer_state.anomaly
+            self.anomaly_guard = AnomalyGuard(
+                self.acc.device,
+                loss_zscore=config.loss_zscore,
+                grad_norm_zscore=config.grad_norm_zscore,
+                ema_decay=config.ema_decay,
+                warmup_steps=config.warmup_steps,
+                rollback_after=config.rollback_after,
+                rollback_window=config.rollback_window,
+                max_consecutive_spikes=config.max_consecutive_spikes,
+                expect_overflow=self.acc.scaler is not None,
+            )
+            self.rollback_buffer = AsyncCheckpointWriter(async_save=False)
+
+        self.snapshots: PeerSnapshotStore | None = None
+        self.snapshot_writer: AsyncCheckpointWriter | None = None
+        if self.trainer_state.fault_tolerance.enabled:
+            self.snapshots = PeerSnapshotStore(
+                self.trainer_state.fault_tolerance.directory, run_id=self._run_id()
+            )
+            self.snapshot_writer = AsyncCheckpointWriter(write_fn=self.snapshots.save)
+
+        if (
+            self.trainer_state.compile_config.enabled
+            and self.trainer_state.compile_config.warmup
+        ):
+            self._warmup_compile()
 
         self.logger.info("Trainer initialization complete")
 
@@ -94,6 +244,224 @@ class PretrainTrainer:
         model = self.trainer_state.model_params._get_pretrained_model()
         return model
 
+    def _check_packed_attention(self):
+        """Warn when packed rows are not attended with a variable-length kernel."""
+        attn_implementation = getattr(
+            getattr(self.model, "config", None), "_attn_implementation", None
+        )
+        if attn_implementation is None or "flash" not in attn_implementation:
+            self.logger.warning(
+                f"packed_sequences is enabled but the model uses {attn_implementation} "
+                "attention: sequence boundaries are enforced with a dense block-diagonal "
+                "mask over the whole packed row, so attention across sequences is still "
+                "computed. Set model_params.attn_implementation to a variable-length "
+                "kernel such as 'flash_attention_2' to skip it."
+            )
+
+    def _apply_activation_checkpointing(self):
+        """Checkpoint the fewest decoder layers that fit the activation budget."""
+        model_params = self.trainer_state.model_params
+        budget_gb = self.trainer_state.activation_checkpointing.memory_budget_gb
+        seq_len = self.trainer_state.seq_len or model_params.max_position_embeddings
+        mixed_precision = self.trainer_state.accelerate_config.mixed_precision
+        attn_implementation = getattr(
+            getattr(self.model, "config", None), "_attn_implementation", None
+        )
+
+        full_layer_bytes = estimate_layer_activation_bytes(
+            model_params,
+            batch_size=self.trainer_state.batch_size,
+            seq_len=seq_len,
+            bytes_per_element=4 if mixed_precision == "no" else 2,
+            fused_attention=attn_implementation != "eager",
+        )
+        # A checkpointed layer only keeps its (batch, seq, hidden) input
+        checkpointed_layer_bytes = (
+            self.trainer_state.batch_size
+            * seq_len
+            * model_params.hidden_size
+            * (4 if mixed_precision == "no" else 2)
+        )
+        self.activation_plan = plan_activation_checkpointing(
+            model_params.num_hidden_layers,
+            full_layer_bytes,
+            checkpointed_layer_bytes,
+            budget_bytes=int(budget_gb * GB) if budget_gb is not None else None,
+        )
+        apply_activation_checkpointing(
+            self.model, self.activation_plan, model_params.num_hidden_layers
+        )
+
+        self.logger.info(
+            f"Activation checkpointing {len(self.activation_plan.layers)}/"
+            f"{model_params.num_hidden_layers} layers, estimated activations "
+            f"{self.activation_plan.estimated_bytes / GB:.2f} GB"
+        )
+        if not self.activation_plan.fits:
+            self.logger.warning(
+                f"Estimated activations exceed the {budget_gb} GB budget even with "
+                "every layer checkpointed"
+            )
+        self.metrics.update(
+            "memory/activation_estimated_gb", self.activation_plan.estimated_bytes / GB
+        )
+
+    def _start_activation_measurement(self):
+        """Record the allocation baseline before the first training step (CUDA only)."""
+        # Gradients allocated by the first backward are not activations
+        missing_grads = sum(
+            p.numel() * p.element_size()
+            for p in self.model.parameters()
+            if p.requires_grad and p.grad is None
+        )
+        torch.cuda.reset_peak_memory_stats(self.acc.device)
+        self._activation_baseline = (
+            torch.cuda.memory_allocated(self.acc.device) + missing_grads
+        )
+
+    def _finish_activation_measurement(self):
+        """Report the activation peak of the first forward and backward pass."""
+        peak = torch.cuda.max_memory_allocated(self.acc.device)
+        measured = max(0, peak - self._activation_baseline)
+        self._activation_baseline = None
+        self.activation_measured = True
+
+        self.metrics.update("memory/activation_measured_gb", measured / GB)
+        self.logger.info(
+            f"Activation memory: estimated "
+            f"{self.activation_plan.estimated_bytes / GB:.2f} GB, "
+            f"measured {measured / GB:.2f} GB (peak {peak / GB:.2f} GB)"
+        )
+
+    def _compile_model(self):
+        """Compile the model in place (and optionally the loss) before `acc.prepare`."""
+        compile_config = self.trainer_state.compile_config
+        if compile_config.cache_dir and setup_compile_cache(compile_config.cache_dir):
+            self.logger.info(
+                f"Loaded compile artifacts from {compile_config.cache_dir}"
+            )
+
+        compile_kwargs = {
+            "backend": compile_config.backend,
+            "mode": compile_config.mode,
+            "fullgraph": compile_config.fullgraph,
+            "dynamic": compile_config.dynamic,
+        }
+        self.model.compile(**compile_kwargs)
+        if compile_config.compile_loss:
+            self.loss_fn = torch.compile(causal_lm_loss, **compile_kwargs)
+        self.logger.info(f"Compiling model with {compile_kwargs}")
+
+    def _warmup_compile(self):
+        """Compile on a batch of the training shape, then persist the cache."""
+        seq_len = (
+            self.trainer_state.seq_len
+            or self.trainer_state.model_params.max_position_embeddings
+        )
+        # Collated like training batches, so the warm-up graph sees the same inputs
+        # (labels included)
+        packed = self.trainer_state.packed_sequences
+        batch = DataCollatorForLanguageModeling(
+            pad_token_id=0, padding_free=packed, return_flash_attn_kwargs=packed
+        )([{"input_ids": [0] * seq_len}] * self.trainer_state.batch_size)
+        batch = to_device(batch, self.acc.device)
+        if self.trainer_state.compile_config.dynamic_seq_len:
+            for value in batch.values():
+                # Last dimension: tokens, or sequence boundaries (`cu_seq_lens_*`)
+                if isinstance(value, torch.Tensor) and value.dim() > 0:
+                    torch._dynamo.maybe_mark_dynamic(value, value.dim() - 1)
+
+        start = time.perf_counter()
+        loss, _ = self.forward(batch)
+        self.acc.backward(loss)
+        self.optimizer.zero_grad(set_to_none=True)
+        elapsed = time.perf_counter() - start
+
+        self._compiled_graphs = compile_counters()["graphs"]
+        self.metrics.update("compile/warmup_seconds", elapsed)
+        self.logger.info(
+            f"Compile warm-up took {elapsed:.1f}s ({self._compiled_graphs} graph(s))"
+        )
+        self._save_compile_cache()
+
+    def _save_compile_cache(self):
+        cache_dir = self.trainer_state.compile_config.cache_dir
+        if cache_dir and self.acc.is_local_main_process:
+            num_bytes = save_compile_cache(cache_dir)
+            if num_bytes:
+                self.logger.info(f"Saved {num_bytes} bytes of compile artifacts")
+
+    def _update_compile_metrics(self):
+        """Report graph breaks and recompilations since the warm-up."""
+        counters = compile_counters()
+        recompiles = max(0, counters["graphs"] - self._compiled_graphs)
+        if recompiles > self._reported_recompiles:
+            self.logger.warning(
+                f"{recompiles} recompilation(s) since warm-up at step {self.global_step}"
+            )
+            self._reported_recompiles = recompiles
+        for name, value in (
+            ("compile/graph_breaks", counters["graph_breaks"]),
+            ("compile/recompiles", recompiles),
+        ):
+            self.metrics.reset(name)
+            self.metrics.update(name, value)
+
+    def _build_gradient_statistics(self) -> GradientStatistics | None:
+        """Gradient norm tracker, or None under FSDP/DeepSpeed or when unused."""
+        if self.acc.distributed_type in (
+            DistributedType.FSDP,
+            DistributedType.DEEPSPEED,
+        ):
+            return None
+        config = self.trainer_state.gradient_stats
+        # The anomaly guard needs the norm of every update
+        if (
+            not config.enabled
+            and self.trainer_state.gradient_clip_norm is None
+            and not self.trainer_state.anomaly.enabled
+        ):
+            return None
+        return GradientStatistics(
+            self.acc.unwrap_model(self.model),
+            self.optimizer,
+            every=config.every if config.enabled else 0,
+            per_layer=config.per_layer,
+        )
+
+    def _clip_gradients(self) -> torch.Tensor | None:
+        """Clip synchronized gradients; returns their global norm when computed."""
+        clip_norm = self.trainer_state.gradient_clip_norm
+        clip_value = self.gradient_clip_value
+        self._gradients_unscaled = False
+
+        if self.grad_stats is None:
+            self._gradients_unscaled = clip_norm is not None or clip_value is not None
+            if clip_norm is not None:
+                grad_norm = self.acc.clip_grad_norm_(self.model.parameters(), clip_norm)
+                self.metrics.update("grad_norm", grad_norm)
+                return grad_norm
+            if clip_value is not None:
+                self.acc.clip_grad_value_(self.model.parameters(), clip_value)
+            return None
+
+        # `global_step` counts micro-batches; grouped norms are due every `every` updates
+        grouped = self.grad_stats.should_compute(self.optimizer_step)
+        # The anomaly guard checks the norm of every update
+        need_norm = clip_norm is not None or grouped or self.anomaly_guard is not None
+        if not need_norm and clip_value is None:
+            return None
+
+        # Unscale once (fp16); accelerate's clip helpers would unscale a second time
+        self.acc.unscale_gradients()
+        self._gradients_unscaled = True
+        grad_norm = None
+        if need_norm:
+            grad_norm = self.grad_stats.compute(grouped=grouped, max_norm=clip_norm)
+        if clip_norm is None and clip_value is not None:
+            torch.nn.utils.clip_grad_value_(self.model.parameters(), clip_value)
+        return grad_norm
+
     def _load_train_dataloader(self) -> torch.utils.data.DataLoader:
         """Load training dataloader."""
         raise NotImplementedError
@@ -106,32 +474,190 @@ class PretrainTrainer:
         self,
     ) -> tuple[torch.optim.Optimizer, torch.optim.lr_scheduler._LRScheduler]:
         """Load optimizer and scheduler."""
-        raise NotImplementedError
+        optimizer = self.build_optimizer()
+        return optimizer, self.build_scheduler(optimizer)
+
+    def build_optimizer(self) -> torch.optim.Optimizer:
+        """Optimizer described by `trainer_state.optimizer`."""
+        # Probed on the training device: the model is still on the host until prepared
+        optimizer, implementation = build_optimizer(
+            self.model, self.trainer_state.optimizer, device=self.acc.device
+        )
+        self.optimizer_implementation = implementation
+        groups = ", ".join(
+            f"{group['name']}: {sum(p.numel() for p in group['params']) / 1e6:.1f}M"
+            for group in optimizer.param_groups
+        )
+        self.logger.info(
+            f"Optimizer: {type(optimizer).__name__} ({implementation}) | {groups}"
+        )
+        return optimizer
+
+    def build_scheduler(self, optimizer: torch.optim.Optimizer) -> TableLR:
+        """Learning-rate schedule described by `trainer_state.scheduler`."""
+        accumulation_steps = self.acc.gradient_accumulation_steps
+        if not self.acc.step_scheduler_with_optimizer:
+            steps_per_update = accumulation_steps
+        elif self.acc.split_batches:
+            steps_per_update = 1
+        else:
+            steps_per_update = self.acc.num_processes
+        return get_scheduler(
+            optimizer,
+            self.trainer_state.scheduler,
+            num_training_steps=math.ceil(self.max_steps / accumulation_steps),
+            steps_per_update=steps_per_update,
+        )
 
-    def _reset_dataloader(self):
+    def _reset_dataloader(self, dataloader=None):
         """Reset the dataloader iterator."""
-        self.iter_loader = iter(self.train_loader)
+        if self.trainer_state.prefetch_batches > 0:
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                self.prefetcher = None
+            # Started by the first `_get_next_batch`: its thread iterates the sampler,
+            # which a resume may still reposition until then
+            self._prefetch_iterable = dataloader
+            return
+        self.iter_loader = iter(
+            dataloader if dataloader is not None else self.train_loader
+        )
 
     def _get_next_batch(self):
         """Get next batch and handle dataloader exhaustion."""
-        try:
-            batch = next(self.iter_loader)
-            self.dataloader_state += 1
-        except StopIteration:
+        wait_start = time.perf_counter()
+        if self.trainer_state.prefetch_batches > 0:
+            if self.prefetcher is None:
+                self.prefetcher = BatchPrefetcher(
+                    self.train_loader,
+                    self.acc.device,
+                    num_batches=self.trainer_state.prefetch_batches,
+                    first_iterable=self._prefetch_iterable,
+                )
+                self._prefetch_iterable = None
+            batch, new_epoch = self.prefetcher.get()
+        else:
+            try:
+                batch = next(self.iter_loader)
+                new_epoch = False
+            except StopIteration:
+                self._reset_dataloader()
+                batch = next(self.iter_loader)
+                new_epoch = True
+
+        if new_epoch:
             self.logger.warning("DataLoader exhausted, resetting...")
-            self._reset_dataloader()
-            batch = next(self.iter_loader)
             self.dataloader_state = 1
+            self._sample_offset = 0
+            self.epoch += 1
+        else:
+            self.dataloader_state += 1
+
+        # Time the training loop actually spent blocked on data
+        self.metrics.update("data_wait_time", time.perf_counter() - wait_start)
         return batch
 
+    @property
+    def _samples_per_step(self) -> int:
+        """Number of samples consumed across all processes per dataloader step."""
+        return getattr(
+            self.train_loader,
+            "total_batch_size",
+            self.trainer_state.batch_size * self.acc.num_processes,
+        )
+
+    def _shard_assignment(self) -> dict:
+        """How the global sample stream is split between processes."""
+        return {
+            "world_size": self.acc.num_processes,
+            "policy": "split" if self.acc.split_batches else "round_robin",
+            "samples_per_step": self._samples_per_step,
+        }
+
+    def dataloader_state_dict(self) -> dict:
+        """Position of the trainer in the data stream, as stored in checkpoints."""
+        state_dict = {
+            "epoch": self.epoch,
+            "batches": self.dataloader_state,
+            "samples": self._sample_offset
+            + self.dataloader_state * self._samples_per_step,
+            "shards": self._shard_assignment(),
+        }
+        if self.train_sampler is not None:
+            state_dict["seed"] = self.train_sampler.seed
+        return state_dict
+
+    def load_dataloader_state_dict(self, state_dict: dict | int):
+        """Jump the train loader to the position stored by `dataloader_state_dict`."""
+        if isinstance(state_dict, int):
+            # Legacy checkpoints only stored the number of consumed batches
+            state_dict = {"epoch": 0, "batches": state_dict}
+
+        shards = state_dict.get("shards", self._shard_assignment())
+        self.epoch = state_dict.get("epoch", 0)
+        batches = state_dict.get("batches", 0)
+        samples = state_dict.get("samples", batches * shards["samples_per_step"])
+        self.dataloader_state = samples // self._samples_per_step
+        self._sample_offset = 0
+
+        if shards["samples_per_step"] != self._samples_per_step:
+            self.logger.info(
+                f"Elastic resume: {shards['world_size']} -> {self.acc.num_processes} "
+                f"process(es), {shards['samples_per_step']} -> {self._samples_per_step} "
+                f"samples per step; re-partitioning epoch {self.epoch} "
+                f"from sample {samples}"
+            )
+
+        if self.train_sampler is not None:
+            self.train_sampler.load_state_dict(
+                {
+                    "seed": state_dict.get("seed", self.train_sampler.seed),
+                    "epoch": self.epoch,
+                    "start_index": samples,
+                }
+            )
+            if self.train_sampler.epoch != self.epoch:
+                # The stored epoch was fully consumed; the sampler moved on to the next one
+                self.epoch = self.train_sampler.epoch
+                self.dataloader_state = 0
+            else:
+                # The sampler resumes exactly at `samples`, possibly mid-batch
+                self._sample_offset = samples % self._samples_per_step
+            self._reset_dataloader()
+            return
+
+        skipped = samples % self._samples_per_step
+        if skipped:
+            self.logger.warning(
+                f"{skipped} sample(s) will be replayed: the cursor is not a multiple of "
+                f"the new global batch size and the train loader has no stateful sampler"
+            )
+        if self.dataloader_state > 0:
+            self._reset_dataloader(
+                self.acc.skip_first_batches(self.train_loader, self.dataloader_state)
+            )
+        else:
+            self._reset_dataloader()
+
     def _cb(self, name, *args, **kwargs):
         """Execute callback method on all registered callbacks."""
-        for cb in self.callbacks:
-            if hasattr(cb, name):
-                getattr(cb, name)(self, *args, **kwargs)
+        self.callback_dispatcher.dispatch(self, name, *args, **kwargs)
 
     def _check_loss_validity(self, loss: torch.Tensor) -> bool:
         """Check if loss is valid (not NaN or Inf)."""
+        if self.sync_free_metrics:
+            if self._nan_counters is None:
+                self._nan_counters = torch.zeros(
+                    4, dtype=torch.int32, device=loss.device
+                )
+            nonfinite = (~torch.isfinite(loss.detach())).any().int()
+            counters = self._nan_counters
+            counters[0] += nonfinite
+            counters[1] = (counters[1] + 1) * nonfinite
+            counters[2] = torch.maximum(counters[2], counters[1])
+            counters[3] += nonfinite
+            return True
+
         if not torch.isfinite(loss).all():
             self.num_nan_losses += 1
             self.logger.warning(
@@ -147,77 +673,472 @@ class PretrainTrainer:
             self.num_nan_losses = 0
         return True
 
+    def _confirm_loss_validity(self) -> bool:
+        """Read back the on-device non-finite counters (sync-free mode only)."""
+        if not self.sync_free_metrics or self._nan_counters is None:
+            return True
+
+        nonfinite_steps, streak, longest, _ = self._nan_counters.tolist()
+        # The current run carries over into the next window
+        self._nan_counters[0] = 0
+        self._nan_counters[2] = self._nan_counters[1]
+        self.num_nan_losses = streak
+        if nonfinite_steps == 0:
+            return True
+
+        self.logger.warning(
+            f"{nonfinite_steps} NaN/Inf loss(es) before step {self.global_step}! "
+            f"({longest}/{self.max_nan_losses} consecutive strikes)"
+        )
+        if longest >= self.max_nan_losses:
+            self.logger.error(
+                f"Training stopped due to {self.max_nan_losses} NaN losses"
+            )
+            return False
+        return True
+
+    def _mask_nonfinite_update(self):
+        """Skip an update with a non-finite loss without a host sync (sync-free mode)."""
+        if self._nan_counters is None:
+            return
+        nonfinite = self.acc.reduce(self._nan_counters[3], reduction="sum") > 0
+        self._nan_counters[3] = 0
+        if self.acc.scaler is not None:
+            # The scaler already skips updates whose gradients are not finite
+            return
+        optimizer = getattr(self.optimizer, "optimizer", self.optimizer)
+        if getattr(optimizer, "defaults", {}).get("fused"):
+            # Fused kernels leave parameters, moments and step counts untouched
+            optimizer.found_inf = nonfinite.float()
+        # Keeps NaN out of the gradient norms; other implementations still apply
+        # momentum and weight decay to the zeroed gradients
+        for param in self.model.parameters():
+            if param.grad is not None:
+                param.grad.masked_fill_(nonfinite, 0)
+
+    def _check_update(self, grad_norm: torch.Tensor | None) -> str:
+        """Decide whether the accumulated update is applied, skipped or rolled back."""
+        guard = self.anomaly_guard
+        if grad_norm is not None:
+            guard.check_grad_norm(grad_norm)
+        flags = self.acc.reduce(guard.flags, reduction="sum").tolist()
+        overflows = guard.overflow_updates
+        action = guard.record(flags, self.global_step)
+        if guard.overflow_updates > overflows:
+            # Routine with fp16 loss scaling; the scaler lowers its scale
+            self.logger.debug(
+                f"Gradient overflow at step {self.global_step}, skipping the update"
+            )
+        elif action != "apply":
+            self.logger.warning(
+                f"Anomalous update at step {self.global_step} ({guard.describe(flags)}), "
+                + ("rolling back" if action == "rollback" else "skipping it")
+            )
+        return action
+
+    def _skip_update(self):
+        """Drop the accumulated gradients instead of applying them."""
+        self.optimizer.zero_grad()
+        # A GradScaler expects `update()` once it unscaled the gradients of a step
+        if self.acc.scaler is not None and self._gradients_unscaled:
+            self.acc.scaler.update()
+
+    def _take_rollback_snapshot(self):
+        """Copy the training state to host memory as the target of future rollbacks."""
+        self._rollback_state = self.rollback_buffer.snapshot(
+            self.checkpoint_state_dict(encode_optimizer=False)
+        )
+        self._rollback_step = self.global_step
+
+    def _rollback(self) -> bool:
+        """Restore the last healthy snapshot, keeping the data position."""
+        if self.anomaly_guard.rollbacks > self.trainer_state.anomaly.max_rollbacks:
+            self.logger.error(
+                f"Training stopped after {self.trainer_state.anomaly.max_rollbacks} "
+                "rollbacks"
+            )
+            return False
+        if self._rollback_state is None:
+            self.logger.warning("No healthy snapshot to roll back to yet, continuing")
+            return True
+
+        state = self._rollback_state
+        self.acc.unwrap_model(self.model).load_state_dict(state["model_state_dict"])
+        self.optimizer.load_state_dict(state["optimizer_state_dict"])
+        self.scheduler.load_state_dict(state["scheduler_state_dict"])
+        skipped = self.global_step - state["global_step"]
+        self.global_step = state["global_step"]
+        self.logger.warning(
+            f"Rolled back to step {self.global_step}; skipping the {skipped} steps of "
+            f"data consumed since ({self.anomaly_guard.rollbacks} rollback(s) so far)"
+        )
+        # Loaded optimizer state may alias host tensors (e.g. `step`); take a fresh copy
+        self._take_rollback_snapshot()
+        return True
+
+    @staticmethod
+    def count_tokens(batch) -> int | torch.Tensor:
+        """Number of real (non-pad) tokens in `batch`, possibly as a device tensor."""
+        if "attention_mask" in batch:
+            return batch["attention_mask"].sum()
+        if "num_tokens" in batch:
+            return batch["num_tokens"]
+        return batch["input_ids"].numel()
+
+    @staticmethod
+    def batch_labels(batch) -> torch.Tensor:
+        """Labels of `batch`, or its inputs with padding ignored."""
+        if "labels" in batch:
+            return batch["labels"]
+        if "attention_mask" in batch:
+            return batch["input_ids"].masked_fill(batch["attention_mask"] == 0, -100)
+        return batch["input_ids"]
+
     def forward(self, batch):
         """
         Must return: loss, tokens_processed
-        Example: return outputs.loss, batch["input_ids"].numel()
+        Example: return outputs.loss, self.count_tokens(batch)
         """
-        outputs = self.model(**batch, labels=batch["input_ids"])
-        loss = outputs.loss
-        tokens_processed = batch["input_ids"].numel()
+        labels = self.batch_labels(batch)
+        inputs = {k: v for k, v in batch.items() if k not in ("labels", "num_tokens")}
+        if self.loss_fn is not None:
+            outputs = self.model(**inputs)
+            loss = self.loss_fn(outputs.logits, labels)
+        else:
+            outputs = self.model(**inputs, labels=labels)
+            loss = outputs.loss
+        tokens_processed = self.count_tokens(batch)
         return loss, tokens_processed
 
+    def _eval_rows(self, batch) -> int | None:
+        """Number of non-duplicate rows in a validation batch (None keeps them all)."""
+        gradient_state = self.acc.gradient_state
+        if (
+            self.trainer_state.packed_sequences
+            or not gradient_state.end_of_dataloader
+            or gradient_state.remainder <= 0
+        ):
+            return None
+        rows = len(self.batch_labels(batch))
+        per_process = self.val_loader.total_batch_size // self.acc.num_processes
+        start = self.acc.process_index * per_process
+        return min(rows, max(0, gradient_state.remainder - start))
+
+    def _eval_batches(self) -> T.Iterator[tuple[T.Any, int | None]]:
+        """Yield this process' validation batches and their `_eval_rows`."""
+        pin_memory = self.acc.device.type == "cuda"
+        if self._eval_cache is not None:
+            for batch, rows in self._eval_cache:
+                yield to_device(batch, self.acc.device), rows
+            return
+
+        max_batches = self.trainer_state.eval_max_batches
+        cache = [] if self.trainer_state.eval_cache else None
+        try:
+            for i, batch in enumerate(self.val_loader):
+                if max_batches is not None and i >= max_batches:
+                    break
+                rows = self._eval_rows(batch)
+                if cache is not None:
+                    cache.append((to_host(batch, pin_memory=pin_memory), rows))
+                yield batch, rows
+        finally:
+            # Leaving the loop early skips accelerate's `end()`, which would keep the val
+            # loader registered as the active dataloader of the gradient state
+            end = getattr(self.val_loader, "end", None)
+            if end is not None:
+                end()
+        if cache is not None:
+            self._eval_cache = cache
+
     def evaluate(self):
-        """Run evaluation if eval_fn is provided."""
+        """Compute the token-weighted validation loss across all processes."""
         self.logger.info(f"Running evaluation at step {self.global_step}")
         self.model.eval()
-        avg_loss = 0.0
-        num_batches = 0
-        with torch.no_grad():
-            for batch in self.val_loader:
-                outputs = self.model(**batch, labels=batch["input_ids"])
-                loss = outputs.loss
-                avg_loss += loss.item()
-                num_batches += 1
-        avg_loss = avg_loss / max(1, num_batches)
+        # float32: float64 is not supported on every device (e.g. MPS)
+        totals = torch.zeros(2, dtype=torch.float32, device=self.acc.device)
+        with torch.inference_mode(), self.acc.autocast():
+            for batch, rows in self._eval_batches():
+                if rows is not None:
+                    # Every process still runs a forward pass (DDP may sync buffers in it)
+                    batch = {k: v[: max(1, rows)] for k, v in batch.items()}
+                loss, _ = self.forward(batch)
+                if rows == 0:
+                    continue
+                labels = self.batch_labels(batch)
+                tokens = (labels[..., 1:] != -100).sum()
+                totals[0] += loss.detach().float() * tokens
+                totals[1] += tokens
         self.model.train()
 
-        return avg_loss
+        loss_sum, num_tokens = self.acc.reduce(totals, reduction="sum").tolist()
+        return loss_sum / max(1.0, num_tokens)
+
+    def checkpoint_state_dict(self, encode_optimizer: bool = True) -> dict:
+        """Full training state as stored in checkpoints."""
+        optimizer_state = self.optimizer.state_dict()
+        config = self.trainer_state.checkpoint
+        if encode_optimizer and config.optimizer_encoding != "none":
+            optimizer_state, raw_bytes, encoded_bytes, tensor_counts = (
+                encode_optimizer_state(
+                    optimizer_state, config.optimizer_encoding, config.quant_block_size
+                )
+            )
+            values = {
+                "checkpoint/optimizer_bytes_raw": raw_bytes,
+                "checkpoint/optimizer_bytes_encoded": encoded_bytes,
+                "checkpoint/optimizer_compression": raw_bytes / max(1, encoded_bytes),
+            }
+            # Which moments got the configured encoding and which stayed bf16
+            for key, count in tensor_counts.items():
+                values[f"checkpoint/optimizer_tensors/{key}"] = count
+            for name, value in values.items():
+                self.metrics.reset(name)
+                self.metrics.update(name, value)
+        return {
+            "model_state_dict": self.acc.unwrap_model(self.model).state_dict(),
+            "optimizer_state_dict": optimizer_state,
+            "scheduler_state_dict": self.scheduler.state_dict(),
+            "global_step": self.global_step,
+            "dataloader_state": self.dataloader_state_dict(),
+        }
+
+    def checkpoint_path(self, directory: str | Path, name: str) -> Path:
+        """Path of checkpoint `name` in `directory` for the configured format."""
+        suffix = ".pt" if self.trainer_state.checkpoint.format == "torch" else ""
+        return Path(directory) / f"{name}{suffix}"
+
+    def save_checkpoint(
+        self,
+        checkpoint_path: str | Path,
+        on_saved: T.Callable[[Path], None] | None = None,
+        collective: bool = True,
+    ):
+        """Snapshot the training state to host memory and write it in the background."""
+        if not collective and not self.acc.is_main_process:
+            return
+
+        if not self.acc.is_main_process:
+            on_saved = None
+
+        if self.trainer_state.checkpoint.format == "sharded":
+            rank, world_size = 0, 1
+            if collective:
+                rank, world_size = self.acc.process_index, self.acc.num_processes
+            # No process may still be writing into the directory, or start before it is empty
+            self.checkpointer.wait()
+            if collective:
+                self.acc.wait_for_everyone()
+            if self.acc.is_main_process:
+                clear_checkpoint(checkpoint_path)
+            if collective:
+                self.acc.wait_for_everyone()
+            self.checkpointer.save(
+                build_shard(
+                    self.checkpoint_state_dict(), rank=rank, world_size=world_size
+                ),
+                checkpoint_path,
+                on_saved=on_saved,
+                write_fn=write_shard,
+            )
+        elif self.acc.is_main_process:
+            self.checkpointer.save(
+                self.checkpoint_state_dict(), checkpoint_path, on_saved=on_saved
+            )
+        else:
+            return
+        self.metrics.reset("checkpoint/blocking_seconds")
+        self.metrics.update(
+            "checkpoint/blocking_seconds", self.checkpointer.last_snapshot_seconds
+        )
+
+    def _update_checkpoint_metrics(self):
+        """Report the duration and size of the last completed checkpoint write."""
+        if self.checkpointer.in_flight or self.checkpointer.last_write_seconds is None:
+            return
+        for name, value in (
+            ("checkpoint/write_seconds", self.checkpointer.last_write_seconds),
+            ("checkpoint/bytes_written", self.checkpointer.last_bytes_written or 0),
+        ):
+            self.metrics.reset(name)
+            self.metrics.update(name, value)
+
+    def _update_anomaly_metrics(self):
+        """Report the skipped updates and rollbacks since the start of training."""
+        for name, value in (
+            ("anomaly/skipped_updates", self.anomaly_guard.skipped_updates),
+            ("anomaly/overflow_updates", self.anomaly_guard.overflow_updates),
+            ("anomaly/rollbacks", self.anomaly_guard.rollbacks),
+        ):
+            self.metrics.reset(name)
+            self.metrics.update(name, value)
 
     def load_checkpoint(self, checkpoint_path: str):
         """Load checkpoint and resume training."""
         self.logger.info(f"Loading checkpoint from {checkpoint_path}")
-        checkpoint = torch.load(checkpoint_path, map_location=self.acc.device)
-
         unwrapped_model = self.acc.unwrap_model(self.model)
-        unwrapped_model.load_state_dict(checkpoint["model_state_dict"])
 
-        self.optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
+        if is_sharded_checkpoint(checkpoint_path):
+            # Shards are memory-mapped; tensors are copied in place or loaded straight to
+            # the device one at a time, whatever the world size that wrote them.
+            reader = ShardedCheckpointReader(checkpoint_path)
+            reader.load_into_module(unwrapped_model, "model_state_dict")
+            checkpoint = {
+                "optimizer_state_dict": reader.load(
+                    "optimizer_state_dict", self.acc.device
+                ),
+                "scheduler_state_dict": reader.load("scheduler_state_dict"),
+                "global_step": reader.load("global_step"),
+                "dataloader_state": reader.load("dataloader_state"),
+            }
+        else:
+            checkpoint = load_torch_checkpoint(
+                checkpoint_path, map_location=self.acc.device
+            )
+            unwrapped_model.load_state_dict(checkpoint["model_state_dict"])
+
+        self._load_training_state(checkpoint)
+
+    def _load_training_state(self, checkpoint: dict):
+        """Restore optimizer, scheduler and data position from a checkpoint dict."""
+        # Encoded moments (see `checkpoint.optimizer_encoding`) are decoded transparently
+        self.optimizer.load_state_dict(
+            decode_optimizer_state(checkpoint["optimizer_state_dict"])
+        )
         self.scheduler.load_state_dict(checkpoint["scheduler_state_dict"])
 
         self.global_step = checkpoint.get("global_step", 0)
-        self.dataloader_state = checkpoint.get("dataloader_state", 0)
-
-        # Fast-forward dataloader
-        if self.dataloader_state > 0:
-            self.logger.info(
-                f"Fast-forwarding dataloader to batch {self.dataloader_state}"
-            )
-            self._reset_dataloader()
-            for _ in range(self.dataloader_state):
-                try:
-                    _ = next(self.iter_loader)
-                except StopIteration:
-                    self._reset_dataloader()
-                    break
+        self.load_dataloader_state_dict(checkpoint.get("dataloader_state", 0))
 
         self.logger.info(
-            f"Resumed from step {self.global_step}, dataloader at batch {self.dataloader_state}"
+            f"Resumed from step {self.global_step}, dataloader at epoch {self.epoch} "
+            f"batch {self.dataloader_state}"
+        )
+
+    def save_snapshot(self):
+        """Copy the training state to host memory and replicate it to the peer rank."""
+        self.snapshot_writer.save(
+            self.checkpoint_state_dict(encode_optimizer=False),
+            self.snapshots.directory / str(self.global_step),
         )
 
-    def _update_metrics(self, loss: float, tokens: int, step_time: float):
+    def _run_id(self) -> str:
+        """Key of this run's peer snapshots (see `fault_tolerance.run_id`)."""
+        if self.trainer_state.fault_tolerance.run_id is not None:
+            return self.trainer_state.fault_tolerance.run_id
+        settings = self.trainer_state.model_dump_json(
+            include={"model_params", "optimizer", "scheduler", "seed"}
+        )
+        return hashlib.sha256(settings.encode()).hexdigest()[:16]
+
+    def _checkpoint_step(self, checkpoint_path: str) -> int:
+        """Global step of a checkpoint, read without loading its tensors."""
+        if is_sharded_checkpoint(checkpoint_path):
+            return ShardedCheckpointReader(checkpoint_path).load("global_step")
+        checkpoint = load_torch_checkpoint(
+            checkpoint_path, map_location="cpu", mmap=True
+        )
+        return checkpoint.get("global_step", 0)
+
+    def resume(self, checkpoint_path: str | None = None) -> bool:
+        """Resume from peer snapshots when possible, else from `checkpoint_path`."""
+        if self.snapshots is not None:
+            # Snapshots not newer than the checkpoint predate the state it restores
+            min_step = (
+                self._checkpoint_step(checkpoint_path) + 1
+                if checkpoint_path is not None
+                else 0
+            )
+            restored = self.snapshots.restore(
+                map_location=self.acc.device, min_step=min_step
+            )
+            if restored is not None:
+                step, checkpoint = restored
+                self.logger.info(f"Restoring in-memory snapshot of step {step}")
+                self.acc.unwrap_model(self.model).load_state_dict(
+                    checkpoint["model_state_dict"]
+                )
+                self._load_training_state(checkpoint)
+                return True
+        if checkpoint_path is not None:
+            self.load_checkpoint(checkpoint_path)
+            return True
+        return False
+
+    def _update_metrics(
+        self,
+        loss: float | torch.Tensor,
+        tokens: int | torch.Tensor,
+        step_time: float,
+    ):
         """Update training metrics after each step."""
         self.metrics.update("loss", loss, self.trainer_state.batch_size)
         self.metrics.update("tokens_per_sec", tokens / step_time)
+        if self.timer.enabled:
+            # Reported with the phase timings, so disabled together with them
+            self.metrics.observe("time/step", step_time)
+        self._window_tokens = self._window_tokens + tokens
 
         learning_rate_per_group = get_learning_rates(self.optimizer)
         for name, lr in learning_rate_per_group.items():
             self.metrics.update(f"lr_{name}", lr)
 
+    def _update_throughput_metrics(self):
+        """Compute cluster-wide throughput and MFU over the last log window."""
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        self._window_start = now
+
+        tokens = torch.as_tensor(
+            self._window_tokens, dtype=torch.float32, device=self.acc.device
+        )
+        self._window_tokens = 0
+        global_tokens = self.acc.reduce(tokens, reduction="sum").item()
+        if elapsed <= 0:
+            return
+
+        global_tokens_per_sec = global_tokens / elapsed
+        # Hold the last window's values until the next one, so callbacks and
+        # exporters running between log boundaries still see them
+        self.metrics.reset("tokens_per_sec_global", "tflops_per_device", "mfu")
+        self.metrics.update("tokens_per_sec_global", global_tokens_per_sec)
+        self.metrics.update(
+            "tflops_per_device",
+            global_tokens_per_sec
+            * self.flops_per_token
+            / self.acc.num_processes
+            / 1e12,
+        )
+        if self.peak_flops:
+            self.metrics.update(
+                "mfu",
+                global_tokens_per_sec
+                * self.flops_per_token
+                / (self.peak_flops * self.acc.num_processes),
+            )
+
+    def _collect_window_metrics(self):
+        """Resolve the metrics of the log window ending at this step."""
+        self.timer.collect()
+        if self.grad_stats is not None:
+            self.grad_stats.collect(self.metrics)
+        self._update_throughput_metrics()
+        self._update_checkpoint_metrics()
+        if self.anomaly_guard is not None:
+            self._update_anomaly_metrics()
+        if self.trainer_state.compile_config.enabled:
+            self._update_compile_metrics()
+
     def fit(self):
         """Main training loop with callback support."""
         self.model.train()
         self.train_start_time = time.time()
+        self._window_start = time.perf_counter()
+
+        if self.snapshots is not None and self.global_step == 0:
+            # Leftovers of an earlier run with the same settings must not be restored
+            # should this one fail before its first snapshot
+            self.snapshots.clear()
 
         self.logger.info("=" * 80)
         self.logger.info(f"Starting training from step {self.global_step}")
@@ -225,46 +1146,76 @@ class PretrainTrainer:
 
         self._cb(state.TrainerSteps.on_train_start.value)
 
+        failed = False
         try:
             while self.global_step < self.max_steps:
                 step_start_time = time.perf_counter()
-                self._cb(state.TrainerSteps.on_step_start.value)
+                with self.timer.phase("callbacks", device=False):
+                    self._cb(state.TrainerSteps.on_step_start.value)
 
-                batch = self._get_next_batch()
+                with self.timer.phase("data", device=False):
+                    batch = self._get_next_batch()
+
+                measure_activations = (
+                    self.activation_plan is not None
+                    and not self.activation_measured
+                    and self.acc.device.type == "cuda"
+                )
+                if measure_activations:
+                    self._start_activation_measurement()
 
                 # Training step with gradient accumulation
                 with self.acc.accumulate(self.model):
-                    loss, tokens = self.forward(batch)
+                    with self.timer.phase("forward"):
+                        loss, tokens = self.forward(batch)
 
-                    # Check for NaN/Inf loss
-                    if not self._check_loss_validity(loss):
+                    # Check for NaN/Inf loss (and spikes with the anomaly guard)
+                    if self.anomaly_guard is not None:
+                        self.anomaly_guard.check_loss(loss)
+                    elif not self._check_loss_validity(loss):
                         self.logger.warning(
                             f"Stopping training at step {self.global_step} due to NaN loss"
                         )
                         break
 
-                    self.acc.backward(loss)
+                    with self.timer.phase("backward"):
+                        self.acc.backward(loss)
+                    if measure_activations:
+                        # Before the optimizer allocates its state on the first update
+                        self._finish_activation_measurement()
 
-                    # Gradient clipping
-                    if self.acc.sync_gradients and self.gradient_clip_value is not None:
-                        self.acc.clip_grad_value_(
-                            self.model.parameters(), self.gradient_clip_value
-                        )
-                        # Track gradient norm
-                        # if grad_norm is not None:
-                        #   self.metrics.update("grad_norm", grad_norm)
+                    # Gradient clipping and norm tracking
+                    action = "apply"
+                    if self.acc.sync_gradients:
+                        with self.timer.phase("clip"):
+                            if self.sync_free_metrics and self.anomaly_guard is None:
+                                # Stopping waits for the next log boundary; until then an
+                                # update with a non-finite loss applies no gradient
+                                self._mask_nonfinite_update()
+                            grad_norm = self._clip_gradients()
+                            if self.anomaly_guard is not None:
+                                action = self._check_update(grad_norm)
 
-                    self.optimizer.step()
-                    self.optimizer.zero_grad()
+                    with self.timer.phase("optimizer"):
+                        if action == "apply":
+                            self.optimizer.step()
+                            self.optimizer.zero_grad()
+                        else:
+                            self._skip_update()
 
                 # Update scheduler
-                self.scheduler.step()
+                with self.timer.phase("scheduler"):
+                    self.scheduler.step()
 
                 # Update metrics
                 step_time = time.perf_counter() - step_start_time
 
+                if self.anomaly_guard is not None:
+                    loss = self.anomaly_guard.sanitize(loss)
                 self._update_metrics(
-                    loss=loss.item(), tokens=tokens, step_time=step_time
+                    loss=loss.detach() if self.sync_free_metrics else loss.item(),
+                    tokens=tokens,
+                    step_time=step_time,
                 )
 
                 # Evaluation
@@ -273,33 +1224,83 @@ class PretrainTrainer:
                     and self.global_step % self.trainer_state.eval_every == 0
                     and self.global_step > 0
                 ):
-                    val_loss = self.evaluate()
+                    with self.timer.phase("eval", device=False):
+                        val_loss = self.evaluate()
                     if val_loss is not None:
                         self.logger.info(
                             f"Evaluation: {val_loss}", main_process_only=True
                         )
 
                 self.global_step += 1
-                self._cb(state.TrainerSteps.on_step_end.value)
+                if action == "rollback" and not self._rollback():
+                    break
+                # Close the log window before the step-end callbacks, so they (and the
+                # metric snapshot handed to async ones) see its metrics
+                log_step = self.global_step % self.log_every == 0
+                if log_step:
+                    if not self._confirm_loss_validity():
+                        self.logger.warning(
+                            f"Stopping training at step {self.global_step} due to NaN loss"
+                        )
+                        break
+                    self._collect_window_metrics()
+                with self.timer.phase("callbacks", device=False):
+                    self._cb(state.TrainerSteps.on_step_end.value)
+                # Only between two updates: mid-accumulation the gradients are not part of the
+                # snapshot, so restoring it would silently drop the micro-batches consumed so far
+                if (
+                    self.snapshot_writer is not None
+                    and self.acc.sync_gradients
+                    and self.optimizer_step
+                    % self.trainer_state.fault_tolerance.snapshot_every
+                    == 0
+                ):
+                    with self.timer.phase("snapshot", device=False):
+                        self.save_snapshot()
+                if (
+                    self.anomaly_guard is not None
+                    and self.acc.sync_gradients
+                    and self.global_step - self._rollback_step
+                    >= self.trainer_state.anomaly.snapshot_every
+                    and self.anomaly_guard.is_healthy(self.global_step)
+                ):
+                    with self.timer.phase("snapshot", device=False):
+                        self._take_rollback_snapshot()
+                self.timer.step()
 
                 # Logging
-                if self.global_step % self.log_every == 0:
+                if log_step:
                     self._log_metrics()
 
         except KeyboardInterrupt:
             self.logger.warning("Training interrupted by user (Ctrl+C)")
             self.logger.info("Saving checkpoint before exit...")
             if self.acc.is_main_process:
-                emergency_ckpt = Path("./checkpoints") / "checkpoint_interrupted.pt"
-                self.save_checkpoint(str(emergency_ckpt))
+                emergency_ckpt = self.checkpoint_path(
+                    "./checkpoints", "checkpoint_interrupted"
+                )
+                self.save_checkpoint(emergency_ckpt, collective=False)
 
         except Exception as e:
-            self.logger.error(f"Training failed with error: {e}", exc_info=True)
+            failed = True
+            self.logger.exception("Training failed")
             self._cb(state.TrainerSteps.on_exception.value, exception=e)
             raise
 
         finally:
             self._cb("on_train_end")
+            # Make sure the last checkpoint is on disk before returning
+            self.checkpointer.wait()
+            if self.snapshot_writer is not None:
+                self.snapshot_writer.close()
+            if self.trainer_state.compile_config.enabled:
+                self._save_compile_cache()
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                self.prefetcher = None
+            # Let async callbacks (e.g. W&B) handle every queued event; their errors
+            # must not replace the training exception
+            self.callback_dispatcher.close(raise_errors=not failed)
 
             # Final stats
             if self.train_start_time:
@@ -312,6 +1313,16 @@ class PretrainTrainer:
                 )
                 self.logger.info("=" * 80)
 
+    @property
+    def optimizer_step(self) -> int:
+        """Optimizer updates completed; `global_step` counts micro-batches."""
+        return self.global_step // self.acc.gradient_accumulation_steps
+
+    @property
+    def loss_ema(self) -> float | None:
+        """Exponential moving average of the training loss."""
+        return self.metrics.get_ema("loss")
+
     def _log_metrics(self):
         """Log current training metrics."""
         if not self.acc.is_local_main_process:
@@ -328,17 +1339,36 @@ class PretrainTrainer:
 
         loss = self.metrics.get_avg("loss")
         tok_s = self.metrics.get_avg("tokens_per_sec")
+        data_wait = self.metrics.get_avg("data_wait_time")
+        global_tok_s = self.metrics.get_avg("tokens_per_sec_global")
 
         log_msg = (
             f"Step {self.global_step}/{self.max_steps} ({progress:.1f}%) | "
             f"loss: {loss:.4f} | "
             f"Tok/s: {tok_s:.0f} | "
-            f"ETA: {eta / 3600:.2f}h"
+            f"Global tok/s: {global_tok_s:.0f} | "
+            f"Data wait: {data_wait * 1000:.1f}ms | "
         )
+        if "grad_norm" in self.metrics.metrics:
+            log_msg += f"Grad norm: {self.metrics.get_avg('grad_norm'):.3f} | "
+        if "mfu" in self.metrics.metrics:
+            log_msg += f"MFU: {self.metrics.get_avg('mfu') * 100:.1f}% | "
+        log_msg += f"ETA: {eta / 3600:.2f}h"
 
         self.logger.info(
             log_msg,
             main_process_only=True,
         )
-        self.metrics.reset("tokens_per_sec")
-        self.metrics.reset("loss")
+        phases = self.timer.summary()
+        if phases:
+            self.logger.info(
+                "Phase p50/p95 (ms): "
+                + " | ".join(
+                    f"{name} {p50 * 1000:.1f}/{p95 * 1000:.1f}"
+                    for name, (p50, p95) in phases.items()
+                ),
+                main_process_only=True,
+            )
+        self.metrics.reset("tokens_per_sec", "loss", "data_wait_time", "grad_norm")
+        if self.grad_stats is not None:
+            self.grad_stats.reset_metrics(self.metrics)
@@ -3,21 +3,18 @@ Quick test script for PretrainTrainer with small GPT-2 model.
 Install requirements: pip install torch transformers accelerate datasets
 """
 
-import torch
+import os
+from pathlib import Path
+
+from datasets import load_dataset
 from torch.utils.data import DataLoader
 from transformers import AutoTokenizer
-from datasets import load_dataset
-from pathlib import Path
 
 # Simple linear warmup + cosine decay
-
 # Import your trainer (adjust path as needed)
 from pbd.pipelines.pretrain.steps.callbacks.tracking import WandbCallback
+from pbd.pipelines.pretrain.steps.prepare_data.sampler import StatefulRandomSampler
 from pbd.pipelines.pretrain.steps.trainer import PretrainTrainer
-from pbd.pipelines.pretrain.steps.trainer.scheduler import (
-    get_cosine_schedule_with_warmup,
-)
-import os
 
 os.environ["WANDB_API"] = ""
 
@@ -25,26 +22,20 @@ os.environ["WANDB_API"] = ""
 class SimpleGPT2Trainer(PretrainTrainer):
     """Concrete implementation of PretrainTrainer for GPT-2."""
 
-    def _load_optimizer_and_scheduler(self):
-        optimizer = torch.optim.AdamW(
-            self.model.parameters(), lr=self.trainer_state.optimizer.lr
-        )
-        scheduler = get_cosine_schedule_with_warmup(
-            optimizer,
-            num_warmup_steps=self.trainer_state.scheduler.warmup_steps,
-            num_training_steps=self.trainer_state.max_steps,
-        )
-        return optimizer, scheduler
-
     def _load_train_dataloader(self):
         tokenizer = AutoTokenizer.from_pretrained("gpt2")
         tokenizer.pad_token = tokenizer.eos_token
         return create_dataloader(
-            tokenizer, batch_size=self.trainer_state.batch_size, max_length=512
+            tokenizer,
+            batch_size=self.trainer_state.batch_size,
+            max_length=512,
+            seed=self.trainer_state.seed,
         )
 
 
-def create_dataloader(tokenizer, batch_size, max_length=512, num_samples=100000):
+def create_dataloader(
+    tokenizer, batch_size, max_length=512, num_samples=100000, seed=42
+):
     """Create a simple dataloader with WikiText data."""
     # Load a small dataset
     dataset = load_dataset("wikitext", "wikitext-2-raw-v1", split="train")
@@ -81,7 +72,7 @@ def create_dataloader(tokenizer, batch_size, max_length=512, num_samples=100000)
     dataloader = DataLoader(
         tokenized_dataset,
         batch_size=batch_size,
-        shuffle=True,
+        sampler=StatefulRandomSampler(tokenized_dataset, seed=seed),
         num_workers=0,
     )
 
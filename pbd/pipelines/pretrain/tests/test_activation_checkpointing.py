@@ -0,0 +1,33 @@
+import pytest
+
+from pbd.pipelines.pretrain.steps.trainer.activation_checkpointing import (
+    plan_activation_checkpointing,
+)
+
+
+@pytest.mark.parametrize(
+    "budget, layers, fits",
+    [
+        # Everything fits without checkpointing: 8 * 10
+        (80, [], True),
+        # (8 - k) * 10 + 2 * k + 10 <= 60 first holds for k = 4
+        (60, [0, 1, 2, 3], True),
+        # Even checkpointing every layer needs 8 * 2 + 10
+        (20, list(range(8)), False),
+        (None, list(range(8)), True),
+    ],
+)
+def test_plan_checkpoints_the_fewest_layers_under_budget(budget, layers, fits):
+    plan = plan_activation_checkpointing(
+        num_layers=8,
+        full_layer_bytes=10,
+        checkpointed_layer_bytes=2,
+        budget_bytes=budget,
+    )
+
+    assert plan.layers == layers
+    assert plan.fits is fits
+    if budget is not None and layers and fits:
+        # One layer fewer would exceed the budget
+        fewer = (8 - len(layers) + 1) * 10 + (len(layers) - 1) * 2 + 10
+        assert plan.estimated_bytes <= budget < fewer
@@ -0,0 +1,113 @@
+import os
+import pickle
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.checkpoint import CheckpointCallback
+from pbd.pipelines.pretrain.steps.checkpoint import writer
+from pbd.pipelines.pretrain.steps.checkpoint.writer import (
+    AsyncCheckpointWriter,
+    atomic_torch_save,
+)
+
+
+class BlockingWrite:
+    def __init__(self):
+        self.release = threading.Event()
+        self.written = []
+
+    def __call__(self, state, path):
+        self.release.wait(timeout=10)
+        atomic_torch_save(state, path)
+        self.written.append(path.name)
+
+
+class ThreadRecordingLogger:
+    def __init__(self):
+        self.records = []
+
+    def info(self, message):
+        self.records.append((message, threading.current_thread().name))
+
+
+def test_save_returns_before_the_write_completes(tmp_path):
+    write = BlockingWrite()
+    checkpointer = AsyncCheckpointWriter(write_fn=write)
+    checkpointer.save({"weight": torch.ones(4)}, tmp_path / "ckpt.pt")
+
+    assert checkpointer.in_flight
+    assert not (tmp_path / "ckpt.pt").exists()
+    write.release.set()
+    checkpointer.close()
+    assert torch.equal(torch.load(tmp_path / "ckpt.pt")["weight"], torch.ones(4))
+
+
+def test_second_save_waits_for_the_first(tmp_path):
+    write = BlockingWrite()
+    checkpointer = AsyncCheckpointWriter(write_fn=write)
+    checkpointer.save({"step": 1}, tmp_path / "first.pt")
+    second = threading.Thread(
+        target=checkpointer.save, args=({"step": 2}, tmp_path / "second.pt")
+    )
+    second.start()
+    second.join(timeout=0.2)
+
+    assert second.is_alive()
+    write.release.set()
+    second.join()
+    checkpointer.close()
+    assert write.written == ["first.pt", "second.pt"]
+
+
+def test_checkpoint_file_only_appears_complete(tmp_path, monkeypatch):
+    path = tmp_path / "ckpt.pt"
+    atomic_torch_save({"step": 1}, path)
+    renames = []
+
+    def replace(src, dst):
+        renames.append(
+            (Path(src).name, torch.load(src)["step"], torch.load(dst)["step"])
+        )
+        os.rename(src, dst)
+
+    monkeypatch.setattr(writer.os, "replace", replace)
+    atomic_torch_save({"step": 2}, path)
+    # Written next to the checkpoint, which keeps its previous content until the rename
+    assert renames == [(".ckpt.pt.tmp", 2, 1)]
+
+    with pytest.raises((AttributeError, pickle.PicklingError)):
+        atomic_torch_save({"step": 3, "unpicklable": lambda: None}, path)
+    assert torch.load(path)["step"] == 2
+    assert len(renames) == 1
+
+
+def test_keep_last_n_prunes_on_the_writer_thread(tmp_path):
+    checkpointer = AsyncCheckpointWriter()
+    trainer = SimpleNamespace(
+        acc=SimpleNamespace(is_main_process=True),
+        logger=ThreadRecordingLogger(),
+        global_step=0,
+        log_every=10,
+        checkpoint_path=lambda directory, name: Path(directory) / f"{name}.pt",
+    )
+    trainer.save_checkpoint = lambda path, on_saved=None: checkpointer.save(
+        {"step": trainer.global_step}, path, on_saved=on_saved
+    )
+    callback = CheckpointCallback(str(tmp_path), save_every=1, keep_last_n=2)
+
+    for step in range(1, 5):
+        trainer.global_step = step
+        callback.on_step_end(trainer)
+    checkpointer.close()
+
+    assert sorted(p.name for p in tmp_path.glob("*.pt")) == [
+        "checkpoint_step_3.pt",
+        "checkpoint_step_4.pt",
+    ]
+    removals = [r for r in trainer.logger.records if r[0].startswith("Removed")]
+    assert len(removals) == 2
+    assert all(thread.startswith("checkpoint-writer") for _, thread in removals)
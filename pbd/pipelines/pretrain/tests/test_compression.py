@@ -0,0 +1,67 @@
+import pytest
+import torch
+
+from pbd.pipelines.pretrain.steps.checkpoint.compression import (
+    decode_optimizer_state,
+    encode_optimizer_state,
+)
+
+
+def adam_state(numel: int = 4096, seed: int = 0) -> dict:
+    generator = torch.Generator().manual_seed(seed)
+    # Second moments spread over 40 orders of magnitude, with a few exact zeros (parameters never updated)
+    exp_avg_sq = 10.0 ** (-40 * torch.rand(numel, generator=generator))
+    exp_avg_sq[::97] = 0
+    return {
+        "state": {
+            0: {
+                "step": torch.tensor(100.0),
+                "exp_avg": torch.randn(numel, generator=generator) * 1e-3,
+                "exp_avg_sq": exp_avg_sq,
+                "max_exp_avg_sq": exp_avg_sq.clone(),
+            }
+        },
+        "param_groups": [{"lr": 1e-3, "params": [0]}],
+    }
+
+
+@pytest.mark.parametrize("encoding", ["bf16", "fp16", "int8"])
+def test_second_moments_never_decode_to_zero(encoding):
+    state = adam_state()
+    encoded, raw_bytes, encoded_bytes, tensor_counts = encode_optimizer_state(
+        state, encoding
+    )
+    decoded = decode_optimizer_state(encoded)["state"][0]
+    assert encoded_bytes < raw_bytes
+    assert tensor_counts == {
+        f"exp_avg/{encoding}": 1,
+        "exp_avg_sq/bf16": 1,
+        "max_exp_avg_sq/bf16": 1,
+    }
+
+    for key in ("exp_avg_sq", "max_exp_avg_sq"):
+        original = state["state"][0][key]
+        restored = decoded[key]
+        assert restored.dtype == original.dtype
+        assert not ((restored == 0) & (original != 0)).any()
+        assert torch.equal(restored == 0, original == 0)
+        # bf16 keeps 8 bits of mantissa wherever the value is a normal bf16 number
+        normal = original >= torch.finfo(torch.bfloat16).tiny
+        torch.testing.assert_close(
+            restored[normal], original[normal], rtol=1e-2, atol=0
+        )
+
+
+@pytest.mark.parametrize("encoding", ["bf16", "fp16", "int8"])
+def test_first_moments_round_trip(encoding):
+    state = adam_state()
+    decoded = decode_optimizer_state(encode_optimizer_state(state, encoding)[0])
+    original = state["state"][0]["exp_avg"]
+    torch.testing.assert_close(
+        decoded["state"][0]["exp_avg"],
+        original,
+        rtol=0,
+        atol=original.abs().max().item() / 100,
+    )
+    assert torch.equal(decoded["state"][0]["step"], state["state"][0]["step"])
+    assert decoded["param_groups"] == state["param_groups"]
@@ -0,0 +1,154 @@
+"""
+Elastic resume across world sizes, with CPU processes talking over gloo.
+
+A run resumed with another world size and batch size must continue exactly
+where the first one stopped, without replaying or skipping samples.
+"""
+
+import json
+import os
+import socket
+from pathlib import Path
+
+import pytest
+import torch
+import torch.multiprocessing as mp
+import yaml
+from torch.utils.data import DataLoader, Dataset
+
+from pbd.pipelines.pretrain.steps.prepare_data.data_collator import (
+    DataCollatorForLanguageModeling,
+)
+from pbd.pipelines.pretrain.steps.prepare_data.sampler import StatefulRandomSampler
+from pbd.pipelines.pretrain.steps.trainer.trainer import PretrainTrainer
+
+NUM_SAMPLES = 64
+SEED = 0
+
+
+class IndexDataset(Dataset):
+    """Example `i` is four copies of token `i + 1` (0 is the pad token)."""
+
+    def __len__(self):
+        return NUM_SAMPLES
+
+    def __getitem__(self, index):
+        return {"input_ids": [index + 1] * 4}
+
+
+class IndexTrainer(PretrainTrainer):
+    def _load_train_dataloader(self):
+        dataset = IndexDataset()
+        return DataLoader(
+            dataset,
+            batch_size=self.trainer_state.batch_size,
+            sampler=StatefulRandomSampler(dataset, seed=SEED),
+            collate_fn=DataCollatorForLanguageModeling(pad_token_id=0),
+        )
+
+    def _load_eval_dataloader(self):
+        return None
+
+    def next_indices(self) -> list[int]:
+        """Dataset indices of the next global batch, in stream order."""
+        batch = self._get_next_batch()
+        local = batch["input_ids"][:, 0] - 1
+        return self.acc.gather(local.contiguous()).tolist()
+
+
+def write_config(path: Path, batch_size: int):
+    path.write_text(
+        yaml.safe_dump(
+            {
+                "model_params": {
+                    "model_name": "LlamaForCausalLM",
+                    "config_name": "LlamaConfig",
+                    "hidden_size": 32,
+                    "num_attention_heads": 2,
+                    "num_key_value_heads": 2,
+                    "num_hidden_layers": 1,
+                    "intermediate_size": 64,
+                    "max_position_embeddings": 16,
+                    "tie_word_embeddings": True,
+                },
+                "optimizer": {"name": "adamw", "lr": 1e-3},
+                "scheduler": {"name": "constant", "warmup_steps": 0},
+                "accelerate_config": {"mixed_precision": "no"},
+                "max_steps": 10,
+                "batch_size": batch_size,
+                "log_every": 10,
+                "eval_every": 0,
+                "seed": SEED,
+            }
+        )
+    )
+
+
+def worker(rank, world_size, port, tmp, steps, resume):
+    os.environ.update(
+        {
+            "MASTER_ADDR": "127.0.0.1",
+            "MASTER_PORT": str(port),
+            "RANK": str(rank),
+            "LOCAL_RANK": str(rank),
+            "WORLD_SIZE": str(world_size),
+            "ACCELERATE_USE_CPU": "true",
+        }
+    )
+    tmp = Path(tmp)
+    trainer = IndexTrainer(str(tmp / f"config_{world_size}.yaml"))
+    assert trainer.acc.num_processes == world_size
+
+    report = {}
+    if resume:
+        state = json.loads((tmp / "dataloader_state.json").read_text())
+        trainer.load_dataloader_state_dict(state)
+        report["resumed_samples"] = trainer.dataloader_state_dict()["samples"]
+    report["indices"] = [i for _ in range(steps) for i in trainer.next_indices()]
+    state = trainer.dataloader_state_dict()
+    report["samples"] = state["samples"]
+    if trainer.acc.is_main_process:
+        (tmp / "dataloader_state.json").write_text(json.dumps(state))
+        (tmp / f"report_{world_size}.json").write_text(json.dumps(report))
+    trainer.acc.wait_for_everyone()
+    trainer.acc.end_training()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def launch(tmp, world_size, batch_size, steps, resume) -> dict:
+    write_config(tmp / f"config_{world_size}.yaml", batch_size)
+    mp.spawn(
+        worker,
+        args=(world_size, free_port(), str(tmp), steps, resume),
+        nprocs=world_size,
+    )
+    return json.loads((tmp / f"report_{world_size}.json").read_text())
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        # (world_size, per-process batch size); 6 samples per step, then 4
+        ((2, 3), (1, 4)),
+        ((1, 6), (2, 2)),
+    ],
+)
+def test_resume_on_another_world_size(tmp_path, first, second):
+    permutation = torch.randperm(
+        NUM_SAMPLES, generator=torch.Generator().manual_seed(SEED)
+    ).tolist()
+
+    before = launch(tmp_path, *first, steps=5, resume=False)
+    assert before["samples"] == 30
+    assert sorted(before["indices"]) == sorted(permutation[:30])
+
+    after = launch(tmp_path, *second, steps=3, resume=True)
+    # 30 is not a multiple of the new global batch size (4): the cursor must not be rounded down
+    assert after["resumed_samples"] == 30
+    assert after["indices"] == permutation[30:42]
+    assert after["samples"] == 42
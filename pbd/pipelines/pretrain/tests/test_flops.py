@@ -0,0 +1,48 @@
+import pytest
+
+from pbd.pipelines.pretrain.steps.trainer.flops import (
+    estimate_flops_per_token,
+    mlp_matrix_params,
+)
+from pbd.pipelines.pretrain.steps.trainer.state import ModelConfig
+
+SEQ_LEN = 16
+VOCAB_SIZE = 32
+# q/o and k/v projections of a 32-wide layer, and attention scores over 16 positions
+ATTENTION_PARAMS = 4 * 32 * 32
+ATTENTION_FLOPS = 12 * 32 * SEQ_LEN
+
+
+def model_params(model_name: str, config_name: str) -> ModelConfig:
+    return ModelConfig(
+        model_name=model_name,
+        config_name=config_name,
+        hidden_size=32,
+        num_attention_heads=2,
+        num_key_value_heads=2,
+        num_hidden_layers=1,
+        intermediate_size=64,
+        max_position_embeddings=SEQ_LEN,
+        tie_word_embeddings=True,
+    )
+
+
+@pytest.mark.parametrize(
+    "model_name, config_name, mlp_params",
+    [
+        # gate/up/down projections to intermediate_size
+        ("LlamaForCausalLM", "LlamaConfig", 3 * 32 * 64),
+        # Two matrices to n_inner, which defaults to 4 * hidden_size
+        ("GPT2LMHeadModel", "GPT2Config", 2 * 32 * 128),
+    ],
+)
+def test_flops_per_token_matches_hand_count(model_name, config_name, mlp_params):
+    params = model_params(model_name, config_name)
+    model = params._get_pretrained_model()
+    assert mlp_matrix_params(model) == mlp_params
+
+    flops = estimate_flops_per_token(
+        params, SEQ_LEN, vocab_size=VOCAB_SIZE, mlp_params=mlp_matrix_params(model)
+    )
+    matmul_params = ATTENTION_PARAMS + mlp_params + 32 * VOCAB_SIZE
+    assert flops == 6 * matmul_params + ATTENTION_FLOPS
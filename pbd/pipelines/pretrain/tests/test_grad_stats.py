@@ -0,0 +1,70 @@
+import pytest
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+from pbd.pipelines.pretrain.steps.trainer.grad_stats import GradientStatistics
+
+
+class TinyDecoder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(16, 8)
+        self.layers = torch.nn.ModuleList(torch.nn.Linear(8, 8) for _ in range(2))
+        self.head = torch.nn.Linear(8, 16, bias=False)
+
+    def forward(self, x):
+        hidden = self.embed(x)
+        for layer in self.layers:
+            hidden = torch.tanh(layer(hidden))
+        return self.head(hidden)
+
+
+def backward(model):
+    tokens = torch.randint(0, 16, (4, 6), generator=torch.Generator().manual_seed(0))
+    model(tokens).square().mean().backward()
+
+
+def test_grouped_norms_match_torch():
+    torch.manual_seed(0)
+    model = TinyDecoder()
+    decay = [p for n, p in model.named_parameters() if n.endswith("weight")]
+    no_decay = [p for n, p in model.named_parameters() if n.endswith("bias")]
+    optimizer = torch.optim.AdamW(
+        [{"params": decay, "name": "decay"}, {"params": no_decay, "name": "no_decay"}]
+    )
+    stats = GradientStatistics(model, optimizer)
+    backward(model)
+
+    total = stats.compute()
+    metrics = MetricRunner()
+    stats.collect(metrics)
+
+    groups = {
+        "embed": model.embed.parameters(),
+        "layer_0": model.layers[0].parameters(),
+        "layer_1": model.layers[1].parameters(),
+        "head": model.head.parameters(),
+        "group_decay": decay,
+        "group_no_decay": no_decay,
+    }
+    assert sorted(stats.group_names) == sorted(groups)
+    for name, params in groups.items():
+        expected = torch.nn.utils.get_total_norm([p.grad for p in params])
+        assert metrics.get_avg(f"grad_norm/{name}") == pytest.approx(expected.item())
+    expected = torch.nn.utils.get_total_norm([p.grad for p in model.parameters()])
+    assert total.item() == pytest.approx(expected.item())
+
+
+def test_clipping_matches_clip_grad_norm():
+    torch.manual_seed(0)
+    model, reference = TinyDecoder(), TinyDecoder()
+    reference.load_state_dict(model.state_dict())
+    backward(model)
+    backward(reference)
+
+    total = GradientStatistics(model).compute(max_norm=0.01)
+    expected = torch.nn.utils.clip_grad_norm_(reference.parameters(), max_norm=0.01)
+
+    assert total.item() == pytest.approx(expected.item())
+    for param, ref in zip(model.parameters(), reference.parameters()):
+        torch.testing.assert_close(param.grad, ref.grad)
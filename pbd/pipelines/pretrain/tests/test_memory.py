@@ -0,0 +1,42 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.memory import MB, MemoryCallback
+from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+
+
+def make_trainer(device):
+    return SimpleNamespace(
+        acc=SimpleNamespace(process_index=0, device=torch.device(device)),
+        logger=logging.getLogger(__name__),
+        metrics=MetricRunner(),
+        global_step=1,
+        log_every=1,
+    )
+
+
+def test_host_memory_is_reported():
+    trainer = make_trainer("cpu")
+    callback = MemoryCallback()
+    callback.on_train_start(trainer)
+    callback.on_step_end(trainer)
+
+    assert trainer.metrics.get_avg("memory/rss_mb") > 0
+    assert "memory/device_allocated_mb" not in trainer.metrics.metrics
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="needs CUDA")
+def test_allocator_stats_are_reported():
+    trainer = make_trainer("cuda")
+    callback = MemoryCallback()
+    callback.on_train_start(trainer)
+    block = torch.empty(64 * MB, dtype=torch.uint8, device="cuda")
+    callback.on_step_end(trainer)
+
+    assert trainer.metrics.get_avg("memory/device_allocated_mb") >= 64
+    assert trainer.metrics.get_avg("memory/device_reserved_mb") >= 64
+    assert 0 <= trainer.metrics.get_avg("memory/device_fragmentation") < 1
+    del block
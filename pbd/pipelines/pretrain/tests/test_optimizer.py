@@ -0,0 +1,77 @@
+import pytest
+import torch
+
+from pbd.pipelines.pretrain.steps.trainer import optimizer as optimizer_module
+from pbd.pipelines.pretrain.steps.trainer.optimizer import (
+    build_optimizer,
+    build_param_groups,
+)
+from pbd.pipelines.pretrain.steps.trainer.state import OptimizerConfig
+
+
+class TinyLM(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(16, 8)
+        self.proj = torch.nn.Linear(8, 8)
+        self.norm = torch.nn.LayerNorm(8)
+        self.head = torch.nn.Linear(8, 16, bias=False)
+        self.head.weight = self.embed.weight
+
+
+class UnfusedSGD(torch.optim.SGD):
+    """Accepts `fused=True` but has no fused kernel, like some accelerators."""
+
+    def step(self, closure=None):
+        if self.defaults["fused"]:
+            raise RuntimeError("no fused kernel")
+        return super().step(closure)
+
+
+def group_params(groups: list[dict]) -> dict[str, list[torch.Tensor]]:
+    return {group["name"]: group["params"] for group in groups}
+
+
+def test_param_groups_skip_decay_on_norms_biases_and_embeddings():
+    model = TinyLM()
+    groups = build_param_groups(model, weight_decay=0.1, embedding_weight_decay=0.01)
+    params = group_params(groups)
+
+    assert params["decay"] == [model.proj.weight]
+    assert params["no_decay"] == [model.proj.bias, model.norm.weight, model.norm.bias]
+    # The tied LM head is the embedding table, listed once
+    assert params["embeddings"] == [model.embed.weight]
+    decay = {group["name"]: group["weight_decay"] for group in groups}
+    assert decay == {"decay": 0.1, "no_decay": 0.0, "embeddings": 0.01}
+
+
+def test_frozen_parameters_are_left_out():
+    model = TinyLM()
+    model.norm.requires_grad_(False)
+    params = group_params(build_param_groups(model, weight_decay=0.1))
+
+    assert params["no_decay"] == [model.proj.bias]
+
+
+def test_auto_falls_back_when_the_probe_step_fails(monkeypatch):
+    monkeypatch.setitem(optimizer_module.OPTIMIZERS, "sgd", UnfusedSGD)
+    config = OptimizerConfig(name="sgd", lr=0.1)
+
+    # Without a device the constructor alone accepts the fused flag
+    _, implementation = build_optimizer(TinyLM(), config)
+    assert implementation == "fused"
+
+    optimizer, implementation = build_optimizer(
+        TinyLM(), config, device=torch.device("cpu")
+    )
+    assert implementation == "foreach"
+    assert optimizer.defaults["foreach"]
+
+
+def test_explicit_implementation_does_not_fall_back(monkeypatch):
+    monkeypatch.setitem(optimizer_module.OPTIMIZERS, "sgd", UnfusedSGD)
+    config = OptimizerConfig(name="sgd", lr=0.1, implementation="fused")
+
+    with pytest.raises(RuntimeError, match="No fused implementation") as error:
+        build_optimizer(TinyLM(), config, device=torch.device("cpu"))
+    assert str(error.value.__cause__) == "no fused kernel"
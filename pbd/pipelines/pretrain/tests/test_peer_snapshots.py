@@ -0,0 +1,76 @@
+"""
+Peer-replicated in-memory snapshots, with CPU processes talking over gloo.
+"""
+
+import json
+import os
+import socket
+from pathlib import Path
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from pbd.pipelines.pretrain.steps.checkpoint.replicated import PeerSnapshotStore
+
+WORLD_SIZE = 2
+
+
+def worker(rank, port, tmp):
+    os.environ.update({"MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port)})
+    dist.init_process_group("gloo", rank=rank, world_size=WORLD_SIZE)
+    tmp = Path(tmp)
+    store = PeerSnapshotStore(tmp, run_id="run", peer_offset=1)
+    for step in (5, 10):
+        store.save({"rank": rank, "weight": torch.full((3,), float(rank))}, step)
+    dist.barrier()
+
+    report = {}
+    if rank == 1:
+        # Lost with the node, while rank 0 still holds the peer copy
+        (store.directory / f"own_rank1_of{WORLD_SIZE}_step10.snap").unlink()
+        report["own_before"] = sorted(p.name for p in store.directory.glob("own_*"))
+    dist.barrier()
+
+    step, state = store.restore()
+    report.update(step=step, rank=state["rank"], weight=state["weight"].tolist())
+    report["own_after"] = sorted(p.name for p in store.directory.glob("own_*"))
+    # A checkpoint of step 10 supersedes every snapshot
+    report["after_checkpoint"] = store.restore(min_step=11)
+    (tmp / f"report_{rank}.json").write_text(json.dumps(report))
+    dist.destroy_process_group()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_lost_snapshot_is_restored_from_the_peer_copy(tmp_path):
+    mp.spawn(worker, args=(free_port(), str(tmp_path)), nprocs=WORLD_SIZE)
+    reports = [
+        json.loads((tmp_path / f"report_{rank}.json").read_text())
+        for rank in range(WORLD_SIZE)
+    ]
+
+    assert reports[1]["own_before"] == ["own_rank0_of2_step10.snap"]
+    for rank, report in enumerate(reports):
+        assert report["step"] == 10
+        assert report["rank"] == rank
+        assert report["weight"] == [float(rank)] * 3
+        assert report["after_checkpoint"] is None
+    assert reports[1]["own_after"] == [
+        "own_rank0_of2_step10.snap",
+        "own_rank1_of2_step10.snap",
+    ]
+
+
+def test_snapshots_are_kept_per_run(tmp_path):
+    store = PeerSnapshotStore(tmp_path, run_id="run")
+    store.save({"step": 5}, 5)
+
+    assert PeerSnapshotStore(tmp_path, run_id="other").restore() is None
+    assert store.restore() == (5, {"step": 5})
+    store.clear()
+    assert store.restore() is None
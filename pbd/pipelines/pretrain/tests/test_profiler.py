@@ -0,0 +1,33 @@
+import logging
+import os
+import signal
+from types import SimpleNamespace
+
+import torch
+
+from pbd.pipelines.pretrain.steps.callbacks.profiler import ProfilerCallback
+
+
+def test_signal_triggers_a_trace(tmp_path):
+    trainer = SimpleNamespace(
+        acc=SimpleNamespace(process_index=0, device=torch.device("cpu")),
+        logger=logging.getLogger(__name__),
+        global_step=0,
+    )
+    profiler = ProfilerCallback(output_dir=tmp_path, wait=0, warmup=1, active=2)
+    profiler.on_train_start(trainer)
+    os.kill(os.getpid(), signal.SIGUSR1)
+
+    for step in range(1, 6):
+        trainer.global_step = step
+        profiler.on_step_start(trainer)
+        torch.randn(16, 16) @ torch.randn(16, 16)
+        profiler.on_step_end(trainer)
+    profiler.on_train_end(trainer)
+
+    assert (tmp_path / "profile_step1_rank0.trace.json.gz").stat().st_size > 0
+    assert (
+        "sorted by self_cpu_time_total"
+        in (tmp_path / "profile_step1_rank0.ops.txt").read_text()
+    )
+    assert signal.getsignal(signal.SIGUSR1) is signal.SIG_DFL
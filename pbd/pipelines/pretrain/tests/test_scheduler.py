@@ -0,0 +1,89 @@
+import math
+
+import pytest
+import torch
+
+from pbd.pipelines.pretrain.steps.trainer.scheduler import (
+    _get_cosine_schedule_with_warmup_lr_lambda,
+    build_schedule_table,
+    get_scheduler,
+)
+from pbd.pipelines.pretrain.steps.trainer.state import SchedulerConfig
+
+NUM_STEPS = 20
+WARMUP = 5
+LR = 0.1
+
+
+def make_optimizer() -> torch.optim.Optimizer:
+    return torch.optim.SGD([torch.nn.Parameter(torch.zeros(1))], lr=LR)
+
+
+def advance(scheduler, steps: int):
+    for _ in range(steps):
+        scheduler.optimizer.step()
+        scheduler.step()
+
+
+def closed_form(name: str, step: int, min_ratio: float) -> float:
+    if step < WARMUP:
+        return step / WARMUP
+    progress = (step - WARMUP) / (NUM_STEPS - WARMUP)
+    if name == "cosine":
+        return min_ratio + 0.5 * (1 - min_ratio) * (math.cos(math.pi * progress) + 1)
+    return min_ratio + (1 - min_ratio) * (1 - progress)
+
+
+@pytest.mark.parametrize("name", ["cosine", "linear"])
+def test_table_matches_closed_form_warmup_and_decay(name):
+    config = SchedulerConfig(name=name, warmup_steps=WARMUP, min_ratio=0.1)
+    table = build_schedule_table(config, NUM_STEPS)
+
+    assert len(table) == NUM_STEPS + 1
+    for step, factor in enumerate(table):
+        assert factor == pytest.approx(closed_form(name, step, 0.1))
+
+
+@pytest.mark.parametrize("theta, num_cycles", [(1.0, 1.0), (2.0, 0.5)])
+def test_cosine_table_matches_the_legacy_lambda(theta, num_cycles):
+    config = SchedulerConfig(
+        name="cosine",
+        warmup_steps=WARMUP,
+        min_ratio=0.1,
+        theta=theta,
+        num_cycles=num_cycles,
+    )
+    table = build_schedule_table(config, NUM_STEPS)
+
+    for step, factor in enumerate(table):
+        expected = _get_cosine_schedule_with_warmup_lr_lambda(
+            step,
+            num_warmup_steps=WARMUP,
+            num_training_steps=NUM_STEPS,
+            num_cycles=num_cycles,
+            min_ratio=0.1,
+            theta=theta,
+        )
+        assert factor == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("saved_steps_per_update, steps_per_update", [(1, 1), (2, 1)])
+def test_state_dict_round_trip_continues_mid_schedule(
+    saved_steps_per_update, steps_per_update
+):
+    config = SchedulerConfig(name="cosine", warmup_steps=WARMUP)
+    reference = get_scheduler(
+        make_optimizer(), config, NUM_STEPS, saved_steps_per_update
+    )
+    advance(reference, 8 * saved_steps_per_update)
+
+    resumed = get_scheduler(make_optimizer(), config, NUM_STEPS, steps_per_update)
+    resumed.load_state_dict(reference.state_dict())
+
+    # Same optimizer update, counted in the new number of scheduler steps
+    assert resumed.last_epoch == 8 * steps_per_update
+    for _ in range(NUM_STEPS - 8):
+        advance(reference, saved_steps_per_update)
+        advance(resumed, steps_per_update)
+        assert resumed.get_last_lr() == reference.get_last_lr()
+        assert resumed.optimizer.param_groups[0]["lr"] == reference.get_last_lr()[0]
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+import torch
+
+from pbd.pipelines.pretrain.steps.checkpoint.sharded import (
+    ShardedCheckpointReader,
+    build_shard,
+    clear_checkpoint,
+    is_sharded_checkpoint,
+    write_shard,
+)
+
+
+def model_state() -> dict:
+    generator = torch.Generator().manual_seed(0)
+    return {
+        "model_state_dict": {
+            f"layer_{i}.weight": torch.randn(8, 8, generator=generator)
+            for i in range(4)
+        },
+        "global_step": 10,
+    }
+
+
+def test_index_is_published_after_every_shard(tmp_path):
+    state = model_state()
+    rank_0 = threading.Thread(
+        target=write_shard,
+        args=(build_shard(state, rank=0, world_size=2), tmp_path),
+        kwargs={"poll_interval": 0.01},
+    )
+    rank_0.start()
+    rank_0.join(timeout=0.2)
+    # Rank 0 is done with its own shard but waits for rank 1's
+    assert rank_0.is_alive()
+    assert not is_sharded_checkpoint(tmp_path)
+
+    write_shard(build_shard(state, rank=1, world_size=2), tmp_path)
+    rank_0.join()
+    assert is_sharded_checkpoint(tmp_path)
+    reader = ShardedCheckpointReader(tmp_path)
+    assert torch.equal(
+        reader.load("model_state_dict")["layer_0.weight"],
+        state["model_state_dict"]["layer_0.weight"],
+    )
+
+
+def test_index_is_not_published_without_every_shard(tmp_path):
+    shard = build_shard(model_state(), rank=0, world_size=2)
+    with pytest.raises(TimeoutError):
+        write_shard(shard, tmp_path, timeout=0.05, poll_interval=0.01)
+    assert not is_sharded_checkpoint(tmp_path)
+
+
+def test_clear_removes_stale_shards(tmp_path):
+    state = model_state()
+    for rank in (1, 0):
+        write_shard(build_shard(state, rank=rank, world_size=2), tmp_path)
+
+    clear_checkpoint(tmp_path)
+    assert not is_sharded_checkpoint(tmp_path)
+    assert not list(tmp_path.glob("*.safetensors"))
+
+    write_shard(build_shard(state), tmp_path)
+    assert [p.name for p in tmp_path.glob("*.safetensors")] == [
+        "shard-00000-of-00001.safetensors"
+    ]
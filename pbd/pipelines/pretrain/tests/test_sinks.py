@@ -0,0 +1,69 @@
+import json
+import time
+
+from pbd.pipelines.pretrain.steps.callbacks.sinks import (
+    BufferedMetricLogger,
+    JsonlFileSink,
+)
+
+
+class RecordingSink(JsonlFileSink):
+    def __init__(self, path):
+        super().__init__(path)
+        self.batches = []
+        self.closed = False
+
+    def write(self, rows):
+        self.batches.append(len(rows))
+        super().write(rows)
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+def read_rows(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_rows_are_written_in_one_batch_on_close(tmp_path):
+    sink = RecordingSink(tmp_path / "metrics.jsonl")
+    logger = BufferedMetricLogger(sink, flush_interval=3600, capacity=100)
+    for step in range(10):
+        logger.log(step, {"loss": step / 10})
+    assert sink.batches == []
+
+    logger.close()
+    assert sink.batches == [10]
+    assert sink.closed
+    assert not logger._thread.is_alive()
+    assert read_rows(sink.path) == [
+        {"step": step, "loss": step / 10} for step in range(10)
+    ]
+
+
+def test_half_full_buffer_wakes_the_flush_thread(tmp_path):
+    sink = RecordingSink(tmp_path / "metrics.jsonl")
+    logger = BufferedMetricLogger(sink, flush_interval=3600, capacity=4)
+    logger.log(0, {"loss": 1.0})
+    logger.log(1, {"loss": 2.0})
+    deadline = time.monotonic() + 10
+    while not sink.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sink.batches == [2]
+    logger.close()
+    assert [row["step"] for row in read_rows(sink.path)] == [0, 1]
+
+
+def test_full_buffer_drops_the_oldest_rows(tmp_path):
+    sink = RecordingSink(tmp_path / "metrics.jsonl")
+    logger = BufferedMetricLogger(sink, flush_interval=3600, capacity=2)
+    # Stop the flush thread so the buffer fills up
+    logger._stop.set()
+    logger._wakeup.set()
+    logger._thread.join()
+    for step in range(5):
+        logger.log(step, {"loss": 0.0})
+    logger.close()
+    assert logger.dropped == 3
+    assert [row["step"] for row in read_rows(sink.path)] == [3, 4]
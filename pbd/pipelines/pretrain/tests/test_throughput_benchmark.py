@@ -0,0 +1,39 @@
+import json
+import sys
+
+import pytest
+
+from pbd.pipelines.pretrain.benchmarks import throughput
+
+CASE = {"batch_size": 4, "seq_len": 128, "collation": "padded", "num_workers": 0}
+
+
+@pytest.mark.parametrize("tokens_per_sec, regressed", [(850, True), (950, False)])
+def test_baseline_regression_sets_exit_code(
+    tmp_path, monkeypatch, tokens_per_sec, regressed
+):
+    monkeypatch.setattr(
+        throughput,
+        "run_isolated",
+        lambda case, device: {"case": case, "tokens_per_sec": tokens_per_sec},
+    )
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(
+        json.dumps({"results": [{"case": CASE, "tokens_per_sec": 1000}]})
+    )
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["throughput", "--batch-sizes", "4", "--seq-lens", "128"]
+        + ["--collation", "padded", "--num-workers", "0"]
+        + ["--output", str(tmp_path / "results.json"), "--baseline", str(baseline)],
+    )
+
+    if regressed:
+        with pytest.raises(SystemExit) as exit_info:
+            throughput.main()
+        assert exit_info.value.code == 1
+    else:
+        throughput.main()
+    results = json.loads((tmp_path / "results.json").read_text())["results"]
+    assert [r["tokens_per_sec"] for r in results] == [tokens_per_sec]
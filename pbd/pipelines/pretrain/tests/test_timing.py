@@ -0,0 +1,44 @@
+import pytest
+
+from pbd.pipelines.pretrain.steps.callbacks.metrics import MetricRunner
+from pbd.pipelines.pretrain.steps.trainer import timing
+from pbd.pipelines.pretrain.steps.trainer.timing import StepTimer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_phase_percentiles_separate_slow_steps(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(timing.time, "perf_counter", clock)
+    timer = StepTimer(MetricRunner(), device="cpu")
+
+    for step in range(20):
+        with timer.phase("forward"):
+            clock.now += 0.1 if step in (7, 13) else 0.01
+        # Two micro-batches, summed within the step
+        for _ in range(2):
+            with timer.phase("backward"):
+                clock.now += 0.005
+        timer.step()
+    timer.collect()
+
+    summary = timer.summary(quantiles=(50, 95))
+    assert summary["forward"] == pytest.approx([0.01, 0.1])
+    assert summary["backward"] == pytest.approx([0.01, 0.01])
+
+
+def test_disabled_timer_records_nothing():
+    metrics = MetricRunner()
+    timer = StepTimer(metrics, device="cpu", enabled=False)
+    with timer.phase("forward"):
+        pass
+    timer.step()
+    timer.collect()
+
+    assert timer.summary() == {}
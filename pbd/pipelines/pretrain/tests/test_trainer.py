@@ -0,0 +1,340 @@
+"""
+Single-process training runs on CPU with a tiny Llama model and random tokens.
+"""
+
+import copy
+import json
+import math
+
+import pytest
+import torch
+import yaml
+from torch.utils.data import DataLoader, Dataset
+
+from pbd.pipelines.pretrain.steps.callbacks.base import Callback
+from pbd.pipelines.pretrain.steps.callbacks.checkpoint import CheckpointCallback
+from pbd.pipelines.pretrain.steps.callbacks.dispatch import CallbackDispatcher
+from pbd.pipelines.pretrain.steps.callbacks.prometheus import PrometheusCallback
+from pbd.pipelines.pretrain.steps.callbacks.tracking import WandbCallback
+from pbd.pipelines.pretrain.steps.prepare_data.data_collator import (
+    DataCollatorForLanguageModeling,
+)
+from pbd.pipelines.pretrain.steps.prepare_data.sampler import StatefulRandomSampler
+from pbd.pipelines.pretrain.steps.trainer.compile import compile_counters
+from pbd.pipelines.pretrain.steps.trainer.trainer import PretrainTrainer
+
+VOCAB_SIZE = 32
+
+
+class TokenDataset(Dataset):
+    def __init__(self, num_samples: int = 32, seq_len: int = 8):
+        generator = torch.Generator().manual_seed(0)
+        self.tokens = torch.randint(
+            1, VOCAB_SIZE, (num_samples, seq_len), generator=generator
+        )
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, index):
+        return {"input_ids": self.tokens[index].tolist()}
+
+
+class TinyTrainer(PretrainTrainer):
+    def _load_train_dataloader(self):
+        return DataLoader(
+            TokenDataset(),
+            batch_size=self.trainer_state.batch_size,
+            collate_fn=DataCollatorForLanguageModeling(pad_token_id=0),
+        )
+
+    def _load_eval_dataloader(self):
+        return DataLoader(
+            TokenDataset(num_samples=12),
+            batch_size=self.trainer_state.batch_size,
+            collate_fn=DataCollatorForLanguageModeling(pad_token_id=0),
+        )
+
+
+class NaNLossTrainer(TinyTrainer):
+    def forward(self, batch):
+        loss, tokens = super().forward(batch)
+        return loss * float("nan"), tokens
+
+
+class LateNaNLossTrainer(TinyTrainer):
+    def forward(self, batch):
+        loss, tokens = super().forward(batch)
+        return (loss * float("nan") if self.global_step >= 1 else loss), tokens
+
+
+class ShuffledTrainer(TinyTrainer):
+    def _load_train_dataloader(self):
+        dataset = TokenDataset()
+        return DataLoader(
+            dataset,
+            batch_size=self.trainer_state.batch_size,
+            sampler=StatefulRandomSampler(dataset, seed=1),
+            collate_fn=DataCollatorForLanguageModeling(pad_token_id=0),
+        )
+
+    def __init__(self, *args, **kwargs):
+        self.seen_rows = []
+        super().__init__(*args, **kwargs)
+
+    def forward(self, batch):
+        self.seen_rows.extend(map(tuple, batch["input_ids"].tolist()))
+        return super().forward(batch)
+
+
+class FailingTrainer(TinyTrainer):
+    def forward(self, batch):
+        if self.global_step == 3:
+            raise RuntimeError("boom")
+        return super().forward(batch)
+
+
+class StepRecorder(Callback):
+    async_safe = True
+
+    def __init__(self):
+        self.steps = []
+
+    def on_step_end(self, trainer):
+        self.steps.append((trainer.global_step, trainer.metrics is not None))
+
+
+def make_trainer(tmp_path, trainer_class=TinyTrainer, callbacks=None, **overrides):
+    config = {
+        "model_params": {
+            "model_name": "LlamaForCausalLM",
+            "config_name": "LlamaConfig",
+            "hidden_size": 32,
+            "num_attention_heads": 2,
+            "num_key_value_heads": 2,
+            "num_hidden_layers": 1,
+            "intermediate_size": 64,
+            "max_position_embeddings": 16,
+            "tie_word_embeddings": True,
+        },
+        "optimizer": {"name": "adamw", "lr": 1e-3},
+        "scheduler": {"name": "constant", "warmup_steps": 0},
+        "accelerate_config": {"mixed_precision": "no"},
+        "max_steps": 4,
+        "batch_size": 4,
+        "log_every": 2,
+        "eval_every": 0,
+    }
+    config.update(overrides)
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return trainer_class(str(path), callbacks=callbacks)
+
+
+def test_sync_free_nan_loss_leaves_parameters_unchanged(tmp_path):
+    trainer = make_trainer(
+        tmp_path, NaNLossTrainer, sync_free_metrics=True, max_steps=1, log_every=10
+    )
+    before = [p.detach().clone() for p in trainer.model.parameters()]
+    trainer.fit()
+
+    for param, original in zip(trainer.model.parameters(), before):
+        assert torch.equal(param.detach(), original)
+    assert trainer.num_nan_losses == 0
+    assert trainer._confirm_loss_validity()
+    assert trainer.num_nan_losses == 1
+
+
+class FirstStepRecorder(Callback):
+    def __init__(self):
+        self.params = None
+        self.optimizer_state = None
+
+    def on_step_end(self, trainer):
+        if trainer.global_step == 1:
+            self.params = [p.detach().clone() for p in trainer.model.parameters()]
+            self.optimizer_state = copy.deepcopy(trainer.optimizer.state_dict())
+
+
+def test_sync_free_nan_loss_after_finite_steps_skips_the_update(tmp_path):
+    recorder = FirstStepRecorder()
+    trainer = make_trainer(
+        tmp_path,
+        LateNaNLossTrainer,
+        callbacks=[recorder],
+        sync_free_metrics=True,
+        max_steps=3,
+        log_every=10,
+        optimizer={"name": "adamw", "lr": 1e-3, "weight_decay": 0.1},
+    )
+    trainer.fit()
+
+    # A zeroed gradient would still move the parameters through momentum and
+    # weight decay, and advance Adam's step count
+    assert trainer.optimizer.optimizer.defaults["fused"]
+    for param, original in zip(trainer.model.parameters(), recorder.params):
+        assert torch.equal(param.detach(), original)
+    state = trainer.optimizer.state_dict()["state"]
+    for index, original in recorder.optimizer_state["state"].items():
+        for name, value in original.items():
+            assert torch.equal(state[index][name], value)
+    assert trainer._confirm_loss_validity()
+    assert trainer.num_nan_losses == 2
+
+
+def test_prefetched_run_resumes_where_it_stopped(tmp_path):
+    reference = make_trainer(tmp_path, ShuffledTrainer, max_steps=6)
+    reference.fit()
+    first = make_trainer(tmp_path, ShuffledTrainer, max_steps=3, prefetch_batches=2)
+    first.fit()
+
+    resumed = make_trainer(tmp_path, ShuffledTrainer, max_steps=3, prefetch_batches=2)
+    # Nothing may iterate the sampler before it is repositioned
+    assert resumed.prefetcher is None
+    assert resumed.train_sampler.state_dict()["epoch"] == 0
+    resumed.load_dataloader_state_dict(first.dataloader_state_dict())
+    resumed.fit()
+
+    assert first.seen_rows + resumed.seen_rows == reference.seen_rows
+
+
+def test_fresh_run_discards_snapshots_of_an_earlier_one(tmp_path):
+    fault_tolerance = {
+        "enabled": True,
+        "snapshot_every": 2,
+        "directory": str(tmp_path / "snapshots"),
+    }
+    make_trainer(tmp_path, fault_tolerance=fault_tolerance).fit()
+    resumed = make_trainer(tmp_path, fault_tolerance=fault_tolerance)
+    assert resumed.resume()
+    assert resumed.global_step == 4
+
+    # Stops before taking its first snapshot
+    make_trainer(tmp_path, fault_tolerance=fault_tolerance, max_steps=1).fit()
+    assert not make_trainer(tmp_path, fault_tolerance=fault_tolerance).resume()
+
+
+def test_checkpoint_reports_the_encoding_of_each_moment(tmp_path):
+    trainer = make_trainer(tmp_path, checkpoint={"optimizer_encoding": "int8"})
+    trainer.fit()
+    trainer.checkpoint_state_dict()
+
+    num_params = len(trainer.optimizer.state_dict()["state"])
+    for key in ("exp_avg/int8", "exp_avg_sq/bf16"):
+        name = f"checkpoint/optimizer_tensors/{key}"
+        assert trainer.metrics.get_avg(name) == num_params
+
+
+def test_prometheus_exports_the_log_window(tmp_path):
+    exporter = PrometheusCallback(port=0, host="127.0.0.1")
+    trainer = make_trainer(tmp_path, callbacks=[exporter], gradient_clip_norm=1.0)
+    trainer.fit()
+
+    exposition = exporter.registry.render()
+    assert "pbd_train_grad_norm " in exposition
+    assert "pbd_train_tokens_per_second_global " in exposition
+    assert 'pbd_train_phase_seconds{phase="forward",quantile="0.5"}' in exposition
+
+
+def test_prometheus_endpoint_comes_from_the_config(tmp_path):
+    exporter = PrometheusCallback()
+    trainer = make_trainer(
+        tmp_path, callbacks=[exporter], prometheus={"host": "127.0.0.1", "port": 0}
+    )
+    trainer.fit()
+
+    assert (exporter.host, exporter.port) == ("127.0.0.1", 0)
+    assert "pbd_train_step 4.0" in exporter.registry.render()
+
+
+def test_capped_evaluation_releases_the_val_loader(tmp_path):
+    trainer = make_trainer(tmp_path, eval_max_batches=1)
+    gradient_state = trainer.acc.gradient_state
+    references = len(gradient_state.dataloader_references)
+
+    for _ in range(2):
+        assert math.isfinite(trainer.evaluate())
+        assert not gradient_state.in_dataloader
+        assert len(gradient_state.dataloader_references) == references
+
+
+def test_anomaly_guard_checks_every_grad_norm(tmp_path):
+    trainer = make_trainer(
+        tmp_path,
+        gradient_stats={"enabled": False},
+        anomaly={"enabled": True},
+    )
+    trainer.fit()
+
+    assert trainer.grad_stats is not None
+    assert trainer.anomaly_guard.grad_norm_stats.count.item() == trainer.max_steps
+
+
+def test_async_callbacks_get_metrics_at_log_boundaries(tmp_path):
+    trainer = make_trainer(tmp_path)
+    # Registered after the dispatcher was built
+    recorder = StepRecorder()
+    trainer.callbacks.append(recorder)
+    trainer.fit()
+
+    assert recorder.steps == [(1, False), (2, True), (3, False), (4, True)]
+
+
+def test_bundled_callbacks_register_no_step_start_hook(tmp_path):
+    dispatcher = CallbackDispatcher(
+        [WandbCallback(), CheckpointCallback(str(tmp_path))]
+    )
+
+    assert "on_step_start" not in dispatcher.inline
+    assert "on_step_start" not in dispatcher.deferred
+    dispatcher.close()
+
+
+@pytest.mark.parametrize("trainer_class", [TinyTrainer, FailingTrainer])
+def test_wandb_callback_flushes_to_file_sink_on_shutdown(tmp_path, trainer_class):
+    log_file = tmp_path / "metrics.jsonl"
+    callback = WandbCallback()
+    trainer = make_trainer(
+        tmp_path,
+        trainer_class,
+        callbacks=[callback],
+        wandb_config={
+            "project": "test",
+            "sink": "file",
+            "log_file": str(log_file),
+            "flush_interval": 3600,
+        },
+    )
+    if trainer_class is FailingTrainer:
+        with pytest.raises(RuntimeError, match="boom"):
+            trainer.fit()
+    else:
+        trainer.fit()
+
+    rows = [json.loads(line) for line in log_file.read_text().splitlines()]
+    expected_steps = [2] if trainer_class is FailingTrainer else [2, 4]
+    assert [row["step"] for row in rows] == expected_steps
+    assert all(row["train/global_step"] == row["step"] for row in rows)
+    assert all(math.isfinite(row["loss"]) for row in rows)
+    # Closed at the end of training, file included
+    assert callback.buffer is None
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_compile_warmup_covers_other_sequence_lengths(tmp_path, packed):
+    trainer = make_trainer(
+        tmp_path,
+        packed_sequences=packed,
+        compile_config={"enabled": True, "backend": "aot_eager"},
+    )
+    collator = DataCollatorForLanguageModeling(
+        pad_token_id=0, padding_free=packed, return_flash_attn_kwargs=packed
+    )
+    for length in (5, 9, 12):
+        batch = collator(
+            [{"input_ids": list(range(1, length + 1))}, {"input_ids": [1, 2, 3]}] * 2
+        )
+        loss, _ = trainer.forward(batch)
+        trainer.acc.backward(loss)
+
+    assert compile_counters()["graphs"] == trainer._compiled_graphs